@@ -0,0 +1,46 @@
+"""
+JWT authentication for WebSocket connections.
+
+Browsers cannot set an Authorization header on a WebSocket handshake, so the
+access token is read from the ``token`` query parameter
+(``ws://host/ws/notifications/?token=<access>``) and validated with the same
+simplejwt settings as the REST API.
+
+Session cookies are deliberately not accepted: the browser sends them with a
+handshake started by any page, so a cookie-authenticated socket could be
+opened cross-site. config.asgi also rejects foreign ``Origin`` headers.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Sets ``scope['user']`` from a ``?token=`` access token (anonymous without one)."""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        query = parse_qs(scope.get('query_string', b'').decode())
+        token = query.get('token')
+        scope['user'] = await get_user_for_token(token[0]) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """JWT-only authentication for WebSocket routes."""
+    return JWTAuthMiddleware(inner)
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:10
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# Trigram index on UPPER(username), the expression icontains compares, so plan
+# search by a fragment of the owner's username (a joined contains field, see
+# config.search) is an index scan of the users table.
+# pg_trgm is created by projects.0006_project_search_index.
+# PostgreSQL only; other backends fall back to icontains (config.search).
+
+
+def search_indexes():
+    yield GinIndex(
+        OpClass(Upper("username"), name="gin_trgm_ops"),
+        name="accounts_user_username_trgm",
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("accounts", "User")
+    for index in search_indexes():
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("accounts", "User")
+    for index in search_indexes():
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_user_profile_fields"),
+        ("projects", "0006_project_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,236 @@
+"""
+Replay a weighted mix of API endpoints in-process and report latency/query stats.
+
+Usage:
+    python manage.py bench_api --requests 2000 --output bench.json
+    python manage.py bench_api --user load_user000123 --baseline bench.json
+    python manage.py bench_api --mix my_mix.json
+
+Requests go through the full middleware/DRF stack via the test client, so the
+numbers include serialization and permission checks but no network. The JSON
+report holds p50/p95/p99 latency and query counts per endpoint; --baseline
+prints the change against an earlier report.
+"""
+import json
+import math
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.middleware import QueryRecorder
+from hr.models import Plan
+from projects.models import Project
+from tasks.models import Task
+
+User = get_user_model()
+
+# (name, path, weight). {task}, {project}, {plan} and {user} are filled with random existing ids.
+DEFAULT_MIX = [
+    ('tasks-list', '/api/tasks/', 20),
+    ('tasks-detail', '/api/tasks/{task}/', 10),
+    ('projects-list', '/api/projects/', 8),
+    ('projects-statistics', '/api/projects/{project}/statistics/', 4),
+    ('notifications-list', '/api/notifications/', 10),
+    ('notifications-unread-count', '/api/notifications/unread_count/', 15),
+    ('attendance-list', '/api/hr/attendances/', 8),
+    ('attendance-today', '/api/hr/attendances/today/', 6),
+    ('attendance-stats', '/api/hr/attendances/stats/', 3),
+    ('departments-list', '/api/hr/departments/', 3),
+    ('employees-list', '/api/hr/employees/', 3),
+    ('plans-list', '/api/hr/plans/', 4),
+    ('plans-detail', '/api/hr/plans/{plan}/', 2),
+    ('leave-requests-list', '/api/hr/leave-requests/', 2),
+    ('crm-pipeline', '/api/crm/customers/pipeline/', 2),
+]
+
+ID_SOURCES = {
+    'task': Task,
+    'project': Project,
+    'plan': Plan,
+    'user': User,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, queries, statuses):
+    latencies = sorted(latencies)
+    queries = sorted(queries)
+    return {
+        'requests': len(latencies),
+        'status_codes': dict(sorted(statuses.items())),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            'max': round(latencies[-1], 2) if latencies else 0,
+        },
+        'queries': {
+            'p50': percentile(queries, 50),
+            'p95': percentile(queries, 95),
+            'max': queries[-1] if queries else 0,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark a weighted mix of API endpoints and report p50/p95/p99 latency and query counts as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Measured requests. Default: 1000.')
+        parser.add_argument('--warmup', type=int, default=50, help='Unmeasured warm-up requests. Default: 50.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the request sequence. Default: 42.')
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Username to authenticate as. Default: first active superuser.',
+        )
+        parser.add_argument(
+            '--mix',
+            type=str,
+            help='JSON file with a list of {"name", "path", "weight"} entries replacing the default mix.',
+        )
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--baseline', type=str, help='Earlier JSON report to compare against.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        user = self.get_user(options.get('user'))
+        mix = self.load_mix(options.get('mix'))
+        ids = self.load_ids(mix)
+
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        client = APIClient(HTTP_HOST=host.lstrip('.'))
+        client.force_authenticate(user)
+
+        names = [entry[0] for entry in mix]
+        weights = [entry[2] for entry in mix]
+        paths = {entry[0]: entry[1] for entry in mix}
+
+        latencies = defaultdict(list)
+        query_counts = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+
+        total = options['warmup'] + options['requests']
+        started = time.monotonic()
+        for index in range(total):
+            name = rng.choices(names, weights=weights)[0]
+            path = paths[name].format(**{key: rng.choice(values) for key, values in ids.items()})
+
+            recorder = QueryRecorder()
+            request_started = time.perf_counter()
+            response = recorder.record(client.get, path)
+            elapsed_ms = (time.perf_counter() - request_started) * 1000
+
+            if index < options['warmup']:
+                continue
+            latencies[name].append(elapsed_ms)
+            query_counts[name].append(recorder.count)
+            statuses[name][str(response.status_code)] += 1
+        wall_seconds = time.monotonic() - started
+
+        all_latencies = [value for values in latencies.values() for value in values]
+        all_queries = [value for values in query_counts.values() for value in values]
+        all_statuses = defaultdict(int)
+        for codes in statuses.values():
+            for code, count in codes.items():
+                all_statuses[code] += count
+
+        report = {
+            'meta': {
+                'generated_at': timezone.now().isoformat(),
+                'user': user.username,
+                'role': user.role,
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'database': connection.vendor,
+                'wall_seconds': round(wall_seconds, 2),
+            },
+            'overall': summarize(all_latencies, all_queries, all_statuses),
+            'endpoints': {
+                name: summarize(latencies[name], query_counts[name], statuses[name])
+                for name in names if latencies[name]
+            },
+        }
+
+        output = json.dumps(report, indent=2)
+        if options.get('output'):
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+        if options.get('baseline'):
+            self.print_comparison(report, options['baseline'])
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'User "{username}" not found')
+            return user
+        user = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if user is None:
+            raise CommandError('No active superuser found; pass --user')
+        return user
+
+    def load_mix(self, path):
+        if not path:
+            return DEFAULT_MIX
+        try:
+            with open(path) as handle:
+                entries = json.load(handle)
+            return [(entry['name'], entry['path'], entry.get('weight', 1)) for entry in entries]
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            raise CommandError(f'Invalid mix file {path}: {exc}')
+
+    def load_ids(self, mix):
+        """Sample existing ids for every placeholder the mix uses."""
+        ids = {}
+        for key, model in ID_SOURCES.items():
+            if not any(f'{{{key}}}' in entry[1] for entry in mix):
+                continue
+            values = list(model.objects.order_by('?').values_list('id', flat=True)[:1000])
+            if not values:
+                raise CommandError(f'No {model.__name__} rows to fill {{{key}}}; generate a dataset first')
+            ids[key] = values
+        return ids
+
+    def print_comparison(self, report, baseline_path):
+        try:
+            with open(baseline_path) as handle:
+                baseline = json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Invalid baseline {baseline_path}: {exc}')
+
+        self.stderr.write(f'{"endpoint":<28}{"p95 ms":>32}{"queries p50":>16}')
+        rows = [('overall', report['overall'], baseline.get('overall'))]
+        rows += [
+            (name, stats, baseline.get('endpoints', {}).get(name))
+            for name, stats in report['endpoints'].items()
+        ]
+        for name, current, previous in rows:
+            if not previous:
+                self.stderr.write(f'{name:<28}{"(new)":>32}')
+                continue
+            p95 = current['latency_ms']['p95']
+            old_p95 = previous['latency_ms']['p95']
+            change = f'{(p95 - old_p95) / old_p95 * 100:+.0f}%' if old_p95 else 'n/a'
+            queries = f'{previous["queries"]["p50"]} -> {current["queries"]["p50"]}'
+            self.stderr.write(f'{name:<28}{f"{old_p95} -> {p95} ({change})":>32}{queries:>16}')
@@ -0,0 +1,388 @@
+"""
+Generate a production-sized synthetic organisation for load and benchmark runs.
+
+Usage:
+    python manage.py generate_load_dataset
+    python manage.py generate_load_dataset --users 500 --tasks 5000 --attendance 100000
+    python manage.py generate_load_dataset --clear
+
+Generated users get an unusable password unless --password is given; the
+benchmark commands authenticate them with tokens instead. All rows are written with bulk_create in chunks, so model save() hooks and
+signals do not run. Generated rows are marked with --prefix and can be removed
+again with --clear.
+"""
+import math
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from config.cache import invalidate_tags
+from hr.hierarchy import rebuild_employee_hierarchy
+from hr.models import Attendance, Department, Employee
+from hr.services import rebuild_attendance_summaries
+from notifications.models import Notification
+from projects.models import Project
+from tasks.access import refresh_task_access
+from tasks.models import Task
+
+User = get_user_model()
+
+ROLE_WEIGHTS = [
+    ('manager', 2),
+    ('team_lead', 6),
+    ('staff', 72),
+    ('freelancer', 20),
+]
+TASK_STATUS_WEIGHTS = [
+    ('new', 10),
+    ('assigned', 15),
+    ('working', 25),
+    ('review_pending', 10),
+    ('approved', 10),
+    ('rejected', 5),
+    ('completed', 25),
+]
+ATTENDANCE_STATUS_WEIGHTS = [
+    ('present', 80),
+    ('late', 8),
+    ('wfh', 7),
+    ('half_day', 2),
+    ('absent', 3),
+]
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _weighted(rng, weights):
+    values, counts = zip(*weights)
+    return rng.choices(values, weights=counts)[0]
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate a synthetic organisation (users, departments, tasks, attendance, notifications).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000, help='Number of users. Default: 5000.')
+        parser.add_argument('--departments', type=int, default=200, help='Number of departments. Default: 200.')
+        parser.add_argument('--projects', type=int, default=500, help='Number of projects. Default: 500.')
+        parser.add_argument('--tasks', type=int, default=50000, help='Number of tasks. Default: 50000.')
+        parser.add_argument(
+            '--attendance',
+            type=int,
+            default=2000000,
+            help='Number of attendance rows, spread over past working days. Default: 2000000.',
+        )
+        parser.add_argument(
+            '--notifications',
+            type=int,
+            default=500000,
+            help='Number of notifications. Default: 500000.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk_create. Default: 5000.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible datasets. Default: 42.')
+        parser.add_argument(
+            '--prefix',
+            type=str,
+            default='load',
+            help='Marker used in usernames, department/project names and task titles. Default: load.',
+        )
+        parser.add_argument(
+            '--password',
+            type=str,
+            default=None,
+            help='Password for every generated user, including {prefix}_admin. Default: none (password login disabled).',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete a previously generated dataset with the same prefix and exit.',
+        )
+
+    def handle(self, *args, **options):
+        self.prefix = options['prefix']
+        self.verbosity = options['verbosity']
+        self.chunk_size = max(1, options['chunk_size'])
+        self.rng = random.Random(options['seed'])
+
+        if options['clear']:
+            self.clear_dataset()
+            return
+
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            self.stderr.write(self.style.ERROR(
+                f'A dataset with prefix "{self.prefix}" already exists. Run with --clear first or use another --prefix.'
+            ))
+            return
+
+        if options['users'] < 1:
+            self.stderr.write(self.style.ERROR('--users must be at least 1'))
+            return
+
+        started = time.monotonic()
+        users = self.create_users(options['users'], options['password'])
+        departments = self.create_departments(options['departments'], users)
+        self.create_employees(users, departments)
+        projects = self.create_projects(options['projects'], users, departments)
+        task_ids = self.create_tasks(options['tasks'], users, projects)
+        self.create_attendance(options['attendance'], users)
+        self.create_notifications(options['notifications'], users, task_ids)
+
+        # bulk_create bypasses the signals that keep cached aggregates fresh
+        invalidate_tags('hr.department_employee_counts')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Load dataset "{self.prefix}" generated in {time.monotonic() - started:.1f}s '
+            f'(superuser: {self.prefix}_admin)'
+        ))
+
+    def bulk_insert(self, model, rows, label):
+        """bulk_create ``rows`` (any iterable) in chunks, reporting throughput."""
+        started = time.monotonic()
+        total = 0
+        for chunk in _chunked(rows, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+            total += len(chunk)
+            if self.verbosity >= 2:
+                self.stdout.write(f'  {label}: {total}')
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(f'Created {total} {label} in {elapsed:.1f}s ({rate:.0f} rows/s)')
+
+    def clear_dataset(self):
+        started = time.monotonic()
+        marker = f'[{self.prefix}]'
+        # Projects cascade to tasks, users cascade to employees, attendance and notifications
+        Project.objects.filter(name__startswith=marker).delete()
+        Department.objects.filter(name__startswith=marker).delete()
+        deleted, _ = User.objects.filter(username__startswith=f'{self.prefix}_').delete()
+        invalidate_tags('hr.department_employee_counts')
+        self.stdout.write(self.style.SUCCESS(
+            f'Cleared dataset "{self.prefix}" ({deleted} rows via users) in {time.monotonic() - started:.1f}s'
+        ))
+
+    def create_users(self, count, raw_password=None):
+        # Hashing once keeps 5k users from spending minutes in PBKDF2; None gives an unusable password
+        password = make_password(raw_password)
+
+        def rows():
+            yield User(
+                username=f'{self.prefix}_admin',
+                email=f'{self.prefix}_admin@example.com',
+                password=password,
+                role='admin',
+                is_staff=True,
+                is_superuser=True,
+            )
+            for index in range(1, count):
+                yield User(
+                    username=f'{self.prefix}_user{index:06d}',
+                    email=f'{self.prefix}_user{index:06d}@example.com',
+                    first_name='Load',
+                    last_name=f'User {index}',
+                    password=password,
+                    role=_weighted(self.rng, ROLE_WEIGHTS),
+                )
+
+        self.bulk_insert(User, rows(), 'users')
+        # Re-read so primary keys are available on every database backend
+        return list(User.objects.filter(username__startswith=f'{self.prefix}_').only('id', 'role').order_by('id'))
+
+    def create_departments(self, count, users):
+        managers = [user for user in users if user.role == 'manager'] or users[:1]
+        rows = (
+            Department(
+                name=f'[{self.prefix}] Department {index:04d}',
+                description='Generated for load testing',
+                manager_id=managers[index % len(managers)].id,
+            )
+            for index in range(count)
+        )
+        self.bulk_insert(Department, rows, 'departments')
+        return list(Department.objects.filter(name__startswith=f'[{self.prefix}]').only('id').order_by('id'))
+
+    def create_employees(self, users, departments):
+        internal = [user for user in users if user.role != 'freelancer']
+        team_leads = [user for user in internal if user.role == 'team_lead'] or internal[:1]
+        today = timezone.localdate()
+
+        def rows():
+            for index, user in enumerate(internal):
+                department = departments[index % len(departments)] if departments else None
+                manager = team_leads[index % len(team_leads)]
+                yield Employee(
+                    user_id=user.id,
+                    employee_id=f'{self.prefix.upper()[:6]}{index:07d}',
+                    department_id=department.id if department else None,
+                    manager_id=manager.id if manager.id != user.id else None,
+                    position=user.role.replace('_', ' ').title(),
+                    join_date=today - timedelta(days=self.rng.randint(30, 3650)),
+                    current_salary=Decimal(self.rng.randrange(8, 80) * 1000000),
+                )
+
+        self.bulk_insert(Employee, rows(), 'employees')
+
+        # bulk_create skips Employee.save, which maintains the reporting closure table
+        started = time.monotonic()
+        total = rebuild_employee_hierarchy(batch_size=self.chunk_size)
+        self.stdout.write(f'Rebuilt {total} employee hierarchy rows in {time.monotonic() - started:.1f}s')
+
+    def create_projects(self, count, users, departments):
+        managers = [user for user in users if user.role in ('admin', 'manager')]
+        members_pool = [user for user in users if user.role in ('team_lead', 'staff', 'freelancer')] or users
+        today = timezone.localdate()
+        rows = (
+            Project(
+                name=f'[{self.prefix}] Project {index:05d}',
+                description='Generated for load testing',
+                status=self.rng.choice(['active', 'active', 'active', 'completed', 'archived']),
+                created_by_id=self.rng.choice(managers).id,
+                start_date=today - timedelta(days=self.rng.randint(0, 720)),
+            )
+            for index in range(count)
+        )
+        self.bulk_insert(Project, rows, 'projects')
+        projects = list(Project.objects.filter(name__startswith=f'[{self.prefix}]').only('id').order_by('id'))
+
+        self.project_members = {}
+        member_rows = []
+        department_rows = []
+        for project in projects:
+            members = self.rng.sample(members_pool, min(len(members_pool), 8))
+            self.project_members[project.id] = [member.id for member in members]
+            member_rows.extend(
+                Project.members.through(project_id=project.id, user_id=member.id) for member in members
+            )
+            if departments:
+                department_rows.extend(
+                    Project.departments.through(project_id=project.id, department_id=department.id)
+                    for department in self.rng.sample(departments, min(len(departments), 2))
+                )
+        self.bulk_insert(Project.members.through, member_rows, 'project memberships')
+        self.bulk_insert(Project.departments.through, department_rows, 'project departments')
+        return projects
+
+    def create_tasks(self, count, users, projects):
+        if not projects:
+            return []
+        managers = [user.id for user in users if user.role in ('admin', 'manager', 'team_lead')]
+        default_progress = Task().get_default_stage_progress()
+        now = timezone.now()
+
+        def rows():
+            for index in range(count):
+                project = projects[index % len(projects)]
+                task_status = _weighted(self.rng, TASK_STATUS_WEIGHTS)
+                created_ago = timedelta(days=self.rng.randint(0, 365))
+                yield Task(
+                    title=f'[{self.prefix}] Task {index:07d}',
+                    project_id=project.id,
+                    assigned_by_id=self.rng.choice(managers),
+                    reviewer_id=self.rng.choice(managers),
+                    status=task_status,
+                    priority=self.rng.choice(['low', 'medium', 'medium', 'high', 'urgent']),
+                    stage_progress=dict(default_progress),
+                    due_date=now - created_ago + timedelta(days=self.rng.randint(3, 60)),
+                    completed_at=now - created_ago / 2 if task_status == 'completed' else None,
+                )
+
+        self.bulk_insert(Task, rows(), 'tasks')
+        task_rows = list(
+            Task.objects.filter(title__startswith=f'[{self.prefix}]').order_by('id').values_list('id', 'project_id')
+        )
+
+        def assignee_rows():
+            for task_id, project_id in task_rows:
+                members = self.project_members.get(project_id) or [self.rng.choice(users).id]
+                for user_id in self.rng.sample(members, min(len(members), self.rng.randint(1, 3))):
+                    yield Task.assignees.through(task_id=task_id, user_id=user_id)
+
+        self.bulk_insert(Task.assignees.through, assignee_rows(), 'task assignments')
+        task_ids = [task_id for task_id, _ in task_rows]
+
+        # bulk_create skips the signals that keep TaskAccess current
+        started = time.monotonic()
+        created = 0
+        for chunk in _chunked(task_ids, self.chunk_size):
+            created += refresh_task_access(task_ids=chunk)[0]
+        self.stdout.write(f'Created {created} task access rows in {time.monotonic() - started:.1f}s')
+        return task_ids
+
+    def create_attendance(self, count, users):
+        if count <= 0:
+            return
+        attendees = [user.id for user in users if user.role != 'admin'] or [user.id for user in users]
+        days_needed = math.ceil(count / len(attendees))
+
+        working_days = []
+        day = timezone.localdate() - timedelta(days=1)
+        while len(working_days) < days_needed:
+            if day.weekday() < 5:
+                working_days.append(day)
+            day -= timedelta(days=1)
+
+        def rows():
+            produced = 0
+            for work_day in working_days:
+                for user_id in attendees:
+                    if produced >= count:
+                        return
+                    produced += 1
+                    attendance_status = _weighted(self.rng, ATTENDANCE_STATUS_WEIGHTS)
+                    if attendance_status == 'absent':
+                        yield Attendance(user_id=user_id, date=work_day, status='absent')
+                        continue
+                    late = attendance_status == 'late'
+                    check_in = timezone.make_aware(datetime.combine(
+                        work_day,
+                        dt_time(9 if late else 8, self.rng.randint(20 if late else 0, 59)),
+                    ))
+                    hours = 4 if attendance_status == 'half_day' else self.rng.uniform(7.5, 10)
+                    yield Attendance(
+                        user_id=user_id,
+                        date=work_day,
+                        status=attendance_status,
+                        is_late=late,
+                        check_in_time=check_in,
+                        check_out_time=check_in + timedelta(hours=hours),
+                        total_hours=round(Decimal(hours), 2),
+                        check_in_location='Home' if attendance_status == 'wfh' else 'Office',
+                    )
+
+        self.bulk_insert(Attendance, rows(), 'attendance rows')
+        # bulk_create skips Attendance.save, which keeps the monthly summaries current
+        for chunk in _chunked(attendees, self.chunk_size):
+            rebuild_attendance_summaries(chunk)
+
+    def create_notifications(self, count, users, task_ids):
+        types = [code for code, _label in Notification.NOTIFICATION_TYPES]
+        user_ids = [user.id for user in users]
+
+        def rows():
+            for index in range(count):
+                notification_type = self.rng.choice(types)
+                yield Notification(
+                    recipient_id=self.rng.choice(user_ids),
+                    notification_type=notification_type,
+                    title=f'{notification_type.replace("_", " ").title()} #{index}',
+                    message='Generated for load testing',
+                    task_id=self.rng.choice(task_ids) if task_ids else None,
+                    is_read=self.rng.random() < 0.7,
+                )
+
+        self.bulk_insert(Notification, rows(), 'notifications')
@@ -0,0 +1,195 @@
+"""
+Simulate the morning check-in burst and report sustained throughput.
+
+Usage:
+    python manage.py loadtest_check_in --users 1000 --concurrency 100
+    python manage.py loadtest_check_in --users 1000 --concurrency 1000 --base-url http://localhost:8000
+    python manage.py loadtest_check_in --check-out --output checkin.json
+
+Uses the users of a generate_load_dataset run (--prefix). Today's attendance
+of those users is deleted first, then every user checks in once, a share of
+them double-taps (a second concurrent request without a key) and a share
+retries with the same Idempotency-Key. Without --base-url requests run
+in-process through the full middleware/DRF stack, one DB connection per
+worker thread; with --base-url they go over HTTP to a running server with JWT
+access tokens, which is how to measure real concurrency.
+
+The report lists requests per second, latency percentiles and status codes,
+and checks that every user ended with exactly one attendance row; any 5xx or
+duplicate row fails the run.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from analytics.management.commands.bench_api import summarize
+from hr.models import Attendance
+from hr.services import refresh_attendance_summaries
+
+User = get_user_model()
+
+CHECK_IN_PATH = '/api/hr/attendances/check_in/'
+CHECK_OUT_PATH = '/api/hr/attendances/check_out/'
+
+
+class Command(BaseCommand):
+    help = 'Load-test check-in/check-out with many concurrent users and report requests per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users checking in. Default: 1000.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Concurrent workers. Default: 100.')
+        parser.add_argument('--prefix', type=str, default='load', help='Dataset prefix. Default: load.')
+        parser.add_argument(
+            '--double-tap-ratio',
+            type=float,
+            default=0.1,
+            help='Share of users sending a second check-in without a key. Default: 0.1.',
+        )
+        parser.add_argument(
+            '--retry-ratio',
+            type=float,
+            default=0.1,
+            help='Share of users retrying with the same Idempotency-Key. Default: 0.1.',
+        )
+        parser.add_argument('--check-out', action='store_true', help='Run a check-out burst after the check-ins.')
+        parser.add_argument('--base-url', type=str, help='Send requests over HTTP to this server instead of in-process.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed. Default: 42.')
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_user", is_active=True)
+            .order_by('id')[:options['users']]
+        )
+        if len(users) < options['users']:
+            raise CommandError(
+                f"Only {len(users)} users with prefix \"{options['prefix']}\"; "
+                f"run generate_load_dataset --users {options['users']} first"
+            )
+
+        today = timezone.now().date()
+        # A queryset delete skips Attendance.delete; without the refresh the
+        # incremental check-in would count today twice in the monthly summary
+        Attendance.objects.filter(user__in=users, date=today).delete()
+        refresh_attendance_summaries((user.id, today.replace(day=1)) for user in users)
+
+        self.base_url = (options.get('base_url') or '').rstrip('/')
+        self.local = threading.local()
+        self.tokens = {user.id: str(AccessToken.for_user(user)) for user in users} if self.base_url else {}
+
+        report = {
+            'meta': {
+                'generated_at': timezone.now().isoformat(),
+                'users': len(users),
+                'concurrency': options['concurrency'],
+                'mode': 'http' if self.base_url else 'in-process',
+                'database': connections['default'].vendor,
+            },
+        }
+        report['check_in'] = self.run_phase(
+            CHECK_IN_PATH, users, rng, options['concurrency'], options['double_tap_ratio'], options['retry_ratio']
+        )
+        if options['check_out']:
+            report['check_out'] = self.run_phase(
+                CHECK_OUT_PATH, users, rng, options['concurrency'], options['double_tap_ratio'], options['retry_ratio']
+            )
+
+        duplicates = (
+            Attendance.objects.filter(user__in=users, date=today)
+            .values('user_id').annotate(rows=Count('id')).filter(rows__gt=1).count()
+        )
+        checked_in = Attendance.objects.filter(user__in=users, date=today, check_in_time__isnull=False).count()
+        report['integrity'] = {'checked_in_users': checked_in, 'users_with_duplicate_rows': duplicates}
+
+        output = json.dumps(report, indent=2)
+        if options.get('output'):
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+        server_errors = sum(
+            count for phase in ('check_in', 'check_out') if phase in report
+            for code, count in report[phase]['status_codes'].items() if code.startswith('5')
+        )
+        if server_errors or duplicates or checked_in != len(users):
+            raise CommandError(
+                f'{server_errors} server errors, {duplicates} duplicate rows, '
+                f'{checked_in}/{len(users)} users checked in'
+            )
+
+    def run_phase(self, path, users, rng, concurrency, double_tap_ratio, retry_ratio):
+        """Fire one request per user plus double-taps and keyed retries, all interleaved."""
+        calls = []
+        for user in users:
+            calls.append((user, None))
+            if rng.random() < double_tap_ratio:
+                calls.append((user, None))
+            if rng.random() < retry_ratio:
+                key = str(uuid.uuid4())
+                calls[-1] = (user, key)
+                calls.append((user, key))
+        rng.shuffle(calls)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(lambda call: self.send(path, *call), calls))
+        wall_seconds = time.monotonic() - started
+
+        latencies = [latency for latency, _ in results]
+        statuses = Counter(str(code) for _, code in results)
+        summary = summarize(latencies, [], statuses)
+        del summary['queries']
+        summary['wall_seconds'] = round(wall_seconds, 2)
+        summary['requests_per_second'] = round(len(calls) / wall_seconds, 1) if wall_seconds else 0
+        return summary
+
+    def send(self, path, user, idempotency_key):
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+        started = time.perf_counter()
+        if self.base_url:
+            status_code = self.send_http(path, user, headers)
+        else:
+            client = getattr(self.local, 'client', None)
+            if client is None:
+                host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+                client = self.local.client = APIClient(HTTP_HOST=host.lstrip('.'))
+            client.force_authenticate(user)
+            status_code = client.post(path, {'location': 'Office'}, format='json', headers=headers).status_code
+        return (time.perf_counter() - started) * 1000, status_code
+
+    def send_http(self, path, user, headers):
+        request = urllib.request.Request(
+            f'{self.base_url}{path}',
+            data=json.dumps({'location': 'Office'}).encode(),
+            headers={
+                'Authorization': f'Bearer {self.tokens[user.id]}',
+                'Content-Type': 'application/json',
+                **headers,
+            },
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+        except OSError:
+            return 599
@@ -0,0 +1,76 @@
+"""
+Per-request SQL instrumentation.
+
+QueryBudgetMiddleware counts the queries a request sends and the time spent in
+them, reports both in a ``Server-Timing`` header and logs a warning (with the
+most repeated statement, which is usually the N+1 culprit) when the request
+goes over the configured budget.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """Execute wrapper collecting query count, SQL time and statement frequency."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def record(self, func, *args, **kwargs):
+        """Run ``func`` with every database connection wrapped by this recorder."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            return func(*args, **kwargs)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queries = settings.QUERY_BUDGET_MAX_QUERIES
+        self.max_sql_ms = settings.QUERY_BUDGET_MAX_SQL_MS
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        response = recorder.record(self.get_response, request)
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = recorder.duration * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={sql_ms:.2f};desc="{recorder.count} queries", app;dur={total_ms:.2f}'
+        )
+
+        if recorder.count > self.max_queries or sql_ms > self.max_sql_ms:
+            statement, repeats = recorder.statements.most_common(1)[0]
+            logger.warning(
+                'Query budget exceeded: %s %s -> %s queries (budget %s), %.2fms SQL (budget %sms); '
+                'most repeated (%sx): %s',
+                request.method,
+                request.get_full_path(),
+                recorder.count,
+                self.max_queries,
+                sql_ms,
+                self.max_sql_ms,
+                repeats,
+                statement[:300],
+            )
+        return response
@@ -1,3 +1,341 @@
-from django.test import TestCase
+"""
+Query-count regression tests.
 
-# Create your tests here.
+Every list/detail route registered on an app router is requested with 1, 20 and
+200 rows of its model in the database. Each request must stay within the
+endpoint's query ceiling, and a list page must not cost more queries as rows
+are added (beyond the per-row allowances recorded in KNOWN_PER_ROW_QUERIES),
+so new N+1 patterns fail the build.
+
+Caches are disabled so the counts reflect a cold request.
+"""
+import datetime
+import importlib
+import io
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, models, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from hr.hierarchy import is_under
+from hr.models import Employee
+from tasks.models import Task, TaskAccess
+
+ROUTER_MODULES = [
+    'accounts.urls',
+    'crm.urls',
+    'documents.urls',
+    'events.urls',
+    'hr.urls',
+    'notifications.urls',
+    'projects.urls',
+    'reviews.urls',
+    'tasks.urls',
+]
+
+ROW_COUNTS = (1, 20, 200)
+
+# Queries for a list page before any per-row cost (auth, count, page).
+DEFAULT_LIST_CEILING = 5
+DEFAULT_DETAIL_CEILING = 15
+
+# Extra queries per listed row that serializers still issue today, by route
+# basename. A list page's ceiling is DEFAULT_LIST_CEILING + allowance * PAGE_SIZE.
+# Fixing an N+1 means lowering (or removing) the entry, never raising it.
+KNOWN_PER_ROW_QUERIES = {
+    'customerstage': 1,
+    'expensetype': 1,
+    'customer': 3,
+    'customerinteraction': 8,
+    'customerexpense': 5,
+    'document': 1,
+    'event': 1,
+    'department': 1,
+    'careerpath': 1,
+    'employee': 3,
+    'kpi': 5,
+    'evaluation': 3,
+    'salaryreview': 3,
+    'personalreport': 3,
+    'plan': 1,
+    'plan-goal': 2,
+    'plan-note': 1,
+    'plan-update-history': 1,
+    'attendance': 1,
+    'leave-balance': 2,
+    'leave-request': 3,
+    'notification': 2,
+    'project': 6,
+    'topic': 1,
+    'project-stage': 1,
+    'review': 5,
+    'review-criteria': 1,
+    'task-file': 1,
+    'task-comment': 3,
+}
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'local': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def router_endpoints():
+    """(basename, model) for every viewset registered on an app router."""
+    endpoints = []
+    for module_name in ROUTER_MODULES:
+        router = importlib.import_module(module_name).router
+        for _prefix, viewset, basename in router.registry:
+            view = viewset(action='list', request=None, format_kwarg=None, kwargs={})
+            if viewset.queryset is not None:
+                model = viewset.queryset.model
+            else:
+                model = view.get_serializer_class().Meta.model
+            endpoints.append((basename, model))
+    return endpoints
+
+
+class RowFactory:
+    """
+    Creates placeholder rows for any model with bulk_create.
+
+    Required fields get index-based values so unique constraints hold; foreign
+    keys (optional ones included) point at one shared parent row, or a fresh one per row when the
+    relation has to be unique. User relations default to ``owner`` so
+    owner-scoped querysets see the rows.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.parents = {}
+        self.counters = {}
+        self.building = set()
+
+    def create(self, model, count):
+        start = self.counters.get(model, 0)
+        self.counters[model] = start + count
+        unique_fks = self._unique_fk_names(model)
+        self.building.add(model)
+        try:
+            rows = [self._build(model, start + offset, unique_fks) for offset in range(count)]
+        finally:
+            self.building.discard(model)
+        return model.objects.bulk_create(rows)
+
+    def parent(self, model):
+        if model not in self.parents:
+            self.parents[model] = self.create(model, 1)[0]
+        return self.parents[model]
+
+    def _unique_fk_names(self, model):
+        names = set()
+        for group in model._meta.unique_together:
+            fields = [model._meta.get_field(name) for name in group]
+            if all(field.is_relation for field in fields):
+                names.add(group[0])
+        return names
+
+    def _build(self, model, index, unique_fks):
+        values = {}
+        for field in model._meta.concrete_fields:
+            if field.primary_key or getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                continue
+            if field.is_relation:
+                # Optional relations are filled too so serializers follow them,
+                # except where that would recurse into the model being built
+                if field.null and (field.related_model is model or field.related_model in self.building):
+                    continue
+                values[field.name] = self._related(field, index, unique_fks)
+            elif not (field.has_default() or field.null):
+                values[field.name] = self._value(field, index)
+        return model(**values)
+
+    def _related(self, field, index, unique_fks):
+        related = field.related_model
+        if field.unique or field.name in unique_fks:
+            return self.create(related, 1)[0]
+        if related is User:
+            return self.owner
+        return self.parent(related)
+
+    def _value(self, field, index):
+        if field.choices:
+            return field.choices[index % len(field.choices)][0]
+        if isinstance(field, models.EmailField):
+            return f'row{index}@example.com'
+        if isinstance(field, models.URLField):
+            return f'https://example.com/{index}'
+        if isinstance(field, models.FileField):
+            return f'uploads/row{index}.txt'
+        if isinstance(field, (models.CharField, models.TextField)):
+            suffix = str(index)
+            max_length = field.max_length or 50
+            return f'{field.name[:max_length - len(suffix) - 1]}-{suffix}'
+        if isinstance(field, models.DateTimeField):
+            return timezone.now() - datetime.timedelta(minutes=index)
+        if isinstance(field, models.DateField):
+            return datetime.date(2024, 1, 1) + datetime.timedelta(days=index)
+        if isinstance(field, models.TimeField):
+            return datetime.time(9, 0)
+        if isinstance(field, models.DurationField):
+            return datetime.timedelta(hours=1)
+        if isinstance(field, models.DecimalField):
+            return Decimal('1')
+        if isinstance(field, models.FloatField):
+            return 1.0
+        if isinstance(field, models.IntegerField):
+            return index + 1
+        if isinstance(field, models.BooleanField):
+            return False
+        if isinstance(field, models.JSONField):
+            return {}
+        raise TypeError(f'No placeholder value for {field.model.__name__}.{field.name}')
+
+
+def unique_choice_capacity(model):
+    """Largest row count allowed by unique fields that only accept a few choices."""
+    limits = [
+        len(field.choices)
+        for field in model._meta.concrete_fields
+        if field.unique and field.choices
+    ]
+    return min(limits) if limits else None
+
+
+@override_settings(CACHES=NO_CACHE)
+class EndpointQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='budget_admin',
+            email='budget_admin@example.com',
+            password='password',
+            role='admin',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, f'GET {url} -> {response.status_code}')
+        return len(context.captured_queries)
+
+    def test_router_endpoints_stay_within_query_budget(self):
+        for basename, model in router_endpoints():
+            with self.subTest(endpoint=basename), transaction.atomic():
+                self.check_endpoint(basename, model)
+                transaction.set_rollback(True)
+
+    def check_endpoint(self, basename, model):
+        factory = RowFactory(self.admin)
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        per_row = KNOWN_PER_ROW_QUERIES.get(basename, 0)
+        list_ceiling = DEFAULT_LIST_CEILING + per_row * page_size
+        list_url = reverse(f'{basename}-list')
+        capacity = unique_choice_capacity(model)
+
+        existing = model.objects.count()
+        list_counts = {}
+        for rows in ROW_COUNTS:
+            target = existing + rows if capacity is None else min(existing + rows, capacity)
+            missing = target - model.objects.count()
+            if missing > 0:
+                factory.create(model, missing)
+
+            list_counts[rows] = self.count_queries(list_url)
+            self.assertLessEqual(
+                list_counts[rows], list_ceiling,
+                f'{basename}-list used {list_counts[rows]} queries with {rows} rows',
+            )
+
+            detail_url = reverse(f'{basename}-detail', args=[model.objects.order_by('pk').first().pk])
+            detail_queries = self.count_queries(detail_url)
+            self.assertLessEqual(
+                detail_queries, DEFAULT_DETAIL_CEILING,
+                f'{basename}-detail used {detail_queries} queries with {rows} rows',
+            )
+
+        shown = min(ROW_COUNTS[-1], page_size) - ROW_COUNTS[0]
+        self.assertLessEqual(
+            list_counts[ROW_COUNTS[-1]] - list_counts[ROW_COUNTS[0]],
+            per_row * shown,
+            f'{basename}-list query count grows with rows: {list_counts}',
+        )
+
+
+@override_settings(
+    CACHES=NO_CACHE,
+    QUERY_BUDGET_MAX_QUERIES=1,
+    QUERY_BUDGET_MAX_SQL_MS=10000,
+)
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='budget_admin',
+            email='budget_admin@example.com',
+            password='password',
+            role='admin',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_header_reports_queries(self):
+        response = self.client.get(reverse('user-list'))
+
+        self.assertIn('Server-Timing', response)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+
+    def test_budget_violation_is_logged(self):
+        with self.assertLogs('analytics.middleware', level=logging.WARNING) as logs:
+            self.client.get(reverse('user-list'))
+
+        self.assertIn('Query budget exceeded', logs.output[0])
+
+
+class GenerateLoadDatasetTests(TestCase):
+    def generate(self):
+        call_command(
+            'generate_load_dataset',
+            users=30,
+            departments=3,
+            projects=4,
+            tasks=40,
+            attendance=60,
+            notifications=20,
+            chunk_size=7,
+            prefix='t',
+            stdout=io.StringIO(),
+        )
+
+    def test_generated_users_cannot_log_in_with_a_password_by_default(self):
+        self.generate()
+
+        admin = User.objects.get(username='t_admin')
+        self.assertTrue(admin.is_superuser)
+        self.assertFalse(admin.has_usable_password())
+        self.assertFalse(User.objects.filter(username__startswith='t_').exclude(password__startswith='!').exists())
+
+    def test_task_access_is_filled(self):
+        self.generate()
+
+        tasks = Task.objects.filter(title__startswith='[t]')
+        self.assertEqual(tasks.count(), 40)
+        for task in tasks.prefetch_related('assignees'):
+            granted = set(TaskAccess.objects.filter(task=task).values_list('user_id', flat=True))
+            self.assertTrue({user.id for user in task.assignees.all()} <= granted)
+
+    def test_employee_hierarchy_is_built(self):
+        self.generate()
+
+        employees = Employee.objects.filter(user__username__startswith='t_', manager__isnull=False)
+        self.assertTrue(employees.exists())
+        for employee in employees:
+            self.assertTrue(is_under(employee.user_id, employee.manager_id))
@@ -1,3 +1,22 @@
-from django.shortcuts import render
+from rest_framework import generics, status
+from rest_framework.response import Response
 
-# Create your views here.
+from accounts.permissions import IsAdmin
+from config.cache import cache_stats, reset_cache_stats
+
+
+class CacheStatsView(generics.GenericAPIView):
+    """
+    Cache hit/miss counters for this worker process
+    GET: current counters, POST with {"reset": true}: clear them
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+    def post(self, request):
+        if not request.data.get('reset'):
+            return Response({'error': 'Nothing to do'}, status=status.HTTP_400_BAD_REQUEST)
+        reset_cache_stats()
+        return Response(cache_stats())
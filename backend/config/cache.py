@@ -0,0 +1,350 @@
+"""
+Shared cache layer.
+
+- Reads/writes go to the Redis-backed ``default`` cache and fall back to the
+  in-process ``local`` LRU cache while Redis is unreachable.
+- Entries are keyed on tag versions; signal handlers registered with
+  ``invalidate_on`` / ``invalidate_on_m2m`` bump the versions of the tags an
+  instance affects, so only the dependent entries stop matching.
+- Hit/miss counters are kept per namespace and exposed by ``cache_stats``.
+- ``LocalSnapshot`` keeps a value in process memory and revalidates it against
+  its tag version on every read. While the local cache is serving, tag
+  versions are per process, so snapshots are bypassed and entries written in
+  that window expire after ``FALLBACK_TIMEOUT`` seconds.
+- ``idempotent`` replays the stored response of a write retried with the
+  same ``Idempotency-Key`` header.
+"""
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+TAG_VERSION_PREFIX = 'tagver'
+REDIS_RETRY_SECONDS = 30
+# Invalidations made by other processes cannot be seen while on the local cache
+FALLBACK_TIMEOUT = 30
+
+
+class ResilientCache:
+    """Wraps the shared cache and degrades to the local LRU cache on errors."""
+
+    def __init__(self, primary_alias='default', fallback_alias='local'):
+        self.primary_alias = primary_alias
+        self.fallback_alias = fallback_alias
+        self._down_until = 0
+
+    @property
+    def using_fallback(self):
+        return time.monotonic() < self._down_until
+
+    def _call(self, method, *args, **kwargs):
+        if not self.using_fallback:
+            try:
+                return getattr(caches[self.primary_alias], method)(*args, **kwargs)
+            except Exception as exc:
+                self._down_until = time.monotonic() + REDIS_RETRY_SECONDS
+                _stats.record('_backend', 'errors')
+                logger.warning('Shared cache unavailable, using local cache: %s', exc)
+        return getattr(caches[self.fallback_alias], method)(*args, **kwargs)
+
+    def get(self, key, default=None):
+        return self._call('get', key, default)
+
+    def get_many(self, keys):
+        return self._call('get_many', keys)
+
+    def set(self, key, value, timeout=None):
+        return self._call('set', key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._call('add', key, value, timeout)
+
+    def set_many(self, data, timeout=None):
+        return self._call('set_many', data, timeout)
+
+    def delete(self, key):
+        return self._call('delete', key)
+
+
+class _CacheStats:
+    """Thread-safe per-namespace counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, namespace, event):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {})
+            counters[event] = counters.get(event, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {namespace: dict(counters) for namespace, counters in self._counters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+shared_cache = ResilientCache()
+_stats = _CacheStats()
+
+
+def cache_stats():
+    """Counters for this process plus which backend is currently serving."""
+    namespaces = _stats.snapshot()
+    totals = {}
+    for namespace, counters in namespaces.items():
+        if namespace.startswith('_'):
+            continue
+        for event, count in counters.items():
+            totals[event] = totals.get(event, 0) + count
+    lookups = totals.get('hits', 0) + totals.get('misses', 0)
+    return {
+        'backend': shared_cache.fallback_alias if shared_cache.using_fallback else shared_cache.primary_alias,
+        'totals': totals,
+        'hit_rate': round(totals.get('hits', 0) / lookups * 100, 2) if lookups else 0,
+        'namespaces': namespaces,
+    }
+
+
+def reset_cache_stats():
+    _stats.reset()
+
+
+def _tag_key(tag):
+    return f'{TAG_VERSION_PREFIX}:{tag}'
+
+
+def _tag_versions(tags):
+    """Current version of each tag; unknown tags get a fresh version."""
+    if not tags:
+        return []
+    keys = [_tag_key(tag) for tag in tags]
+    found = shared_cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        # A fresh (never reused) version means evicted tags can only cause misses
+        shared_cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """Move the given tags to a new version so entries built on them stop matching."""
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return
+    version = time.time_ns()
+    shared_cache.set_many({_tag_key(tag): version for tag in tags}, None)
+    for tag in tags:
+        _stats.record(tag.split(':', 1)[0], 'invalidations')
+
+
+def _build_key(namespace, tags, *parts):
+    versions = _tag_versions(tags)
+    raw = repr((namespace, tuple(tags), tuple(versions), parts))
+    return f'{namespace}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _entry_timeout(timeout):
+    if timeout is None:
+        timeout = settings.CACHE_DEFAULT_TIMEOUT
+    if shared_cache.using_fallback:
+        return FALLBACK_TIMEOUT if timeout is None else min(timeout, FALLBACK_TIMEOUT)
+    return timeout
+
+
+def get_or_set(namespace, loader, tags=(), key_parts=(), timeout=None):
+    """Return the cached value for ``namespace``/``key_parts`` or compute it via ``loader``."""
+    tags = list(tags) or [namespace]
+    key = _build_key(namespace, tags, *key_parts)
+    value = shared_cache.get(key)
+    if value is not None:
+        _stats.record(namespace, 'hits')
+        return value
+
+    _stats.record(namespace, 'misses')
+    value = loader()
+    shared_cache.set(key, value, _entry_timeout(timeout))
+    return value
+
+
+class LocalSnapshot:
+    """
+    Process-local copy of a small, rarely changing value such as a settings row.
+
+    Every read costs one shared-cache lookup of the tag's version and no
+    database query; ``loader`` only runs again once ``invalidate_tags(tag)``
+    has moved the version (from any process). Treat the value as read-only:
+    it is shared by all threads of the process. While the shared cache is
+    down every read calls ``loader``, since other processes' invalidations
+    would not be seen.
+    """
+
+    def __init__(self, tag, loader):
+        self.tag = tag
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        if shared_cache.using_fallback:
+            _stats.record(self.tag, 'misses')
+            return self.loader()
+
+        version = _tag_versions([self.tag])[0]
+        with self._lock:
+            if self._version == version:
+                _stats.record(self.tag, 'hits')
+                return self._value
+
+        _stats.record(self.tag, 'misses')
+        value = self.loader()
+        with self._lock:
+            self._version, self._value = version, value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._version = self._value = None
+
+
+def _scope_value(request, scope):
+    user = request.user
+    if scope == 'global':
+        return ''
+    if scope == 'role':
+        return 'superuser' if user.is_superuser else user.role
+    return user.pk
+
+
+def cache_response(namespace, tags=(), scope='user', timeout=None):
+    """
+    Cache a viewset action's successful response data.
+
+    ``tags`` may reference URL kwargs, e.g. ``'project:{pk}'``. The key covers the
+    requester scope ('user', 'role' or 'global'), URL kwargs and query params.
+
+    Detail actions look the object up (applying the viewset's queryset scoping
+    and object permissions) before the cache is consulted, so losing access
+    takes effect immediately rather than when the entry is invalidated.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            lookup_kwarg = getattr(view, 'lookup_url_kwarg', None) or getattr(view, 'lookup_field', None)
+            if hasattr(view, 'get_object') and lookup_kwarg in view.kwargs:
+                instance = view.get_object()
+                # On a miss the action gets the same object without a second query
+                view.get_object = lambda: instance
+
+            resolved_tags = [tag.format(**view.kwargs) for tag in tags] or [namespace]
+            key = _build_key(
+                namespace,
+                resolved_tags,
+                _scope_value(request, scope),
+                tuple(sorted(view.kwargs.items())),
+                tuple(sorted(request.query_params.lists())),
+            )
+            data = shared_cache.get(key)
+            if data is not None:
+                _stats.record(namespace, 'hits')
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _stats.record(namespace, 'misses')
+            response = func(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                shared_cache.set(key, response.data, _entry_timeout(timeout))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+IDEMPOTENCY_LOCK_SECONDS = 30
+_IN_PROGRESS = '__in_progress__'
+
+
+def idempotent(namespace, timeout=IDEMPOTENCY_TIMEOUT):
+    """
+    Make a write action safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs and its response (anything below 500) is
+    stored per user; repeats get the stored response with ``Idempotent-Replayed:
+    true``. A repeat that arrives while the first is still running gets 409.
+    Requests without the header are not affected.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return func(view, request, *args, **kwargs)
+
+            digest = hashlib.md5(idempotency_key.encode()).hexdigest()
+            key = f'idempotency:{namespace}:{request.user.pk}:{digest}'
+            if not shared_cache.add(key, _IN_PROGRESS, IDEMPOTENCY_LOCK_SECONDS):
+                stored = shared_cache.get(key)
+                if stored is None or stored == _IN_PROGRESS:
+                    return Response(
+                        {'error': 'A request with this Idempotency-Key is already in progress'},
+                        status=409,
+                    )
+                _stats.record(namespace, 'hits')
+                response = Response(stored['data'], status=stored['status'])
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+            _stats.record(namespace, 'misses')
+            try:
+                response = func(view, request, *args, **kwargs)
+            except Exception:
+                shared_cache.delete(key)
+                raise
+            if response.status_code < 500:
+                shared_cache.set(key, {'status': response.status_code, 'data': response.data}, timeout)
+            else:
+                shared_cache.delete(key)
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_on(model, tags_fn):
+    """Invalidate ``tags_fn(instance)`` whenever an instance of ``model`` is saved or deleted."""
+    def handler(sender, instance, **kwargs):
+        invalidate_tags(*tags_fn(instance))
+
+    uid = f'cache-invalidate:{model._meta.label}:{tags_fn.__module__}.{tags_fn.__qualname__}'
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=f'{uid}:save')
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=f'{uid}:delete')
+
+
+def invalidate_on_m2m(through, tags_fn):
+    """
+    Invalidate on changes to a many-to-many relation.
+
+    ``tags_fn(instance, pk_set, reverse)`` receives the signal arguments; ``pk_set``
+    is None for clears.
+    """
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_tags(*tags_fn(instance, pk_set, reverse))
+
+    uid = f'cache-invalidate-m2m:{through._meta.label}:{tags_fn.__module__}.{tags_fn.__qualname__}'
+    m2m_changed.connect(handler, sender=through, weak=False, dispatch_uid=uid)
@@ -0,0 +1,197 @@
+"""
+Keyset (cursor) pagination for append-heavy tables.
+
+Page-number pagination runs COUNT(*) and OFFSET, which get slower the deeper a
+client pages into tables such as attendance or notifications. Keyset
+pagination instead filters on the ordering values of the last row seen, so
+every page costs the same index range scan.
+
+Viewsets opt in per action with ``CursorPaginationMixin``; clients opt in per
+request with ``?pagination=cursor`` (the ``next``/``previous`` links keep it).
+Responses keep the page-number shape (``count``, ``next``, ``previous``,
+``results``) with ``count`` set to null, so existing clients keep working.
+
+A keyset page can only follow its own fixed ordering. A request that asks for
+another order (``?ordering=``, or ``?search=``, which orders by rank) is
+served with page numbers instead of being silently re-sorted. Requests that
+already carry a cursor, such as the task board's column links, keep walking
+it.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on ``ordering``, whose last field must be unique (usually ``id``)
+    so rows sharing the leading values still get a stable position.
+    Ordering fields must be non-nullable.
+    """
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    @classmethod
+    def requested(cls, request):
+        params = request.query_params
+        if cls.cursor_query_param in params:
+            return True
+        if params.get(cls.mode_query_param) != 'cursor':
+            return False
+        # Client-chosen and search-rank orderings need page numbers
+        return not any(params.get(param) for param in (api_settings.ORDERING_PARAM, api_settings.SEARCH_PARAM))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(queryset.model, request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.previous_position = None
+        if rows:
+            # Walking backwards always came from a row after this page, and walking
+            # forwards from a cursor always leaves the cursor row before it
+            more_after = True if reverse else has_more
+            more_before = has_more if reverse else values is not None
+            if more_after:
+                self.next_position = self.position(rows[-1])
+            if more_before:
+                self.previous_position = self.position(rows[0])
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def keyset_filter(self, values, reverse):
+        """Rows strictly after ``values`` in (possibly reversed) ordering, expanded field by field."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value})
+            equal[name] = value
+        return condition
+
+    def position(self, row):
+        return [_encode_value(getattr(row, field.lstrip('-'))) for field in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'v': position, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = replace_query_param(self.base_url, self.cursor_query_param, cursor)
+        return replace_query_param(url, self.mode_query_param, 'cursor')
+
+    def decode_cursor(self, model, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            raw_values = payload['v']
+            if len(raw_values) != len(self.ordering):
+                raise ValueError('cursor does not match ordering')
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, raw_values)
+            ]
+            return values, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CursorPaginationMixin:
+    """
+    Lets a viewset serve selected actions with keyset pagination.
+
+    ``cursor_pagination`` maps action name -> ordering, e.g.
+    ``{'list': ('-date', '-id')}``. Other actions, requests that do not ask
+    for ``?pagination=cursor`` and requests ordered by ``?ordering=`` or
+    ``?search=`` use the default page-number paginator.
+    """
+    cursor_pagination = {}
+
+    def uses_cursor_pagination(self):
+        request = getattr(self, 'request', None)
+        return (
+            getattr(self, 'action', None) in self.cursor_pagination
+            and request is not None
+            and KeysetPagination.requested(request)
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.uses_cursor_pagination():
+                self._paginator = KeysetPagination(self.cursor_pagination[self.action])
+            else:
+                return super().paginator
+        return self._paginator
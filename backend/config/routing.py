@@ -4,7 +4,8 @@ WebSocket URL routing configuration for Django Channels
 
 from django.urls import path
 
+from notifications.consumers import NotificationConsumer
+
 websocket_urlpatterns = [
-    # WebSocket routes will be added here
-    # Example: path('ws/notifications/', NotificationConsumer.as_asgi()),
+    path('ws/notifications/', NotificationConsumer.as_asgi()),
 ]
@@ -0,0 +1,183 @@
+"""
+Full-text search.
+
+``SearchFilter`` turns ``?search=`` into ``ILIKE '%term%'`` on every search
+field, which no B-tree index can answer, so each search scanned the table.
+Viewsets now declare a ``search_document`` instead:
+
+- the weighted text fields are matched as a ``tsvector`` against a prefix
+  ``tsquery`` (``simple`` configuration: no stemming, which suits the mix of
+  Vietnamese and English text). Each searchable table has a GIN index over
+  exactly the expression ``SearchDocument.vector`` builds, so the match is an
+  index scan and ``search_rank`` orders the results;
+- ``contains_fields`` are short fields such as names, e-mails and phone
+  numbers that users search by fragment. They keep the substring match,
+  backed by trigram GIN indexes on ``UPPER(field)`` (what ``icontains``
+  compares). Fields on the searched table are OR-ed into the match, which
+  PostgreSQL answers with a BitmapOr of the indexes. Fields across a join
+  (``user__username``) cannot be OR-ed that way without a scan of the
+  searched table, so they are matched in a separate subquery and the two id
+  sets are combined with ``id IN (... UNION ...)``.
+
+Both are PostgreSQL-only. Other backends fall back to the old ``icontains``
+match with a zero rank, like hr.leave_calendar does for its range index.
+
+``FullTextSearchFilter`` is the drop-in filter backend and
+``UnifiedSearchView`` (``/api/search/``) runs the same search across entity
+types, each through its viewset's ``get_queryset`` so visibility rules apply.
+"""
+import re
+from functools import reduce
+from operator import add
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+SEARCH_CONFIG = 'simple'
+MAX_SEARCH_TERMS = 8
+SEARCH_TERM = re.compile(r'[^\W_]+')
+NO_RANK = Value(0.0, output_field=FloatField())
+
+
+def search_terms(text):
+    """Words of ``text`` (letters and digits only, so they are safe in a raw tsquery)."""
+    return SEARCH_TERM.findall(text.lower())[:MAX_SEARCH_TERMS]
+
+
+class SearchDocument:
+    """
+    The searchable text of one model.
+
+    ``fields`` maps field names to tsvector weights ('A' ranks highest);
+    ``contains_fields`` are matched by substring. The GIN index of each
+    model's search migration must stay identical to ``vector()``.
+    """
+
+    def __init__(self, fields, contains_fields=()):
+        self.fields = dict(fields)
+        self.contains_fields = tuple(contains_fields)
+
+    def vector(self):
+        return reduce(add, [
+            SearchVector(field, weight=weight, config=SEARCH_CONFIG) for field, weight in self.fields.items()
+        ])
+
+    def _contains(self, terms, fields):
+        # Every term must appear in the same field
+        condition = Q()
+        for field in fields:
+            condition |= Q(*[Q(**{f'{field}__icontains': term}) for term in terms])
+        return condition
+
+    def search(self, queryset, text):
+        """``queryset`` narrowed to the rows matching ``text``, annotated with ``search_rank``."""
+        terms = search_terms(text)
+        if not terms:
+            return queryset.annotate(search_rank=NO_RANK).none()
+        if connection.vendor != 'postgresql':
+            return queryset.filter(self._contains(terms, [*self.fields, *self.contains_fields])).annotate(
+                search_rank=NO_RANK
+            )
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), config=SEARCH_CONFIG, search_type='raw')
+        local_fields = [field for field in self.contains_fields if '__' not in field]
+        joined_fields = [field for field in self.contains_fields if '__' in field]
+        matches = Q(search_vector=query) | self._contains(terms, local_fields)
+        if joined_fields:
+            manager = queryset.model._default_manager
+            matching_ids = manager.alias(search_vector=self.vector()).filter(matches).values('pk').order_by().union(
+                manager.filter(self._contains(terms, joined_fields)).values('pk').order_by()
+            )
+            queryset, matches = queryset.filter(pk__in=matching_ids), Q()
+        return queryset.alias(search_vector=self.vector()).filter(matches).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ``?search=`` over the view's ``search_document``, best matches first.
+
+    List it after OrderingFilter: the rank then leads the view's default
+    ordering, while an explicit ``?ordering=`` is left as the client asked.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        document = getattr(view, 'search_document', None)
+        text = request.query_params.get(self.search_param, '')
+        if document is None or not text.strip():
+            return queryset
+
+        queryset = document.search(queryset, text)
+        if OrderingFilter.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by('-search_rank', *(queryset.query.order_by or queryset.model._meta.ordering))
+
+
+class UnifiedSearchView(APIView):
+    """
+    Search tasks, plans, projects and customers at once.
+
+    GET /api/search/?q=<text>[&types=task,plan][&limit=5]
+
+    Each type is searched through its viewset's ``get_queryset``, so users
+    only find what they could list; types the user may not list are left out.
+    """
+    permission_classes = [IsAuthenticated]
+    # type -> (viewset, title field, subtitle field)
+    search_types = {
+        'task': ('tasks.views.TaskViewSet', 'title', 'status'),
+        'plan': ('hr.views.PlanViewSet', 'title', 'status'),
+        'project': ('projects.views.ProjectViewSet', 'name', 'client_name'),
+        'customer': ('crm.views.CustomerViewSet', 'company_name', 'contact_person'),
+    }
+    default_limit = 5
+    max_limit = 20
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not search_terms(text):
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        types = request.query_params.get('types')
+        types = [name.strip() for name in types.split(',') if name.strip()] if types else list(self.search_types)
+        unknown = [name for name in types if name not in self.search_types]
+        if unknown:
+            return Response(
+                {'error': f"Unknown types: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.max_limit))
+
+        results = {}
+        for name in types:
+            viewset_path, title_field, subtitle_field = self.search_types[name]
+            viewset = import_string(viewset_path)(
+                request=request, args=(), kwargs={}, format_kwarg=None, action='search'
+            )
+            try:
+                viewset.check_permissions(request)
+            except (NotAuthenticated, PermissionDenied):
+                continue
+            rows = viewset.search_document.search(viewset.get_queryset(), text).order_by(
+                '-search_rank', '-pk'
+            ).values('pk', 'search_rank', title_field, subtitle_field)[:limit]
+            results[name] = [{
+                'id': row['pk'],
+                'title': row[title_field],
+                'subtitle': row[subtitle_field],
+                'rank': round(row['search_rank'], 4),
+            } for row in rows]
+
+        return Response({'query': text, 'results': results})
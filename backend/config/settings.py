@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analytics.middleware.QueryBudgetMiddleware',  # First, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware - must be before CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -137,6 +138,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
 
+# Private files (attendance exports): kept outside MEDIA_ROOT, which nginx serves
+# publicly, and only downloaded through views that check access (config.storage)
+PRIVATE_MEDIA_ROOT = os.getenv('PRIVATE_MEDIA_ROOT', BASE_DIR / 'private_media')
+
+# Background attendance exports (hr.exports, cleanup_attendance_exports): jobs left
+# pending/running longer than this lost their worker; finished jobs and their files
+# are deleted after the retention period
+ATTENDANCE_EXPORT_STALE_MINUTES = int(os.getenv('ATTENDANCE_EXPORT_STALE_MINUTES', 30))
+ATTENDANCE_EXPORT_RETENTION_DAYS = int(os.getenv('ATTENDANCE_EXPORT_RETENTION_DAYS', 7))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -205,6 +216,39 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache Settings
+# Shared Redis cache (separate DB from the channel layer) with an in-process
+# LRU fallback used by config.cache while Redis is unreachable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://{}{}:{}/{}'.format(
+            f":{os.getenv('REDIS_PASSWORD')}@" if os.getenv('REDIS_PASSWORD') else '',
+            os.getenv('REDIS_HOST', 'localhost'),
+            os.getenv('REDIS_PORT', 6379),
+            os.getenv('REDIS_CACHE_DB', 1),
+        ),
+        'KEY_PREFIX': 'workhub',
+        'OPTIONS': {
+            'socket_connect_timeout': 0.5,
+            'socket_timeout': 0.5,
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'workhub-local',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+
+# Query budget (analytics.middleware.QueryBudgetMiddleware)
+# Requests over either limit are logged with their most repeated statement.
+QUERY_BUDGET_MAX_QUERIES = int(os.getenv('QUERY_BUDGET_MAX_QUERIES', 30))
+QUERY_BUDGET_MAX_SQL_MS = float(os.getenv('QUERY_BUDGET_MAX_SQL_MS', 200))
+
 # Swagger Settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -0,0 +1,33 @@
+"""
+Private file storage.
+
+Files under MEDIA_ROOT are served by nginx at /media/ to anyone with the URL.
+Files that need an access check (attendance exports) go to
+PRIVATE_MEDIA_ROOT instead, which nothing serves directly; views stream them
+with FileResponse after checking who is asking.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+
+@deconstructible(path='config.storage.PrivateFileSystemStorage')
+class PrivateFileSystemStorage(FileSystemStorage):
+    """FileSystemStorage rooted at PRIVATE_MEDIA_ROOT, without a public URL."""
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    def url(self, name):
+        raise ValueError('Private files have no public URL; serve them through a view.')
+
+
+private_storage = PrivateFileSystemStorage()
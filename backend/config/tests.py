@@ -0,0 +1,234 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework import mixins, viewsets
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import User
+from hr.models import Department
+from projects.models import Project
+
+from . import cache
+from .cache import (
+    LocalSnapshot, ResilientCache, cache_response, cache_stats, get_or_set, invalidate_tags,
+    reset_cache_stats,
+)
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'config-tests-default'},
+    'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'config-tests-local'},
+}
+
+
+class CountingViewSet(viewsets.ViewSet):
+    calls = 0
+
+    def respond(self, request, pk):
+        CountingViewSet.calls += 1
+        return Response({'pk': pk, 'calls': CountingViewSet.calls})
+
+    @cache_response('config_tests.user', tags=['config_tests:{pk}'])
+    def retrieve(self, request, pk=None):
+        return self.respond(request, pk)
+
+    @cache_response('config_tests.role', tags=['config_tests:{pk}'], scope='role')
+    def by_role(self, request, pk=None):
+        return self.respond(request, pk)
+
+
+class MemberProjectViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    def get_queryset(self):
+        return Project.objects.filter(members=self.request.user)
+
+    @cache_response('config_tests.project', tags=['project:{pk}'])
+    def statistics(self, request, pk=None):
+        return Response({'name': self.get_object().name})
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CacheTestCase(TestCase):
+    def setUp(self):
+        # A fresh wrapper, so a Redis outage seen by earlier tests does not leak in
+        patcher = mock.patch.object(cache, 'shared_cache', ResilientCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for alias in LOCAL_CACHES:
+            caches[alias].clear()
+        reset_cache_stats()
+
+
+class ResilientCacheTests(CacheTestCase):
+    def test_errors_fall_back_to_the_local_cache(self):
+        resilient = cache.shared_cache
+        resilient.set('key', 'shared')
+        self.assertEqual(caches['default'].get('key'), 'shared')
+
+        with mock.patch.object(caches['default'], 'get', side_effect=ConnectionError('down')) as failing_get:
+            with self.assertLogs('config.cache', level='WARNING'):
+                self.assertIsNone(resilient.get('key'))
+            resilient.set('key', 'local')
+            self.assertEqual(resilient.get('key'), 'local')
+
+        # Later calls skip the shared cache for the retry window
+        self.assertEqual(failing_get.call_count, 1)
+        self.assertTrue(resilient.using_fallback)
+        self.assertEqual(caches['local'].get('key'), 'local')
+        self.assertEqual(caches['default'].get('key'), 'shared')
+        self.assertEqual(cache_stats()['backend'], 'local')
+        self.assertEqual(cache_stats()['namespaces']['_backend'], {'errors': 1})
+
+    def test_shared_cache_is_retried_after_the_window(self):
+        resilient = cache.shared_cache
+        with mock.patch.object(caches['default'], 'get', side_effect=ConnectionError('down')):
+            with self.assertLogs('config.cache', level='WARNING'):
+                resilient.get('key')
+
+        with mock.patch.object(cache.time, 'monotonic', return_value=cache.time.monotonic() + 31):
+            self.assertFalse(resilient.using_fallback)
+            resilient.set('key', 'shared')
+        self.assertEqual(caches['default'].get('key'), 'shared')
+
+    def test_snapshots_are_bypassed_and_entries_short_lived_on_the_fallback(self):
+        loads = []
+        snapshot = LocalSnapshot('config_tests', lambda: loads.append(1) or len(loads))
+        snapshot.get()
+        self.assertEqual(snapshot.get(), 1)
+
+        with mock.patch.object(caches['default'], 'get_many', side_effect=ConnectionError('down')):
+            with self.assertLogs('config.cache', level='WARNING'):
+                self.assertEqual(snapshot.get(), 2)
+            self.assertEqual(snapshot.get(), 3)
+            with mock.patch.object(caches['local'], 'set', wraps=caches['local'].set) as local_set:
+                get_or_set('config_tests.value', lambda: 'value', timeout=600)
+        self.assertEqual(local_set.call_args.args[2], cache.FALLBACK_TIMEOUT)
+
+
+class TagInvalidationTests(CacheTestCase):
+    def load(self, namespace, **kwargs):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return 'value'
+
+        get_or_set(namespace, loader, **kwargs)
+        return len(loads)
+
+    def test_only_entries_on_the_bumped_tag_are_rebuilt(self):
+        self.assertEqual(self.load('config_tests.a', tags=['config_tests:a']), 1)
+        self.assertEqual(self.load('config_tests.b', tags=['config_tests:b']), 1)
+        self.assertEqual(self.load('config_tests.a', tags=['config_tests:a']), 0)
+
+        invalidate_tags('config_tests:a')
+
+        self.assertEqual(self.load('config_tests.a', tags=['config_tests:a']), 1)
+        self.assertEqual(self.load('config_tests.b', tags=['config_tests:b']), 0)
+
+    def test_invalidate_on_bumps_tags_on_save_and_delete(self):
+        # hr.signals: any Department write invalidates the employee counts
+        self.assertEqual(self.load('hr.department_employee_counts'), 1)
+        self.assertEqual(self.load('hr.department_employee_counts'), 0)
+
+        department = Department.objects.create(name='Cache tests')
+        self.assertEqual(self.load('hr.department_employee_counts'), 1)
+
+        department.delete()
+        self.assertEqual(self.load('hr.department_employee_counts'), 1)
+
+    def test_invalidate_on_m2m_bumps_the_project_tag(self):
+        project = Project.objects.create(name='Cache tests')
+        other = Project.objects.create(name='Untouched')
+        member = User.objects.create_user(username='cache_member', password='password', role='staff')
+        for tagged in (project, other):
+            self.load('config_tests.project', tags=[f'project:{tagged.pk}'], key_parts=(tagged.pk,))
+
+        # projects.signals: membership changes invalidate the project, from either side
+        project.members.add(member)
+        self.assertEqual(self.load('config_tests.project', tags=[f'project:{project.pk}'], key_parts=(project.pk,)), 1)
+        self.assertEqual(self.load('config_tests.project', tags=[f'project:{other.pk}'], key_parts=(other.pk,)), 0)
+
+        member.member_projects.remove(project)
+        self.assertEqual(self.load('config_tests.project', tags=[f'project:{project.pk}'], key_parts=(project.pk,)), 1)
+
+
+class CacheResponseTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        CountingViewSet.calls = 0
+        self.factory = APIRequestFactory()
+        self.staff = User.objects.create_user(username='cache_staff', password='password', role='staff')
+        self.other_staff = User.objects.create_user(username='cache_staff2', password='password', role='staff')
+        self.manager = User.objects.create_user(username='cache_manager', password='password', role='manager')
+
+    def get(self, user, action='retrieve', pk='1', **params):
+        request = self.factory.get(f'/cache-tests/{pk}/', params)
+        force_authenticate(request, user)
+        return CountingViewSet.as_view({'get': action})(request, pk=pk)
+
+    def test_hit_and_miss(self):
+        first = self.get(self.staff)
+        second = self.get(self.staff)
+
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(CountingViewSet.calls, 1)
+        self.assertEqual(self.get(self.staff, page='2')['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.staff, pk='2')['X-Cache'], 'MISS')
+
+        invalidate_tags('config_tests:1')
+        self.assertEqual(self.get(self.staff)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.staff, pk='2')['X-Cache'], 'HIT')
+
+    def test_user_scope_keeps_users_apart(self):
+        self.get(self.staff)
+
+        response = self.get(self.other_staff)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['calls'], 2)
+
+    def test_role_scope_is_shared_within_a_role(self):
+        self.get(self.staff, action='by_role')
+
+        self.assertEqual(self.get(self.other_staff, action='by_role')['X-Cache'], 'HIT')
+        self.assertEqual(self.get(self.manager, action='by_role')['X-Cache'], 'MISS')
+        self.assertEqual(CountingViewSet.calls, 2)
+
+    def test_detail_hits_still_check_access_to_the_object(self):
+        project = Project.objects.create(name='Cached')
+        project.members.add(self.staff)
+        view = MemberProjectViewSet.as_view({'get': 'statistics'})
+
+        def get():
+            request = self.factory.get(f'/cache-tests/{project.pk}/statistics/')
+            force_authenticate(request, self.staff)
+            return view(request, pk=str(project.pk))
+
+        self.assertEqual(get()['X-Cache'], 'MISS')
+        self.assertEqual(get()['X-Cache'], 'HIT')
+
+        # Bypass the m2m signal so the cached entry stays valid
+        Project.members.through.objects.filter(project=project).delete()
+
+        self.assertEqual(get().status_code, 404)
+
+    def test_stats_count_hits_and_misses_per_namespace(self):
+        self.get(self.staff)
+        self.get(self.staff)
+        self.get(self.staff)
+        self.get(self.staff, action='by_role')
+        invalidate_tags('config_tests:1')
+
+        stats = cache_stats()
+
+        self.assertEqual(stats['backend'], 'default')
+        self.assertEqual(stats['namespaces']['config_tests.user'], {'misses': 1, 'hits': 2})
+        self.assertEqual(stats['namespaces']['config_tests.role'], {'misses': 1})
+        self.assertEqual(stats['namespaces']['config_tests'], {'invalidations': 1})
+        self.assertEqual(stats['totals'], {'misses': 2, 'hits': 2, 'invalidations': 1})
+        self.assertEqual(stats['hit_rate'], 50.0)
+
+        reset_cache_stats()
+        self.assertEqual(cache_stats()['totals'], {})
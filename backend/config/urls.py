@@ -9,6 +9,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from config.search import UnifiedSearchView
+
 # Swagger/OpenAPI schema
 schema_view = get_schema_view(
     openapi.Info(
@@ -42,7 +44,8 @@ urlpatterns = [
     path('api/', include('events.urls')),
     path('api/hr/', include('hr.urls')),
     path('api/crm/', include('crm.urls')),
-    # path('api/', include('analytics.urls')),  # Will be added later
+    path('api/', include('analytics.urls')),
+    path('api/search/', UnifiedSearchView.as_view(), name='search'),
 ]
 
 # Serve media files in development
@@ -5,3 +5,6 @@ class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
     verbose_name = 'Customer Relationship Management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:10
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# GIN index over the weighted company/contact tsvector of customers, and trigram
+# indexes on the UPPER() expressions icontains compares, so fragments of names,
+# e-mails and phone numbers are found without a scan. pg_trgm comes from
+# projects 0006.
+# PostgreSQL only; other backends fall back to icontains (config.search).
+
+
+def search_indexes():
+    # Must stay identical to SearchDocument.vector() of the Customer viewset
+    yield GinIndex(
+        SearchVector("company_name", weight="A", config="simple")
+        + SearchVector("contact_person", weight="B", config="simple"),
+        name="crm_customer_search_gin",
+    )
+    yield GinIndex(
+        OpClass(Upper("company_name"), name="gin_trgm_ops"),
+        name="crm_customer_company_trgm",
+    )
+    yield GinIndex(
+        OpClass(Upper("contact_person"), name="gin_trgm_ops"),
+        name="crm_customer_contact_trgm",
+    )
+    yield GinIndex(
+        OpClass(Upper("email"), name="gin_trgm_ops"), name="crm_customer_email_trgm"
+    )
+    yield GinIndex(
+        OpClass(Upper("phone"), name="gin_trgm_ops"), name="crm_customer_phone_trgm"
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("crm", "Customer")
+    for index in search_indexes():
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("crm", "Customer")
+    for index in search_indexes():
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crm", "0002_make_contact_fields_optional"),
+        ("projects", "0006_project_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
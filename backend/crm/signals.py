@@ -0,0 +1,8 @@
+"""Cache invalidation rules for crm models."""
+from config.cache import invalidate_on
+
+from .models import Customer, CustomerStage
+
+
+invalidate_on(Customer, lambda instance: ['crm.pipeline'])
+invalidate_on(CustomerStage, lambda instance: ['crm.pipeline'])
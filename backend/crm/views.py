@@ -16,6 +16,8 @@ from .serializers import (
     CustomerInteractionSerializer,
     CustomerExpenseSerializer
 )
+from config.cache import cache_response
+from config.search import FullTextSearchFilter, SearchDocument
 from .permissions import CanManageCRM, CanApproveExpense, IsAdminOrManagerOrAssigned
 
 
@@ -98,9 +100,12 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
     queryset = Customer.objects.all()
     permission_classes = [IsAdminOrManagerOrAssigned]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['current_stage', 'assigned_to', 'priority', 'status', 'industry', 'company_size', 'source']
-    search_fields = ['company_name', 'contact_person', 'email', 'phone']
+    search_document = SearchDocument(
+        {'company_name': 'A', 'contact_person': 'B'},
+        contains_fields=['company_name', 'contact_person', 'email', 'phone'],
+    )
     ordering_fields = ['company_name', 'created_at', 'estimated_value', 'updated_at']
     ordering = ['-created_at']
 
@@ -204,6 +209,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @cache_response('crm.pipeline', tags=['crm.pipeline'], scope='global')
     def pipeline(self, request):
         """Get pipeline statistics"""
         stages = CustomerStage.objects.filter(is_active=True).order_by('order')
@@ -2,13 +2,13 @@ from django.contrib import admin
 from .models import (
     Department, CareerPath, Employee, KPI, Evaluation, SalaryReview,
     PersonalReport, Plan, PlanGoal, PlanNote, PlanDailyProgress,
-    PlanUpdateHistory, Attendance, AttendanceSettings
+    PlanUpdateHistory, Attendance, AttendanceSettings, Holiday
 )
 
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
-    list_display = ['name', 'manager', 'created_at']
+    list_display = ['name', 'manager', 'working_weekdays', 'created_at']
     search_fields = ['name', 'description']
     list_filter = ['created_at']
 
@@ -31,7 +31,7 @@ class EmployeeAdmin(admin.ModelAdmin):
             'fields': ('user', 'employee_id', 'is_active')
         }),
         ('Job Info', {
-            'fields': ('department', 'position', 'career_level', 'contract_type', 'join_date')
+            'fields': ('department', 'manager', 'position', 'career_level', 'contract_type', 'join_date')
         }),
         ('Salary Info', {
             'fields': ('current_salary', 'last_salary_review')
@@ -210,7 +210,7 @@ class AttendanceSettingsAdmin(admin.ModelAdmin):
             'fields': ('work_start_time', 'work_end_time', 'late_threshold_minutes')
         }),
         ('Settings', {
-            'fields': ('require_checkout', 'allow_remote_checkin', 'send_reminder_notifications')
+            'fields': ('require_checkout', 'allow_remote_checkin', 'send_reminder_notifications', 'max_concurrent_leave')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -225,3 +225,10 @@ class AttendanceSettingsAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         # Don't allow deleting settings
         return False
+
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'name']
+    search_fields = ['name', 'description']
+    date_hierarchy = 'date'
@@ -0,0 +1,319 @@
+"""
+Streaming attendance export.
+
+Rows are read with ``values_list(...).iterator()`` (user names come from the
+same JOIN), written into a small buffer and handed out in ~64 KB chunks, so
+memory stays flat no matter how many rows the range covers. The same
+generator feeds ``StreamingHttpResponse`` for direct downloads and the file
+written by background export jobs.
+
+Background jobs run on a daemon thread of the web worker, which a restart
+kills mid-job. ``fail_stale_exports`` marks such jobs failed (they can be
+retried) and ``delete_expired_exports`` removes old jobs with their files; the
+cleanup_attendance_exports command runs both.
+
+Under ASGI, Django reads a sync streaming iterator with ``sync_to_async(list)``,
+i.e. builds the whole body before sending it; ``stream_for`` hands ASGI
+requests an async iterator that produces one chunk at a time instead.
+"""
+import csv
+import io
+import json
+import logging
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendanceExport
+from .scope import ScopeResolver
+
+logger = logging.getLogger(__name__)
+
+ITERATOR_CHUNK_SIZE = 2000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# format -> (content type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+CSV_HEADER = [
+    'Date', 'User', 'Check In', 'Check Out', 'Total Hours', 'Status',
+    'Check In IP', 'Check In Device', 'Check In Location',
+    'Check Out IP', 'Check Out Device', 'Check Out Location'
+]
+
+EXPORT_FIELDS = [
+    'id', 'date', 'user_id', 'user__username', 'user__first_name', 'user__last_name',
+    'check_in_time', 'check_out_time', 'total_hours', 'status',
+    'check_in_ip', 'check_in_device_type', 'check_in_device_os', 'check_in_address', 'check_in_location',
+    'check_out_ip', 'check_out_device_type', 'check_out_device_os', 'check_out_address', 'check_out_location',
+]
+
+STATUS_LABELS = dict(Attendance.STATUS_CHOICES)
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def attendance_export_queryset(user, start_date=None, end_date=None, user_id=None):
+    """Attendance visible to ``user`` (same scoping as team_attendance), filtered and ordered for export."""
+    queryset = ScopeResolver(user).filter(Attendance.objects.all(), include_self=False, active_only=False)
+
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    start_date = _parse_date(start_date)
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    end_date = _parse_date(end_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+
+    return queryset.order_by('-date', '-check_in_time')
+
+
+def _export_records(queryset, stats=None):
+    for values in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        if stats is not None:
+            stats['rows'] += 1
+        yield dict(zip(EXPORT_FIELDS, values))
+
+
+def _full_name(record):
+    full_name = f"{record['user__first_name']} {record['user__last_name']}".strip()
+    return full_name or record['user__username']
+
+
+def _device(record, prefix):
+    device_type = record[f'{prefix}_device_type']
+    if not device_type:
+        return ''
+    return f"{device_type} - {record[f'{prefix}_device_os']}"
+
+
+def _csv_row(record):
+    return [
+        record['date'].strftime('%Y-%m-%d'),
+        _full_name(record),
+        record['check_in_time'].strftime('%H:%M:%S') if record['check_in_time'] else '',
+        record['check_out_time'].strftime('%H:%M:%S') if record['check_out_time'] else '',
+        record['total_hours'] or '',
+        STATUS_LABELS.get(record['status'], record['status']),
+        record['check_in_ip'] or '',
+        _device(record, 'check_in'),
+        record['check_in_address'] or record['check_in_location'] or '',
+        record['check_out_ip'] or '',
+        _device(record, 'check_out'),
+        record['check_out_address'] or record['check_out_location'] or '',
+    ]
+
+
+def _ndjson_row(record):
+    return {
+        'id': record['id'],
+        'date': record['date'].isoformat(),
+        'user_id': record['user_id'],
+        'user': _full_name(record),
+        'check_in_time': record['check_in_time'].isoformat() if record['check_in_time'] else None,
+        'check_out_time': record['check_out_time'].isoformat() if record['check_out_time'] else None,
+        'total_hours': float(record['total_hours']) if record['total_hours'] is not None else None,
+        'status': record['status'],
+        'check_in_ip': record['check_in_ip'],
+        'check_in_device': _device(record, 'check_in'),
+        'check_in_location': record['check_in_address'] or record['check_in_location'] or '',
+        'check_out_ip': record['check_out_ip'],
+        'check_out_device': _device(record, 'check_out'),
+        'check_out_location': record['check_out_address'] or record['check_out_location'] or '',
+    }
+
+
+def _csv_chunks(queryset, stats=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for record in _export_records(queryset, stats):
+        writer.writerow(_csv_row(record))
+        if buffer.tell() >= STREAM_CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(queryset, stats=None):
+    lines = []
+    size = 0
+    for record in _export_records(queryset, stats):
+        line = json.dumps(_ndjson_row(record), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+            size = 0
+    yield ''.join(lines).encode('utf-8')
+
+
+def _gzip(chunks):
+    # wbits=31 makes zlib write a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_attendance_export(queryset, export_format='csv', stats=None):
+    """
+    Yield the export as byte chunks in ``export_format`` (see EXPORT_FORMATS).
+
+    ``stats['rows']``, when given, counts the rows as they are written.
+    """
+    if export_format == 'ndjson':
+        return _ndjson_chunks(queryset, stats)
+    if export_format == 'csv.gz':
+        return _gzip(_csv_chunks(queryset, stats))
+    return _csv_chunks(queryset, stats)
+
+
+async def async_chunks(chunks):
+    """Async iterator over a sync chunk iterator, one chunk per trip to the sync thread."""
+    chunks = iter(chunks)
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, done)) is not done:
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def stream_for(request, chunks):
+    """``chunks`` in the form the server streams without buffering (async under ASGI)."""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return async_chunks(chunks)
+    return chunks
+
+
+def export_filename(export_format, when=None):
+    when = when or timezone.now()
+    return f"attendance_{when.strftime('%Y%m%d')}.{EXPORT_FORMATS[export_format][1]}"
+
+
+def run_attendance_export(job_id):
+    """Write the export file for a pending job and record the outcome on it."""
+    updated = AttendanceExport.objects.filter(id=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not updated:
+        return
+    job = AttendanceExport.objects.select_related('requested_by').get(id=job_id)
+    try:
+        queryset = attendance_export_queryset(job.requested_by, **job.filters)
+        stats = {'rows': 0}
+        with tempfile.TemporaryFile() as handle:
+            for chunk in stream_attendance_export(queryset, job.export_format, stats):
+                handle.write(chunk)
+            handle.seek(0)
+            job.file.save(export_filename(job.export_format, job.created_at), File(handle), save=False)
+        job.row_count = stats['rows']
+        job.status = 'completed'
+    except Exception as exc:
+        logger.exception('Attendance export %s failed', job_id)
+        job.status = 'failed'
+        job.error = str(exc)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'row_count', 'status', 'error', 'finished_at'])
+
+
+def _run_in_thread(job_id):
+    try:
+        run_attendance_export(job_id)
+    finally:
+        # The thread opened its own connections; don't leave them to the server
+        connections.close_all()
+
+
+def start_attendance_export(job):
+    """Run ``job`` on a background thread once the creating transaction commits."""
+    def start():
+        threading.Thread(
+            target=_run_in_thread, args=(job.id,), name=f'attendance-export-{job.id}', daemon=True
+        ).start()
+
+    transaction.on_commit(start)
+
+
+def retry_attendance_export(job, inline=False):
+    """
+    Put a failed job back in the queue and start it (in this thread when
+    ``inline``). Returns False when the job was not failed.
+    """
+    retried = AttendanceExport.objects.filter(id=job.id, status='failed').update(
+        status='pending', error='', started_at=None, finished_at=None
+    )
+    if not retried:
+        return False
+    if inline:
+        run_attendance_export(job.id)
+    else:
+        start_attendance_export(job)
+    return True
+
+
+def fail_stale_exports(older_than=None):
+    """
+    Mark jobs whose worker is gone as failed, so they can be retried.
+
+    A job still pending or running ``older_than`` (default
+    ATTENDANCE_EXPORT_STALE_MINUTES) after it was queued or started lost its
+    thread to a worker restart. Returns the ids of the jobs marked.
+    """
+    older_than = older_than or timedelta(minutes=settings.ATTENDANCE_EXPORT_STALE_MINUTES)
+    cutoff = timezone.now() - older_than
+    stale = AttendanceExport.objects.filter(status='running', started_at__lt=cutoff) | AttendanceExport.objects.filter(
+        status='pending', created_at__lt=cutoff
+    )
+    job_ids = list(stale.values_list('id', flat=True))
+    # The status condition leaves alone a job that finished meanwhile
+    AttendanceExport.objects.filter(id__in=job_ids, status__in=['pending', 'running']).update(
+        status='failed', error='The export was interrupted; retry it.', finished_at=timezone.now()
+    )
+    return job_ids
+
+
+def delete_expired_exports(older_than=None):
+    """
+    Delete finished jobs older than ``older_than`` (default
+    ATTENDANCE_EXPORT_RETENTION_DAYS) together with their files. Returns the count.
+    """
+    older_than = older_than or timedelta(days=settings.ATTENDANCE_EXPORT_RETENTION_DAYS)
+    expired = AttendanceExport.objects.filter(
+        status__in=['completed', 'failed'], finished_at__lt=timezone.now() - older_than
+    )
+    deleted = 0
+    for job in expired.only('id', 'file').iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
@@ -0,0 +1,196 @@
+"""
+Reporting hierarchy.
+
+Employee.manager points at a user, so walking a reporting line takes one query
+per level. ``EmployeeHierarchy`` stores its transitive closure instead: every
+(manager, report) pair with the number of levels between them, plus a depth-0
+row per person. "Is X under Y" is one lookup on the unique (ancestor,
+descendant) index, and a whole subtree is one range read on it.
+
+``set_manager`` moves a person, with everyone under them, to a new manager:
+the links from the old chain of managers into the subtree are deleted and the
+cross product of the new chain and the subtree is inserted, one statement
+each. Nodes are user ids because Employee.manager references users.
+Concurrent moves are serialized on the Employee rows of the people involved
+and everyone above them.
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from config.cache import invalidate_tags
+
+from .models import Employee, EmployeeHierarchy
+from .scope import scope_tag
+
+
+def is_under(user_id, manager_id):
+    """Whether ``user_id`` reports to ``manager_id``, directly or through others."""
+    return EmployeeHierarchy.objects.filter(ancestor_id=manager_id, descendant_id=user_id, depth__gt=0).exists()
+
+
+def _managers_of(user_id):
+    return EmployeeHierarchy.objects.filter(descendant_id=user_id, depth__gt=0).values('ancestor_id')
+
+
+def check_manager(user_id, manager_id):
+    """
+    Raise ValidationError (on ``manager``) when ``manager_id`` is ``user_id``
+    or reports to them, which would close a cycle.
+    """
+    if manager_id is not None and (
+        manager_id == user_id
+        or EmployeeHierarchy.objects.filter(ancestor_id=user_id, descendant_id=manager_id).exists()
+    ):
+        raise ValidationError({'manager': 'An employee cannot report to themselves or to someone under them.'})
+
+
+def _lock_reporting_lines(*user_ids):
+    """
+    Lock (select_for_update) the Employee rows of ``user_ids`` and of
+    everyone above them.
+
+    Two moves that could interleave badly always share one of these rows:
+    to close a cycle, each move's new manager must sit under the person the
+    other moves; to corrupt a subtree, one moved person must sit above the
+    other. The chains are read again after locking, since a move that held
+    the lock first may have changed them.
+    """
+    nodes = {user_id for user_id in user_ids if user_id}
+    locked = set()
+    while True:
+        wanted = nodes | set(
+            EmployeeHierarchy.objects.filter(descendant_id__in=nodes, depth__gt=0).values_list('ancestor_id', flat=True)
+        )
+        if wanted <= locked:
+            return
+        list(Employee.objects.select_for_update().filter(user_id__in=wanted - locked).order_by('user_id').values('pk'))
+        locked |= wanted
+
+
+def set_manager(user_id, manager_id):
+    """
+    Attach ``user_id`` and their subtree under ``manager_id`` (None detaches).
+
+    Raises ValidationError when the new manager reports to ``user_id``; forms
+    catch that earlier through Employee.clean, this is the last guard. Cached
+    scopes of the old and new managers above are invalidated.
+    """
+    with transaction.atomic():
+        _lock_reporting_lines(user_id, manager_id)
+        check_manager(user_id, manager_id)
+
+        EmployeeHierarchy.objects.bulk_create(
+            [EmployeeHierarchy(ancestor_id=node, descendant_id=node, depth=0) for node in {user_id, manager_id} if node],
+            ignore_conflicts=True,
+        )
+        affected = set(_managers_of(user_id).values_list('ancestor_id', flat=True))
+        EmployeeHierarchy.objects.filter(
+            descendant_id__in=EmployeeHierarchy.objects.filter(ancestor_id=user_id).values('descendant_id'),
+            ancestor_id__in=_managers_of(user_id),
+        ).delete()
+
+        if manager_id is not None:
+            table = connection.ops.quote_name(EmployeeHierarchy._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table} (ancestor_id, descendant_id, depth)
+                    SELECT chain.ancestor_id, subtree.descendant_id, chain.depth + subtree.depth + 1
+                    FROM {table} chain, {table} subtree
+                    WHERE chain.descendant_id = %s AND subtree.ancestor_id = %s
+                    """,
+                    [manager_id, user_id],
+                )
+            affected.update(_managers_of(user_id).values_list('ancestor_id', flat=True))
+
+    tags = [scope_tag(ancestor_id) for ancestor_id in affected]
+    invalidate_tags(*tags)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def rebuild_employee_hierarchy(batch_size=1000):
+    """Recreate the whole closure table from Employee.manager; returns the row count."""
+    parents = dict(Employee.objects.values_list('user_id', 'manager_id'))
+    nodes = set(parents) | {manager_id for manager_id in parents.values() if manager_id}
+    rows = []
+    for node in nodes:
+        rows.append(EmployeeHierarchy(ancestor_id=node, descendant_id=node, depth=0))
+        seen = {node}
+        ancestor, depth = parents.get(node), 1
+        # A cycle written behind the model's back stops the walk instead of looping
+        while ancestor and ancestor not in seen:
+            rows.append(EmployeeHierarchy(ancestor_id=ancestor, descendant_id=node, depth=depth))
+            seen.add(ancestor)
+            ancestor, depth = parents.get(ancestor), depth + 1
+
+    with transaction.atomic():
+        EmployeeHierarchy.objects.all().delete()
+        EmployeeHierarchy.objects.bulk_create(rows, batch_size=batch_size)
+    invalidate_tags(*[scope_tag(node) for node in nodes])
+    return len(rows)
+
+
+def build_org_chart(root_id, max_depth=None):
+    """
+    Nested reporting tree under ``root_id`` with headcounts, from one query.
+
+    ``headcount`` counts the active employees anywhere below a node, whatever
+    ``max_depth`` trims from the returned ``reports``. Returns None when
+    ``root_id`` is not part of the hierarchy.
+
+    Each node hangs under its depth-1 ancestor in the closure table rather
+    than under Employee.manager, so a manager changed behind the model's back
+    (``update()``, raw SQL) cannot point outside the tree read here.
+    """
+    parent = EmployeeHierarchy.objects.filter(descendant_id=OuterRef('descendant_id'), depth=1).values('ancestor_id')
+    rows = EmployeeHierarchy.objects.filter(ancestor_id=root_id).annotate(
+        parent_id=Subquery(parent[:1])
+    ).order_by(
+        'depth', 'descendant__first_name', 'descendant__last_name', 'descendant__username'
+    ).values_list(
+        'descendant_id', 'depth', 'descendant__username', 'descendant__first_name', 'descendant__last_name',
+        'descendant__employee_profile__employee_id', 'descendant__employee_profile__position',
+        'descendant__employee_profile__department__name', 'descendant__employee_profile__is_active',
+        'parent_id',
+    )
+
+    nodes = {}
+    order = []
+    for (user_id, depth, username, first_name, last_name, employee_id, position,
+         department, is_active, parent_id) in rows:
+        nodes[user_id] = {
+            'user_id': user_id,
+            'name': f"{first_name} {last_name}".strip() or username,
+            'employee_id': employee_id,
+            'position': position,
+            'department': department,
+            'is_active': bool(is_active),
+            'depth': depth,
+            'headcount': 0,
+            'reports': [],
+            '_parent_id': parent_id,
+        }
+        order.append(user_id)
+    if root_id not in nodes:
+        return None
+
+    # A closure table damaged by hand may still orphan a node: leave it (and
+    # its reports) out rather than fail the chart; rebuild_employee_hierarchy repairs it
+    placed = {root_id}
+    for user_id in order[1:]:
+        if nodes[user_id]['_parent_id'] in placed:
+            placed.add(user_id)
+    order = [user_id for user_id in order if user_id in placed]
+
+    # Children come after their manager (ordered by depth): count bottom-up, attach top-down
+    for user_id in reversed(order[1:]):
+        node = nodes[user_id]
+        nodes[node['_parent_id']]['headcount'] += node['headcount'] + node['is_active']
+    for user_id in order[1:]:
+        node = nodes[user_id]
+        if max_depth is None or node['depth'] <= max_depth:
+            nodes[node['_parent_id']]['reports'].append(node)
+    for node in nodes.values():
+        del node['_parent_id']
+    return nodes[root_id]
@@ -0,0 +1,168 @@
+"""
+Team leave calendar.
+
+Counts, for every day of a window, how many members of a team are on
+approved or pending leave, and flags the days where more people are out than
+``AttendanceSettings.max_concurrent_leave`` allows.
+
+Only requests overlapping the window are read. On PostgreSQL the overlap test
+is ``daterange(start_date, end_date, '[]') && window``, which the GiST index
+of migration 0013 answers in logarithmic time however much leave history
+accumulates. The per-day counts then come from a sweep over those intervals
+(difference arrays, one per working week in the team), so building the
+calendar is O(requests + days) instead of walking every request day by day.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.postgres.fields import DateRangeField
+from django.db import connection
+from django.db.models import F, Func, Value
+
+from .models import LeaveRequest
+from .work_calendar import get_work_calendar, normalize_weekdays
+
+ACTIVE_LEAVE_STATUSES = ['approved', 'pending']
+
+# Must stay identical to the indexed expression in migration 0013
+LEAVE_PERIOD = Func(
+    F('start_date'), F('end_date'), Value('[]'), function='daterange', output_field=DateRangeField()
+)
+
+
+def overlapping_leave(queryset, start_date, end_date):
+    """Narrow a LeaveRequest queryset to requests overlapping [start_date, end_date]."""
+    if connection.vendor == 'postgresql':
+        from django.db.backends.postgresql.psycopg_any import DateRange
+        return queryset.alias(period=LEAVE_PERIOD).filter(period__overlap=DateRange(start_date, end_date, '[]'))
+    return queryset.filter(start_date__lte=end_date, end_date__gte=start_date)
+
+
+def _merge(intervals):
+    """Merge overlapping or adjacent [start, end] date intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _subtract(intervals, covered):
+    """Parts of merged ``intervals`` not covered by merged ``covered``."""
+    remaining = []
+    for start, end in intervals:
+        for covered_start, covered_end in covered:
+            if covered_end < start or covered_start > end:
+                continue
+            if covered_start > start:
+                remaining.append([start, covered_start - timedelta(days=1)])
+            start = covered_end + timedelta(days=1)
+            if start > end:
+                break
+        if start <= end:
+            remaining.append([start, end])
+    return remaining
+
+
+def build_team_leave_calendar(users, start_date, end_date, threshold):
+    """
+    Per-day leave counts for ``users`` (a User queryset) between two dates.
+
+    Each person counts once per day, on business days of their department's
+    work calendar; a day covered by both an approved and a pending request
+    counts as approved. A day is a conflict when approved + pending exceeds
+    ``threshold``. Uses two queries whatever the team size.
+    """
+    team = list(users.values_list('id', 'employee_profile__department__working_weekdays'))
+    weekdays_by_user = {user_id: normalize_weekdays(weekdays) for user_id, weekdays in team}
+
+    leave_rows = overlapping_leave(
+        LeaveRequest.objects.filter(user_id__in=users.values('id'), status__in=ACTIVE_LEAVE_STATUSES),
+        start_date,
+        end_date,
+    ).order_by().values_list(
+        'user_id', 'status', 'start_date', 'end_date', 'user__username', 'user__first_name', 'user__last_name'
+    )
+
+    intervals = defaultdict(lambda: {'approved': [], 'pending': []})
+    names = {}
+    for user_id, leave_status, leave_start, leave_end, username, first_name, last_name in leave_rows:
+        intervals[user_id][leave_status].append((max(leave_start, start_date), min(leave_end, end_date)))
+        names[user_id] = f"{first_name} {last_name}".strip() or username
+
+    size = (end_date - start_date).days + 1
+    group_sizes = defaultdict(int)
+    for weekdays in weekdays_by_user.values():
+        group_sizes[weekdays] += 1
+
+    # One pair of difference arrays per working week, so weekends and holidays
+    # are applied per department before the groups are added up
+    diffs = {weekdays: ([0] * (size + 1), [0] * (size + 1)) for weekdays in group_sizes}
+    periods = {}
+    for user_id, by_status in intervals.items():
+        approved = _merge(by_status['approved'])
+        pending = _subtract(_merge(by_status['pending']), approved)
+        periods[user_id] = (approved, pending)
+        approved_diff, pending_diff = diffs[weekdays_by_user[user_id]]
+        for diff, spans in ((approved_diff, approved), (pending_diff, pending)):
+            for span_start, span_end in spans:
+                diff[(span_start - start_date).days] += 1
+                diff[(span_end - start_date).days + 1] -= 1
+
+    scheduled = [0] * size
+    approved_counts = [0] * size
+    pending_counts = [0] * size
+    for weekdays, (approved_diff, pending_diff) in diffs.items():
+        calendar = get_work_calendar(weekdays)
+        running_approved = running_pending = 0
+        day = start_date
+        for index in range(size):
+            running_approved += approved_diff[index]
+            running_pending += pending_diff[index]
+            if calendar.is_business_day(day):
+                scheduled[index] += group_sizes[weekdays]
+                approved_counts[index] += running_approved
+                pending_counts[index] += running_pending
+            day += timedelta(days=1)
+
+    days = []
+    conflicts = []
+    for index in range(size):
+        day = start_date + timedelta(days=index)
+        out = approved_counts[index] + pending_counts[index]
+        days.append({
+            'date': day,
+            'scheduled': scheduled[index],
+            'approved': approved_counts[index],
+            'pending': pending_counts[index],
+            'available': scheduled[index] - out,
+        })
+        if out > threshold:
+            conflicts.append({
+                'date': day,
+                'out': out,
+                'people': _people_out(day, periods, weekdays_by_user, names),
+            })
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'team_size': len(team),
+        'threshold': threshold,
+        'days': days,
+        'conflicts': conflicts,
+    }
+
+
+def _people_out(day, periods, weekdays_by_user, names):
+    people = []
+    for user_id, (approved, pending) in periods.items():
+        if not get_work_calendar(weekdays_by_user[user_id]).is_business_day(day):
+            continue
+        for leave_status, spans in (('approved', approved), ('pending', pending)):
+            if any(span_start <= day <= span_end for span_start, span_end in spans):
+                people.append({'user_id': user_id, 'name': names[user_id], 'status': leave_status})
+                break
+    return sorted(people, key=lambda person: person['name'])
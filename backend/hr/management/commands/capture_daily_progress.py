@@ -1,10 +1,24 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from django.core.management.base import BaseCommand
+from django.db import connection
 from django.utils import timezone
 
-from hr.models import Plan, PlanDailyProgress
-from hr.services import build_daily_progress_snapshot
+from hr.models import Plan
+from hr.services import capture_daily_progress_batch
+
+
+class _QueryCounter:
+    """Execute wrapper that counts queries sent on the current connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
 
 
 class Command(BaseCommand):
@@ -16,6 +30,18 @@ class Command(BaseCommand):
             type=str,
             help='Target date in YYYY-MM-DD format. Default: today (local time).',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of plans processed per batch of grouped queries. Default: 500.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of batches processed concurrently, each on its own DB connection. Default: 1.',
+        )
 
     def handle(self, *args, **options):
         date_arg = options.get('date')
@@ -28,57 +54,56 @@ class Command(BaseCommand):
         else:
             target_date = timezone.localdate()
 
-        plans = Plan.objects.filter(
-            status='active',
-            period_start__lte=target_date,
-            period_end__gte=target_date,
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+
+        plan_ids = list(
+            Plan.objects.filter(
+                status='active',
+                period_start__lte=target_date,
+                period_end__gte=target_date,
+            ).order_by('id').values_list('id', flat=True)
         )
+        batches = [plan_ids[i:i + batch_size] for i in range(0, len(plan_ids), batch_size)]
 
-        created_count = 0
-        updated_count = 0
-
-        for plan in plans:
-            existing = PlanDailyProgress.objects.filter(plan=plan, date=target_date).first()
-            manual_inputs = {
-                'hours_worked': existing.hours_worked if existing else 0,
-                'blockers': existing.blockers if existing else '',
-                'next_plan': existing.next_plan if existing else '',
-                'work_results': existing.work_results if existing else '',
-            }
-            snapshot = build_daily_progress_snapshot(plan, target_date, manual_inputs=manual_inputs)
-
-            progress, created = PlanDailyProgress.objects.get_or_create(
-                plan=plan,
-                date=target_date,
-                defaults={
-                    'completed_goals_count': snapshot['completed_goals_count'],
-                    'hours_worked': snapshot['hours_worked'],
-                    'progress_notes': snapshot['progress_notes'],
-                    'work_results': snapshot['work_results'],
-                    'blockers': snapshot['blockers'],
-                    'next_plan': snapshot['next_plan'],
-                    'completion_percentage_snapshot': snapshot['completion_percentage_snapshot'],
-                },
-            )
+        def run_batch(batch_ids):
+            counter = _QueryCounter()
+            started = time.monotonic()
+            try:
+                with connection.execute_wrapper(counter):
+                    plans = Plan.objects.filter(id__in=batch_ids).only('id', 'completion_percentage')
+                    created, updated = capture_daily_progress_batch(plans, target_date)
+            finally:
+                if workers > 1:
+                    connection.close()
+            return len(batch_ids), created, updated, counter.count, time.monotonic() - started
+
+        started = time.monotonic()
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(run_batch, batches))
+        else:
+            results = [run_batch(batch_ids) for batch_ids in batches]
+        elapsed = time.monotonic() - started
+
+        created_count = sum(result[1] for result in results)
+        updated_count = sum(result[2] for result in results)
+        query_count = sum(result[3] for result in results)
 
-            if created:
-                created_count += 1
-            else:
-                progress.completed_goals_count = snapshot['completed_goals_count']
-                progress.progress_notes = snapshot['progress_notes']
-                progress.work_results = snapshot['work_results']
-                progress.completion_percentage_snapshot = snapshot['completion_percentage_snapshot']
-                progress.save(update_fields=[
-                    'completed_goals_count',
-                    'progress_notes',
-                    'work_results',
-                    'completion_percentage_snapshot',
-                    'updated_at',
-                ])
-                updated_count += 1
+        if options['verbosity'] >= 2:
+            for index, (size, created, updated, queries, seconds) in enumerate(results, start=1):
+                self.stdout.write(
+                    f'  batch {index}: plans={size}, created={created}, updated={updated}, '
+                    f'queries={queries}, time={seconds:.3f}s'
+                )
 
+        per_batch = sorted({result[3] for result in results})
+        self.stdout.write(
+            f'Batches={len(batches)} (size={batch_size}, workers={workers}), '
+            f'queries={query_count}, queries/batch={per_batch or [0]}, time={elapsed:.2f}s'
+        )
         self.stdout.write(
             self.style.SUCCESS(
-                f'Captured daily progress for {target_date}: created={created_count}, updated={updated_count}, plans={plans.count()}'
+                f'Captured daily progress for {target_date}: created={created_count}, updated={updated_count}, plans={len(plan_ids)}'
             )
         )
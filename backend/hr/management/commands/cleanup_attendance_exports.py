@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hr.exports import delete_expired_exports, fail_stale_exports, retry_attendance_export
+from hr.models import AttendanceExport
+
+
+class Command(BaseCommand):
+    help = (
+        'Fail attendance export jobs whose worker thread died (optionally running them again here) '
+        'and delete finished jobs and their files after the retention period. Run it from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-minutes',
+            type=int,
+            default=settings.ATTENDANCE_EXPORT_STALE_MINUTES,
+            help='Pending/running jobs older than this are failed. Default: ATTENDANCE_EXPORT_STALE_MINUTES.',
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=settings.ATTENDANCE_EXPORT_RETENTION_DAYS,
+            help='Finished jobs older than this are deleted. Default: ATTENDANCE_EXPORT_RETENTION_DAYS.',
+        )
+        parser.add_argument('--retry', action='store_true', help='Run the stale jobs again in this process.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stale_ids = fail_stale_exports(timedelta(minutes=max(1, options['stale_minutes'])))
+        retried = 0
+        if options['retry']:
+            for job in AttendanceExport.objects.filter(id__in=stale_ids, status='failed'):
+                retried += retry_attendance_export(job, inline=True)
+        deleted = delete_expired_exports(timedelta(days=max(1, options['retention_days'])))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Attendance exports: {len(stale_ids)} stale jobs failed, {retried} retried, '
+            f'{deleted} expired jobs deleted in {time.monotonic() - started:.1f}s'
+        ))
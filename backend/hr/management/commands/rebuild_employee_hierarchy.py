@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from hr.hierarchy import rebuild_employee_hierarchy
+
+
+class Command(BaseCommand):
+    help = (
+        'Recreate the EmployeeHierarchy closure table from Employee.manager. '
+        'Use to repair it after raw SQL or bulk updates of managers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT. Default: 1000.',
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_employee_hierarchy(batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(f'Employee hierarchy rebuilt: {rows} rows.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hr.models import Plan
+from hr.services import rebuild_plan_goal_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute Plan.goals_total / goals_completed and the completion percentage from the goals. '
+        'Use to repair drift after raw SQL or bulk goal changes; only drifted plans are written.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', type=int, action='append', dest='plan_ids', help='Only this plan id (repeatable).')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Plans checked per UPDATE and transaction. Default: 2000.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        plan_ids = options.get('plan_ids') or list(Plan.objects.order_by('id').values_list('id', flat=True))
+
+        repaired = 0
+        for offset in range(0, len(plan_ids), batch_size):
+            with transaction.atomic():
+                repaired += rebuild_plan_goal_counters(plan_ids[offset:offset + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Goal counters checked for {len(plan_ids)} plans: {repaired} repaired.'
+        ))
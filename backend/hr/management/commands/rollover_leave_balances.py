@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from hr.models import Employee
+from hr.services import rollover_leave_balances
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a year's leave balances for all active employees and carry over unused days "
+        "from the previous year, capped per leave type. Safe to run again: existing balances "
+        "are kept and only their carry-over is brought up to date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Year to create balances for. Default: the current year.')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only this user id (repeatable).')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Employees rolled over per transaction. Default: 1000.',
+        )
+
+    def handle(self, *args, **options):
+        year = options.get('year') or timezone.now().year
+        if not 2000 <= year <= 2100:
+            raise CommandError(f'Invalid --year {year}')
+        batch_size = max(1, options['batch_size'])
+
+        user_ids = options.get('user_ids') or list(
+            Employee.objects.filter(is_active=True, user__is_active=True)
+            .order_by('user_id').values_list('user_id', flat=True)
+        )
+
+        started = time.monotonic()
+        totals = {'created': 0, 'carried_over': 0, 'balances': 0}
+        for offset in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                counts = rollover_leave_balances(year, user_ids[offset:offset + batch_size])
+            for key, value in counts.items():
+                totals[key] += value
+        elapsed = time.monotonic() - started
+        rate = totals['balances'] / elapsed if elapsed else 0
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Leave balances for {year} rolled over for {len(user_ids)} employees: "
+            f"{totals['created']} created, {totals['carried_over']} carry-overs updated, "
+            f"{totals['balances'] - totals['created']} already existed "
+            f"({elapsed:.2f}s, {rate:.0f} balances/s)."
+        ))
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0008_add_leave_management"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="attendance",
+            name="hr_attendan_user_id_fc7e65_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="attendance",
+            name="hr_attendan_date_3a46d7_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="planupdatehistory",
+            name="hr_planupda_plan_id_8fac16_idx",
+        ),
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(
+                fields=["user", "-date", "-id"], name="hr_attendan_user_id_94150d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(
+                fields=["-date", "-id"], name="hr_attendan_date_3c590b_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="planupdatehistory",
+            index=models.Index(
+                fields=["plan", "-changed_at", "-id"],
+                name="hr_planupda_plan_id_007703_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="planupdatehistory",
+            index=models.Index(
+                fields=["-changed_at", "-id"], name="hr_planupda_changed_b5d0f0_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_summaries(apps, schema_editor):
+    Attendance = apps.get_model("hr", "Attendance")
+    AttendanceMonthlySummary = apps.get_model("hr", "AttendanceMonthlySummary")
+
+    rows = (
+        Attendance.objects.annotate(month=TruncMonth("date"))
+        .order_by()
+        .values("user_id", "month")
+        .annotate(
+            total_days=Count("id"),
+            present_days=Count("id", filter=Q(status__in=["present", "late"])),
+            absent_days=Count("id", filter=Q(status="absent")),
+            late_days=Count("id", filter=Q(is_late=True)),
+            wfh_days=Count("id", filter=Q(status="wfh")),
+            half_days=Count("id", filter=Q(status="half_day")),
+            hours_logged=Sum("total_hours"),
+            days_with_hours=Count("total_hours"),
+        )
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        hours = row.pop("hours_logged") or Decimal("0")
+        days_with_hours = row["days_with_hours"]
+        average = hours / days_with_hours if days_with_hours else Decimal("0")
+        batch.append(
+            AttendanceMonthlySummary(
+                total_hours=hours.quantize(Decimal("0.01")),
+                average_hours=average.quantize(Decimal("0.01")),
+                **row,
+            )
+        )
+        if len(batch) >= 2000:
+            AttendanceMonthlySummary.objects.bulk_create(batch)
+            batch = []
+    AttendanceMonthlySummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0010_attendance_export"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttendanceMonthlySummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(help_text="Ngày đầu tiên của tháng")),
+                ("total_days", models.PositiveIntegerField(default=0)),
+                (
+                    "present_days",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Có mặt (gồm cả đi muộn)"
+                    ),
+                ),
+                ("late_days", models.PositiveIntegerField(default=0)),
+                ("absent_days", models.PositiveIntegerField(default=0)),
+                ("wfh_days", models.PositiveIntegerField(default=0)),
+                ("half_days", models.PositiveIntegerField(default=0)),
+                (
+                    "days_with_hours",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Số ngày có ghi nhận giờ làm"
+                    ),
+                ),
+                (
+                    "total_hours",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=7),
+                ),
+                (
+                    "average_hours",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=4),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attendance_summaries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Attendance Monthly Summary",
+                "verbose_name_plural": "Attendance Monthly Summaries",
+                "ordering": ["-month", "user"],
+                "indexes": [
+                    models.Index(fields=["month"], name="hr_attendan_month_08a133_idx")
+                ],
+                "unique_together": {("user", "month")},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:05
+
+import hr.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0011_attendance_monthly_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Holiday",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("name", models.CharField(max_length=200)),
+                ("description", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Holiday",
+                "verbose_name_plural": "Holidays",
+                "ordering": ["date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="department",
+            name="working_weekdays",
+            field=models.JSONField(
+                default=hr.models.default_working_weekdays,
+                help_text="Các ngày làm việc trong tuần (0 = Thứ Hai ... 6 = Chủ Nhật)",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+# GiST index over each active request's inclusive date range, so team calendar
+# overlap queries (hr.leave_calendar.overlapping_leave) stay logarithmic.
+# PostgreSQL only; other backends fall back to plain date comparisons.
+LEAVE_PERIOD_INDEX = "hr_leaverequest_period_gist"
+
+
+def create_period_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {LEAVE_PERIOD_INDEX} ON hr_leaverequest "
+        "USING gist (daterange(start_date, end_date, '[]')) "
+        "WHERE status IN ('approved', 'pending')"
+    )
+
+
+def drop_period_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {LEAVE_PERIOD_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0012_work_calendar"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attendancesettings",
+            name="max_concurrent_leave",
+            field=models.PositiveIntegerField(
+                default=2,
+                help_text="Team members allowed on leave the same day before the team calendar warns of a conflict",
+            ),
+        ),
+        migrations.RunPython(create_period_index, drop_period_index),
+    ]
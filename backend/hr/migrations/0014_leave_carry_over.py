@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0013_leave_calendar"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="leavebalance",
+            name="carried_over_days",
+            field=models.DecimalField(
+                decimal_places=1,
+                default=0,
+                help_text="Unused days of the previous year included in total_days",
+                max_digits=5,
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="leavetype",
+            name="max_carry_over_days",
+            field=models.DecimalField(
+                decimal_places=1,
+                default=0,
+                help_text="Maximum unused days carried over into the next year",
+                max_digits=5,
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:17
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_goal_counters(apps, schema_editor):
+    Plan = apps.get_model("hr", "Plan")
+    PlanGoal = apps.get_model("hr", "PlanGoal")
+
+    def goal_count(**filters):
+        return Coalesce(
+            Subquery(
+                PlanGoal.objects.filter(plan=OuterRef("pk"), **filters)
+                .order_by()
+                .values("plan")
+                .annotate(total=Count("id"))
+                .values("total")
+            ),
+            0,
+            output_field=IntegerField(),
+        )
+
+    Plan.objects.update(
+        goals_total=goal_count(), goals_completed=goal_count(is_completed=True)
+    )
+    Plan.objects.filter(goals_total__gt=0).update(
+        completion_percentage=F("goals_completed") * 100 / F("goals_total")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0014_leave_carry_over"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="goals_completed",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Số mục tiêu đã hoàn thành, cập nhật cùng lúc với PlanGoal",
+            ),
+        ),
+        migrations.AddField(
+            model_name="plan",
+            name="goals_total",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Số mục tiêu, cập nhật cùng lúc với PlanGoal",
+            ),
+        ),
+        migrations.RunPython(backfill_goal_counters, migrations.RunPython.noop),
+    ]
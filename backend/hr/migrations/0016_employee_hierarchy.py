@@ -0,0 +1,89 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_hierarchy(apps, schema_editor):
+    Employee = apps.get_model("hr", "Employee")
+    EmployeeHierarchy = apps.get_model("hr", "EmployeeHierarchy")
+
+    parents = dict(Employee.objects.values_list("user_id", "manager_id"))
+    nodes = set(parents) | {manager_id for manager_id in parents.values() if manager_id}
+    rows = []
+    for node in nodes:
+        rows.append(EmployeeHierarchy(ancestor_id=node, descendant_id=node, depth=0))
+        seen = {node}
+        ancestor, depth = parents.get(node), 1
+        while ancestor and ancestor not in seen:
+            rows.append(
+                EmployeeHierarchy(ancestor_id=ancestor, descendant_id=node, depth=depth)
+            )
+            seen.add(ancestor)
+            ancestor, depth = parents.get(ancestor), depth + 1
+    EmployeeHierarchy.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0015_plan_goal_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmployeeHierarchy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "depth",
+                    models.PositiveSmallIntegerField(
+                        help_text="Số cấp quản lý giữa hai người (0 = chính mình)"
+                    ),
+                ),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "depth"],
+                        name="hr_hierarchy_desc_depth_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="employeehierarchy",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="hr_hierarchy_pair_unique"
+            ),
+        ),
+        migrations.RunPython(backfill_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:10
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# GIN index over the weighted title/description tsvector of plans.
+# PostgreSQL only; other backends fall back to icontains (config.search).
+
+
+def search_indexes():
+    # Must stay identical to SearchDocument.vector() of the Plan viewset
+    yield GinIndex(
+        SearchVector("title", weight="A", config="simple")
+        + SearchVector("description", weight="B", config="simple"),
+        name="hr_plan_search_gin",
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("hr", "Plan")
+    for index in search_indexes():
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("hr", "Plan")
+    for index in search_indexes():
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0016_employee_hierarchy"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
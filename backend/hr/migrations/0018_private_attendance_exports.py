@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:12
+
+import config.storage
+import hr.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def move_public_exports(apps, schema_editor):
+    """Move files written under MEDIA_ROOT to private storage with random names."""
+    AttendanceExport = apps.get_model("hr", "AttendanceExport")
+    for job in AttendanceExport.objects.exclude(file="").exclude(file__isnull=True):
+        public_name = job.file.name
+        if not default_storage.exists(public_name):
+            continue
+        with default_storage.open(public_name, "rb") as handle:
+            job.file.save(public_name.rsplit("/", 1)[-1], handle, save=False)
+        job.save(update_fields=["file"])
+        default_storage.delete(public_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0017_plan_search_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="attendanceexport",
+            name="file",
+            field=models.FileField(
+                blank=True,
+                help_text="Stored outside MEDIA_ROOT; only served by export_download",
+                null=True,
+                storage=config.storage.PrivateFileSystemStorage(),
+                upload_to=hr.models.attendance_export_path,
+            ),
+        ),
+        migrations.RunPython(move_public_exports, migrations.RunPython.noop),
+    ]
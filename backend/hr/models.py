@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+import uuid
 from datetime import datetime, timedelta
 
+from config.cache import LocalSnapshot
+from config.storage import private_storage
+
+
+def default_working_weekdays():
+    return [0, 1, 2, 3, 4]
+
 
 class Department(models.Model):
     """
@@ -18,6 +26,10 @@ class Department(models.Model):
         blank=True,
         related_name='managed_departments'
     )
+    working_weekdays = models.JSONField(
+        default=default_working_weekdays,
+        help_text='Các ngày làm việc trong tuần (0 = Thứ Hai ... 6 = Chủ Nhật)'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -27,6 +39,17 @@ class Department(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # A new manager also invalidates the cached scope of the previous one
+        instance._loaded_manager_id = instance.__dict__.get('manager_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_manager_id = self.manager_id
+
 
 class CareerPath(models.Model):
     """
@@ -157,6 +180,40 @@ class Employee(models.Model):
     def __str__(self):
         return f"{self.employee_id} - {self.user.get_full_name() or self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Moving an employee also invalidates the cached scopes of the previous team
+        instance._loaded_team = (instance.__dict__.get('department_id'), instance.__dict__.get('manager_id'))
+        return instance
+
+    def clean(self):
+        # Reject a reporting cycle as a form error, before save() would
+        from .hierarchy import check_manager
+        super().clean()
+        if self.user_id:
+            check_manager(self.user_id, self.manager_id)
+
+    def save(self, *args, **kwargs):
+        """Keep EmployeeHierarchy in step with the manager, in the same transaction"""
+        from .hierarchy import set_manager
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_team', None)
+        moved = (loaded is None or loaded[1] != self.manager_id) and (
+            update_fields is None or {'manager', 'manager_id'} & set(update_fields)
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                set_manager(self.user_id, self.manager_id)
+        self._loaded_team = (self.department_id, self.manager_id)
+
+    def delete(self, *args, **kwargs):
+        from .hierarchy import set_manager
+        with transaction.atomic():
+            set_manager(self.user_id, None)
+            return super().delete(*args, **kwargs)
+
     @property
     def years_of_service(self):
         """Tính số năm làm việc"""
@@ -165,6 +222,33 @@ class Employee(models.Model):
         return delta.days / 365.25
 
 
+class EmployeeHierarchy(models.Model):
+    """
+    Closure table of the reporting lines in Employee.manager: one row per
+    (manager, report) pair at any distance, plus a depth-0 row per person.
+    Maintained by hr.hierarchy whenever an employee's manager changes.
+    """
+    # Both columns lead one of the indexes below, so the default FK indexes are left out
+    ancestor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False
+    )
+    descendant = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False
+    )
+    depth = models.PositiveSmallIntegerField(help_text='Số cấp quản lý giữa hai người (0 = chính mình)')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='hr_hierarchy_pair_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='hr_hierarchy_desc_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
 class KPI(models.Model):
     """
     KPI hàng tháng cho nhân viên nội bộ
@@ -488,6 +572,16 @@ class Plan(models.Model):
         default=0,
         validators=[MinValueValidator(0), MaxValueValidator(100)]
     )
+    goals_total = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Số mục tiêu, cập nhật cùng lúc với PlanGoal'
+    )
+    goals_completed = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Số mục tiêu đã hoàn thành, cập nhật cùng lúc với PlanGoal'
+    )
 
     # Manager review
     manager_feedback = models.TextField(blank=True)
@@ -530,21 +624,38 @@ class Plan(models.Model):
         today = timezone.now().date()
         return self.period_start <= today <= self.period_end
 
+    # Written only by the goal write paths' atomic UPDATEs (see hr.services)
+    GOAL_DERIVED_FIELDS = ('goals_total', 'goals_completed', 'completion_percentage')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # A moved plan also invalidates the cached trees of its previous parent
+        instance._loaded_parent_plan_id = instance.__dict__.get('parent_plan_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # A full save of a loaded plan must not write back counters that goal
+        # writes may have moved since it was read
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.GOAL_DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_parent_plan_id = self.parent_plan_id
+
     @property
     def total_goals(self):
-        return self.goals.count()
+        return self.goals_total
 
     @property
     def completed_goals(self):
-        return self.goals.filter(is_completed=True).count()
+        return self.goals_completed
 
     def auto_calculate_completion(self):
-        """Auto-calculate completion percentage from goals"""
-        total = self.total_goals
-        if total > 0:
-            completed = self.completed_goals
-            self.completion_percentage = int((completed / total) * 100)
-            self.save()
+        """Reload the goal counters and completion percentage, which goal writes keep up to date"""
+        self.refresh_from_db(fields=list(self.GOAL_DERIVED_FIELDS))
 
 
 class PlanGoal(models.Model):
@@ -605,14 +716,42 @@ class PlanGoal(models.Model):
     def __str__(self):
         return f"{self.title} ({'✓' if self.is_completed else '○'})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What this goal currently contributes to its plan's counters
+        instance._counted_state = (instance.__dict__.get('plan_id'), instance.__dict__.get('is_completed'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Keep the plan's goal counters in step, in the same transaction"""
+        from .services import apply_goal_counter_change
+        update_fields = kwargs.get('update_fields')
+        counted = update_fields is None or {'plan', 'plan_id', 'is_completed'} & set(update_fields)
+        previous = None
+        if not self._state.adding:
+            previous = getattr(self, '_counted_state', None)
+            if previous is None or None in previous:
+                # Loaded without plan/is_completed: unknown contribution, left to rebuild_plan_goal_counters
+                counted = False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if counted:
+                apply_goal_counter_change(previous, (self.plan_id, self.is_completed))
+        self._counted_state = (self.plan_id, self.is_completed)
+
+    def delete(self, *args, **kwargs):
+        # Plan cascades skip this: the plan and its counters go away too
+        from .services import apply_goal_counter_change
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            apply_goal_counter_change((self.plan_id, self.is_completed), None)
+        return result
+
     def mark_completed(self):
         """Mark goal as completed"""
-        from django.utils import timezone
-        self.is_completed = True
-        self.completed_at = timezone.now()
-        self.save()
-        # Update parent plan completion
-        self.plan.auto_calculate_completion()
+        from .services import set_goal_completed
+        set_goal_completed(self, True)
 
 
 class PlanNote(models.Model):
@@ -752,7 +891,8 @@ class PlanUpdateHistory(models.Model):
     class Meta:
         ordering = ['-changed_at']
         indexes = [
-            models.Index(fields=['plan', '-changed_at']),
+            models.Index(fields=['plan', '-changed_at', '-id']),
+            models.Index(fields=['-changed_at', '-id']),
         ]
         verbose_name = 'Plan Update History'
         verbose_name_plural = 'Plan Update Histories'
@@ -942,8 +1082,9 @@ class Attendance(models.Model):
         ordering = ['-date', '-check_in_time']
         unique_together = ['user', 'date']
         indexes = [
-            models.Index(fields=['user', '-date']),
-            models.Index(fields=['date']),
+            # Keyset pagination orders by (-date, -id); both also serve plain date lookups
+            models.Index(fields=['user', '-date', '-id']),
+            models.Index(fields=['-date', '-id']),
         ]
         verbose_name = 'Attendance'
         verbose_name_plural = 'Attendances'
@@ -951,33 +1092,84 @@ class Attendance(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.date.strftime('%Y-%m-%d')} ({self.get_status_display()})"
 
+    # What a row contributes to AttendanceMonthlySummary
+    SUMMARY_SOURCE_FIELDS = ('user_id', 'date', 'status', 'is_late', 'total_hours')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row counted as, so save/delete can apply the difference
+        loaded = instance.__dict__
+        if all(field in loaded for field in cls.SUMMARY_SOURCE_FIELDS):
+            instance._loaded_summary = tuple(loaded[field] for field in cls.SUMMARY_SOURCE_FIELDS)
+        return instance
+
+    def _summary_before(self):
+        """The row as last loaded or saved, or None when that is unknown (e.g. deferred fields)."""
+        loaded = getattr(self, '_loaded_summary', None)
+        if loaded is None:
+            return None
+        return Attendance(**dict(zip(self.SUMMARY_SOURCE_FIELDS, loaded)))
+
     def save(self, *args, **kwargs):
         """Auto-calculate total hours when check-out is recorded"""
         if self.check_in_time and self.check_out_time:
             delta = self.check_out_time - self.check_in_time
             self.total_hours = round(delta.total_seconds() / 3600, 2)
 
-        # Auto-mark as late based on AttendanceSettings
-        if self.check_in_time:
-            settings = AttendanceSettings.get_settings()
-
-            # Calculate late threshold: work_start_time + late_threshold_minutes
-            work_start = settings.work_start_time
-            late_minutes = settings.late_threshold_minutes
+        self.apply_late_rule()
 
-            # Convert work_start_time to datetime on the same day as check_in
-            start_datetime = timezone.make_aware(
-                datetime.combine(self.check_in_time.date(), work_start)
-            )
-            late_threshold = start_datetime + timedelta(minutes=late_minutes)
+        # A new instance given the pk of an existing row overwrites it: its old counts are unknown
+        inserting = self._state.adding and self.pk is None
+        before = self._summary_before()
+        super().save(*args, **kwargs)
 
-            # Check if user is late
-            if self.check_in_time > late_threshold:
-                self.is_late = True
-                if self.status == 'present':
-                    self.status = 'late'
+        from .services import add_to_attendance_summary, mark_attendance_changed
+        if inserting:
+            add_to_attendance_summary(self.user_id, self.date, after=self)
+        elif before is None:
+            mark_attendance_changed(self.user_id, self.date)
+        elif (before.user_id, before.date.replace(day=1)) == (self.user_id, self.date.replace(day=1)):
+            add_to_attendance_summary(self.user_id, self.date, before=before, after=self)
+        else:
+            # Moved to another user or month: take it out of the old summary, add it to the new one
+            add_to_attendance_summary(before.user_id, before.date, before=before)
+            add_to_attendance_summary(self.user_id, self.date, after=self)
+        self._loaded_summary = tuple(getattr(self, field) for field in self.SUMMARY_SOURCE_FIELDS)
+
+    def delete(self, *args, **kwargs):
+        # Queryset/cascade deletes skip this (and stay fast); user deletes cascade to summaries anyway
+        from .services import add_to_attendance_summary, mark_attendance_changed
+        before = self._summary_before()
+        result = super().delete(*args, **kwargs)
+        if before is None:
+            mark_attendance_changed(self.user_id, self.date)
+        else:
+            add_to_attendance_summary(before.user_id, before.date, before=before)
+        self._loaded_summary = None
+        return result
+
+    def apply_late_rule(self):
+        """Auto-mark as late based on AttendanceSettings"""
+        if not self.check_in_time:
+            return
+        settings = AttendanceSettings.get_settings()
+
+        # Calculate late threshold: work_start_time + late_threshold_minutes
+        work_start = settings.work_start_time
+        late_minutes = settings.late_threshold_minutes
+
+        # Convert work_start_time to datetime on the same day as check_in
+        start_datetime = timezone.make_aware(
+            datetime.combine(self.check_in_time.date(), work_start)
+        )
+        late_threshold = start_datetime + timedelta(minutes=late_minutes)
 
-        super().save(*args, **kwargs)
+        # Check if user is late
+        if self.check_in_time > late_threshold:
+            self.is_late = True
+            if self.status == 'present':
+                self.status = 'late'
 
     @property
     def has_checked_in(self):
@@ -995,6 +1187,41 @@ class Attendance(models.Model):
         return self.has_checked_in and not self.has_checked_out
 
 
+class AttendanceMonthlySummary(models.Model):
+    """
+    Tổng hợp chấm công theo tháng cho từng người dùng.
+    Được cập nhật mỗi khi bản ghi Attendance thay đổi; dựng lại bằng lệnh rebuild_attendance_summaries.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='attendance_summaries'
+    )
+    month = models.DateField(help_text='Ngày đầu tiên của tháng')
+    total_days = models.PositiveIntegerField(default=0)
+    present_days = models.PositiveIntegerField(default=0, help_text='Có mặt (gồm cả đi muộn)')
+    late_days = models.PositiveIntegerField(default=0)
+    absent_days = models.PositiveIntegerField(default=0)
+    wfh_days = models.PositiveIntegerField(default=0)
+    half_days = models.PositiveIntegerField(default=0)
+    days_with_hours = models.PositiveIntegerField(default=0, help_text='Số ngày có ghi nhận giờ làm')
+    total_hours = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    average_hours = models.DecimalField(max_digits=4, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'user']
+        unique_together = ['user', 'month']
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+        verbose_name = 'Attendance Monthly Summary'
+        verbose_name_plural = 'Attendance Monthly Summaries'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.month.strftime('%Y-%m')}"
+
+
 class AttendanceSettings(models.Model):
     """
     Global settings for attendance system
@@ -1028,6 +1255,12 @@ class AttendanceSettings(models.Model):
         help_text='Send notifications to remind check-in/out'
     )
 
+    # Leave
+    max_concurrent_leave = models.PositiveIntegerField(
+        default=2,
+        help_text='Team members allowed on leave the same day before the team calendar warns of a conflict'
+    )
+
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -1041,9 +1274,100 @@ class AttendanceSettings(models.Model):
 
     @classmethod
     def get_settings(cls):
-        """Get or create attendance settings"""
-        settings, _ = cls.objects.get_or_create(pk=1)
-        return settings
+        """
+        Get or create attendance settings.
+        Kept in process memory and revalidated against the 'hr.attendance_settings'
+        version in the shared cache, so reads issue no database query.
+        """
+        return _settings_snapshot.get()
+
+
+def _load_attendance_settings():
+    settings, created = AttendanceSettings.objects.get_or_create(pk=1)
+    if created:
+        # Turn the string defaults (e.g. '09:00') into the stored time values
+        settings.refresh_from_db()
+    return settings
+
+
+_settings_snapshot = LocalSnapshot('hr.attendance_settings', _load_attendance_settings)
+
+
+def attendance_export_path(instance, filename):
+    """Unguessable name; downloads are named by hr.exports.export_filename"""
+    extension = filename.split('.', 1)[1] if '.' in filename else ''
+    return f'exports/attendance/{uuid.uuid4().hex}.{extension}'
+
+
+class AttendanceExport(models.Model):
+    """
+    Background attendance export ("prepare then download") for large ranges
+    """
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('csv.gz', 'CSV (gzip)'),
+        ('ndjson', 'NDJSON'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='attendance_exports',
+        help_text='User who requested the export'
+    )
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    filters = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Export filters (start_date, end_date, user_id)'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(
+        upload_to=attendance_export_path,
+        storage=private_storage,
+        null=True,
+        blank=True,
+        help_text='Stored outside MEDIA_ROOT; only served by export_download'
+    )
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Attendance Export'
+        verbose_name_plural = 'Attendance Exports'
+
+    def __str__(self):
+        return f"{self.requested_by.username} - {self.export_format} ({self.status})"
+
+
+class Holiday(models.Model):
+    """
+    Ngày nghỉ lễ của công ty, áp dụng cho mọi phòng ban
+    """
+    date = models.DateField(unique=True)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+        verbose_name = 'Holiday'
+        verbose_name_plural = 'Holidays'
+
+    def __str__(self):
+        return f"{self.date} - {self.name}"
 
 
 class LeaveType(models.Model):
@@ -1053,6 +1377,13 @@ class LeaveType(models.Model):
     name = models.CharField(max_length=100, unique=True, help_text='Leave type name')
     code = models.CharField(max_length=20, unique=True, help_text='Unique code')
     default_days_per_year = models.IntegerField(default=0, help_text='Default days allocated per year')
+    max_carry_over_days = models.DecimalField(
+        max_digits=5,
+        decimal_places=1,
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text='Maximum unused days carried over into the next year'
+    )
     requires_approval = models.BooleanField(default=True, help_text='Requires manager approval')
     is_paid = models.BooleanField(default=True, help_text='Is this a paid leave')
     description = models.TextField(blank=True)
@@ -1094,6 +1425,13 @@ class LeaveBalance(models.Model):
         validators=[MinValueValidator(0)],
         help_text='Days already used'
     )
+    carried_over_days = models.DecimalField(
+        max_digits=5,
+        decimal_places=1,
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text='Unused days of the previous year included in total_days'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -1162,51 +1500,41 @@ class LeaveRequest(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.leave_type.name} ({self.start_date} to {self.end_date})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
         """Auto-calculate days_count if not provided"""
         if not self.days_count:
             self.days_count = self._calculate_business_days()
-        super().save(*args, **kwargs)
 
-        # If approved, create attendance records and update balance
-        if self.status == 'approved' and self.approver:
-            self._create_attendance_records()
-            self._update_leave_balance()
+        # Only the transition to approved writes attendance and deducts balance,
+        # so saving an already approved request again does not deduct twice
+        newly_approved = (
+            self.status == 'approved' and self.approver_id
+            and getattr(self, '_loaded_status', None) != 'approved'
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if newly_approved:
+                self._create_attendance_records()
+                self._update_leave_balance()
+        self._loaded_status = self.status
 
     def _calculate_business_days(self):
-        """Calculate business days between start and end date (excluding weekends)"""
-        current = self.start_date
-        days = 0
-        while current <= self.end_date:
-            if current.weekday() < 5:  # Monday = 0, Sunday = 6
-                days += 1
-            current += timedelta(days=1)
-        return days
+        """Business days between start and end date on the requester's work calendar"""
+        from .work_calendar import get_user_work_calendar
+        return get_user_work_calendar(self.user_id).count(self.start_date, self.end_date)
 
     def _create_attendance_records(self):
         """Create attendance records for approved leave days"""
-        current = self.start_date
-        while current <= self.end_date:
-            if current.weekday() < 5:  # Only weekdays
-                Attendance.objects.update_or_create(
-                    user=self.user,
-                    date=current,
-                    defaults={
-                        'status': 'wfh' if self.leave_type.code == 'wfh' else 'absent',
-                        'notes': f"Leave: {self.leave_type.name} - {self.reason}",
-                        'check_in_location': 'On Leave',
-                        'check_out_location': 'On Leave'
-                    }
-                )
-            current += timedelta(days=1)
+        from .services import write_leave_attendance
+        write_leave_attendance([self])
 
     def _update_leave_balance(self):
         """Deduct from leave balance"""
-        balance, _ = LeaveBalance.objects.get_or_create(
-            user=self.user,
-            leave_type=self.leave_type,
-            year=self.start_date.year,
-            defaults={'total_days': self.leave_type.default_days_per_year}
-        )
-        balance.used_days += self.days_count
-        balance.save()
+        from .services import deduct_leave_balances
+        deduct_leave_balances([self])
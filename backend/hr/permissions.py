@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .hierarchy import is_under
+
 
 class IsAdminOrManager(permissions.BasePermission):
     """
@@ -123,6 +125,8 @@ class CanManageTeamAttendance(permissions.BasePermission):
 
         # Manager can access department attendance
         if request.user.role == 'manager':
+            if is_under(obj.user_id, request.user.id):
+                return True
             try:
                 employee = obj.user.employee_profile
                 if employee.department:
@@ -131,13 +135,9 @@ class CanManageTeamAttendance(permissions.BasePermission):
                 pass
             return True  # If no employee profile, allow manager
 
-        # Team Lead can access direct reports
+        # Team Lead can access everyone under them
         if request.user.role == 'team_lead':
-            try:
-                employee = obj.user.employee_profile
-                return employee.manager == request.user
-            except:
-                pass
+            return is_under(obj.user_id, request.user.id)
 
         # Employee can only access their own
         return obj.user == request.user
@@ -152,7 +152,7 @@ class CanManageLeaveRequests(permissions.BasePermission):
             return request.user and request.user.is_authenticated
 
         # Only admin/manager/team_lead can approve/reject
-        if view.action in ['process_request']:
+        if view.action in ['process_request', 'process_bulk']:
             return request.user.role in ['admin', 'manager', 'team_lead']
 
         return request.user and request.user.is_authenticated
@@ -164,20 +164,18 @@ class CanManageLeaveRequests(permissions.BasePermission):
 
         # Manager can manage department requests
         if request.user.role == 'manager':
+            if is_under(obj.user_id, request.user.id):
+                return True
             try:
                 employee = obj.user.employee_profile
-                if employee.department:
-                    return employee.department.manager == request.user
+                if employee.department and employee.department.manager == request.user:
+                    return True
             except:
                 pass
 
-        # Team Lead can manage direct reports
-        if request.user.role == 'team_lead':
-            try:
-                employee = obj.user.employee_profile
-                return employee.manager == request.user
-            except:
-                pass
+        # Team Lead can manage everyone under them
+        if request.user.role == 'team_lead' and is_under(obj.user_id, request.user.id):
+            return True
 
-        # User can view own requests
-        return obj.user == request.user
+        # User can view and edit own requests, but not approve them
+        return obj.user == request.user and view.action != 'process_request'
@@ -0,0 +1,117 @@
+"""
+Visibility scopes.
+
+Admins see everyone's records. Managers and team leads see their team: the
+active employees of the departments they manage plus everyone active under
+them in the reporting hierarchy (hr.hierarchy). Everyone else sees only their
+own. Views over historical records (attendance, leave) also keep the rows of
+team members who have since been deactivated, and a manager whose team is
+empty still sees their own rows there.
+
+``ScopeResolver`` works this out once per request and hands it out in two forms:
+
+- ``filter(queryset)`` narrows a queryset with a subquery on Employee, so the
+  database resolves the team and no id list travels through Python;
+- ``can_see(user_id)`` answers membership from the team's user ids, which are
+  cached across requests until a department changes manager or a team member
+  changes department or manager (tags ``scope:<user id>`` and
+  ``scope_department:<department id>``, bumped by hr.signals and by
+  ``hierarchy.set_manager`` for every manager up the chain).
+"""
+from django.db.models import Exists, Q
+
+from config.cache import get_or_set
+
+from .models import Department, Employee, EmployeeHierarchy
+
+TEAM_ROLES = ('manager', 'team_lead')
+
+
+def scope_tag(user_id):
+    return f'scope:{user_id}'
+
+
+def scope_department_tag(department_id):
+    return f'scope_department:{department_id}'
+
+
+class ScopeResolver:
+    """What one user may see of other users' records."""
+
+    def __init__(self, user):
+        self.user = user
+        self.unrestricted = user.role == 'admin' or user.is_superuser
+        self.has_team = not self.unrestricted and user.role in TEAM_ROLES
+        self._team_user_ids = None
+
+    @classmethod
+    def for_request(cls, request):
+        """The resolver of ``request.user``, built once per request."""
+        resolver = getattr(request, '_scope_resolver', None)
+        if resolver is None or resolver.user != request.user:
+            resolver = cls(request.user)
+            request._scope_resolver = resolver
+        return resolver
+
+    def team_subquery(self, active_only=True):
+        """User ids of the team as an Employee subquery (empty without a team role)."""
+        if not self.has_team:
+            return Employee.objects.none().values('user_id')
+        reports = EmployeeHierarchy.objects.filter(ancestor=self.user, depth__gt=0).values('descendant_id')
+        team = Employee.objects.filter(Q(department__manager=self.user) | Q(user_id__in=reports))
+        if active_only:
+            team = team.filter(is_active=True)
+        return team.values('user_id')
+
+    def filter(self, queryset, field='user', include_self=True, active_only=True):
+        """
+        Narrow ``queryset`` to the records of visible users.
+
+        ``field`` is the lookup holding the user (``'pk'`` for a User queryset).
+        Team roles see their own records with ``include_self``, and otherwise
+        only while their team is empty; users without a team always see their
+        own. ``active_only=False`` keeps team members who have been
+        deactivated, for historical records.
+        """
+        if self.unrestricted:
+            return queryset
+        own = Q(**{field: self.user.pk})
+        if not self.has_team:
+            return queryset.filter(own)
+        team = self.team_subquery(active_only=active_only)
+        if not include_self:
+            own &= ~Exists(team)
+        return queryset.filter(Q(**{f'{field}__in': team}) | own)
+
+    def managed_department_ids(self):
+        if not self.has_team:
+            return []
+        return get_or_set(
+            'hr.scope',
+            lambda: list(Department.objects.filter(manager=self.user).values_list('id', flat=True)),
+            tags=[scope_tag(self.user.pk)],
+            key_parts=('departments', self.user.pk),
+        )
+
+    def team_user_ids(self):
+        """User ids of the team (cached across requests)."""
+        if self._team_user_ids is None:
+            if not self.has_team:
+                self._team_user_ids = frozenset()
+            else:
+                tags = [scope_tag(self.user.pk)]
+                tags.extend(scope_department_tag(department_id) for department_id in self.managed_department_ids())
+                self._team_user_ids = frozenset(get_or_set(
+                    'hr.scope',
+                    lambda: list(self.team_subquery().values_list('user_id', flat=True)),
+                    tags=tags,
+                    key_parts=('team', self.user.pk),
+                ))
+        return self._team_user_ids
+
+    def can_see(self, user_id, include_self=True):
+        if self.unrestricted:
+            return True
+        if user_id == self.user.pk:
+            return include_self or not self.has_team
+        return user_id in self.team_user_ids()
@@ -1,11 +1,13 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from .models import (
     Department, CareerPath, Employee, KPI, Evaluation, SalaryReview,
     PersonalReport, Plan, PlanGoal, PlanNote, PlanDailyProgress,
-    PlanUpdateHistory, Attendance, AttendanceSettings,
-    LeaveType, LeaveBalance, LeaveRequest
+    PlanUpdateHistory, Attendance, AttendanceSettings, AttendanceExport,
+    Holiday, LeaveType, LeaveBalance, LeaveRequest
 )
 from accounts.serializers import UserSerializer
+from .services import get_department_employee_counts
 
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -14,11 +16,24 @@ class DepartmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Department
-        fields = ['id', 'name', 'description', 'manager', 'manager_details', 'employee_count', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'manager', 'manager_details', 'working_weekdays',
+                  'employee_count', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
+    def validate_working_weekdays(self, value):
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError('Provide a non-empty list of weekdays (0 = Monday ... 6 = Sunday)')
+        if any(not isinstance(day, int) or isinstance(day, bool) or not 0 <= day <= 6 for day in value):
+            raise serializers.ValidationError('Weekdays must be integers from 0 (Monday) to 6 (Sunday)')
+        return sorted(set(value))
+
     def get_employee_count(self, obj):
-        return obj.employees.filter(is_active=True).count()
+        # Shared by every row of a list via the serializer context
+        counts = self.context.get('_department_employee_counts')
+        if counts is None:
+            counts = get_department_employee_counts()
+            self.context['_department_employee_counts'] = counts
+        return counts.get(obj.id, 0)
 
 
 class CareerPathSerializer(serializers.ModelSerializer):
@@ -259,6 +274,8 @@ class PlanListSerializer(serializers.ModelSerializer):
     plan_type_display = serializers.CharField(source='get_plan_type_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     is_active_period = serializers.ReadOnlyField()
+    total_goals = serializers.IntegerField(source='goals_total', read_only=True)
+    completed_goals = serializers.IntegerField(source='goals_completed', read_only=True)
 
     def get_user_name(self, obj):
         full_name = obj.user.get_full_name()
@@ -269,7 +286,7 @@ class PlanListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'user_name', 'plan_type', 'plan_type_display',
             'period_start', 'period_end', 'title', 'status', 'status_display',
-            'completion_percentage', 'is_active_period', 'created_at'
+            'completion_percentage', 'total_goals', 'completed_goals', 'is_active_period', 'created_at'
         ]
         read_only_fields = ['completion_percentage', 'created_at']
 
@@ -280,8 +297,8 @@ class PlanSerializer(serializers.ModelSerializer):
     plan_type_display = serializers.CharField(source='get_plan_type_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     is_active_period = serializers.ReadOnlyField()
-    total_goals = serializers.ReadOnlyField()
-    completed_goals = serializers.ReadOnlyField()
+    total_goals = serializers.IntegerField(source='goals_total', read_only=True)
+    completed_goals = serializers.IntegerField(source='goals_completed', read_only=True)
 
     goals = PlanGoalSerializer(many=True, read_only=True)
     notes = PlanNoteSerializer(many=True, read_only=True)
@@ -461,6 +478,7 @@ class AttendanceStatsSerializer(serializers.Serializer):
     total_hours = serializers.DecimalField(max_digits=6, decimal_places=2)
     average_hours_per_day = serializers.DecimalField(max_digits=4, decimal_places=2)
     attendance_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    working_days = serializers.IntegerField()
 
 
 class AttendanceSettingsSerializer(serializers.ModelSerializer):
@@ -470,19 +488,50 @@ class AttendanceSettingsSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'work_start_time', 'work_end_time', 'late_threshold_minutes',
             'require_checkout', 'allow_remote_checkin', 'send_reminder_notifications',
+            'max_concurrent_leave',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
 
+class AttendanceExportSerializer(serializers.ModelSerializer):
+    """Serializer for background attendance export jobs"""
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AttendanceExport
+        fields = [
+            'id', 'export_format', 'filters', 'status', 'row_count', 'error',
+            'created_at', 'started_at', 'finished_at', 'status_url', 'download_url'
+        ]
+        read_only_fields = fields
+
+    def get_status_url(self, obj):
+        return reverse('attendance-export-status', kwargs={'job_id': obj.id}, request=self.context.get('request'))
+
+    def get_download_url(self, obj):
+        if obj.status != 'completed':
+            return None
+        return reverse('attendance-export-download', kwargs={'job_id': obj.id}, request=self.context.get('request'))
+
+
 # ===== Leave Management Serializers =====
 
+class HolidaySerializer(serializers.ModelSerializer):
+    """Serializer for company holidays"""
+    class Meta:
+        model = Holiday
+        fields = ['id', 'date', 'name', 'description', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+
+
 class LeaveTypeSerializer(serializers.ModelSerializer):
     """Serializer for LeaveType"""
     class Meta:
         model = LeaveType
         fields = [
-            'id', 'name', 'code', 'default_days_per_year',
+            'id', 'name', 'code', 'default_days_per_year', 'max_carry_over_days',
             'requires_approval', 'is_paid', 'description', 'is_active',
             'created_at', 'updated_at'
         ]
@@ -499,7 +548,7 @@ class LeaveBalanceSerializer(serializers.ModelSerializer):
         model = LeaveBalance
         fields = [
             'id', 'user', 'user_details', 'leave_type', 'leave_type_details',
-            'year', 'total_days', 'used_days', 'remaining_days',
+            'year', 'total_days', 'used_days', 'carried_over_days', 'remaining_days',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
@@ -1,7 +1,34 @@
+from collections import defaultdict
+from copy import copy
+from datetime import timedelta
+from decimal import Decimal
+
 from django.apps import apps
-from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When, Window
+)
+from django.db.models.functions import Coalesce, FirstValue, Greatest, Least, RowNumber, TruncMonth, TruncWeek
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from config.cache import get_or_set, invalidate_tags
+
+from .models import (
+    Attendance, AttendanceMonthlySummary, Employee, LeaveBalance, LeaveRequest, LeaveType,
+    Plan, PlanGoal, PlanNote, PlanDailyProgress
+)
+from .work_calendar import get_user_work_calendar, get_user_work_calendars, get_work_calendar
+
 
-from .models import PlanGoal, PlanNote
+DAILY_PROGRESS_UPDATE_FIELDS = [
+    'completed_goals_count',
+    'progress_notes',
+    'work_results',
+    'completion_percentage_snapshot',
+    'updated_at',
+]
 
 
 def _truncate_text(text, max_length=140):
@@ -12,36 +39,15 @@ def _truncate_text(text, max_length=140):
     return f"{text[:max_length].rstrip()}..."
 
 
-def build_daily_progress_snapshot(plan, target_date, manual_inputs=None):
-    """Build automatic daily progress summary from goals/tasks/notes for one plan and date."""
-    manual_inputs = manual_inputs or {}
-
-    completed_goals_qs = PlanGoal.objects.filter(
-        plan=plan,
-        is_completed=True,
-        completed_at__date=target_date,
-    ).order_by('completed_at')
-    completed_goal_titles = list(completed_goals_qs.values_list('title', flat=True))
-
-    notes_qs = PlanNote.objects.filter(
-        plan=plan,
-        created_at__date=target_date,
-    ).order_by('-created_at')
-
-    Task = apps.get_model('tasks', 'Task')
-    linked_tasks_qs = Task.objects.filter(plan_goals__plan=plan).distinct()
-
-    completed_tasks_qs = linked_tasks_qs.filter(
-        Q(completed_at__date=target_date)
-        | (Q(status__in=['approved', 'completed']) & Q(updated_at__date=target_date))
-    )
-    completed_task_titles = list(completed_tasks_qs.values_list('title', flat=True)[:10])
-
-    updated_tasks_qs = linked_tasks_qs.filter(updated_at__date=target_date)
-    updated_task_titles = list(updated_tasks_qs.values_list('title', flat=True)[:10])
+def _local_date(value):
+    if timezone.is_aware(value):
+        return timezone.localtime(value).date()
+    return value.date()
 
-    note_texts = [_truncate_text(note.note, 120) for note in notes_qs[:5] if note.note]
 
+def _compose_snapshot(plan, completed_goal_titles, completed_task_titles, updated_task_titles,
+                      note_texts, note_count, manual_inputs):
+    """Render the snapshot dict from already-collected goal/task/note data."""
     result_lines = []
     result_lines.append(f"Completed goals today: {len(completed_goal_titles)}")
     if completed_goal_titles:
@@ -51,7 +57,7 @@ def build_daily_progress_snapshot(plan, target_date, manual_inputs=None):
     if completed_task_titles:
         result_lines.append("Tasks done: " + ", ".join(completed_task_titles[:8]))
 
-    result_lines.append(f"Plan notes added today: {notes_qs.count()}")
+    result_lines.append(f"Plan notes added today: {note_count}")
     if note_texts:
         result_lines.append("Highlights: " + " | ".join(note_texts[:3]))
 
@@ -79,6 +85,1072 @@ def build_daily_progress_snapshot(plan, target_date, manual_inputs=None):
             'completed_goal_titles': completed_goal_titles[:20],
             'completed_task_titles': completed_task_titles[:20],
             'updated_task_titles': updated_task_titles[:20],
-            'note_count': notes_qs.count(),
+            'note_count': note_count,
         },
     }
+
+
+def build_daily_progress_snapshot(plan, target_date, manual_inputs=None):
+    """Build automatic daily progress summary from goals/tasks/notes for one plan and date."""
+    manual_inputs = manual_inputs or {}
+
+    completed_goals_qs = PlanGoal.objects.filter(
+        plan=plan,
+        is_completed=True,
+        completed_at__date=target_date,
+    ).order_by('completed_at')
+    completed_goal_titles = list(completed_goals_qs.values_list('title', flat=True))
+
+    notes_qs = PlanNote.objects.filter(
+        plan=plan,
+        created_at__date=target_date,
+    ).order_by('-created_at')
+
+    Task = apps.get_model('tasks', 'Task')
+    linked_tasks_qs = Task.objects.filter(plan_goals__plan=plan).distinct()
+
+    completed_tasks_qs = linked_tasks_qs.filter(
+        Q(completed_at__date=target_date)
+        | (Q(status__in=['approved', 'completed']) & Q(updated_at__date=target_date))
+    )
+    completed_task_titles = list(completed_tasks_qs.values_list('title', flat=True)[:10])
+
+    updated_tasks_qs = linked_tasks_qs.filter(updated_at__date=target_date)
+    updated_task_titles = list(updated_tasks_qs.values_list('title', flat=True)[:10])
+
+    note_texts = [_truncate_text(note.note, 120) for note in notes_qs[:5] if note.note]
+
+    return _compose_snapshot(
+        plan,
+        completed_goal_titles,
+        completed_task_titles,
+        updated_task_titles,
+        note_texts,
+        notes_qs.count(),
+        manual_inputs,
+    )
+
+
+def build_daily_progress_snapshots(plans, target_date, manual_inputs_by_plan=None):
+    """
+    Build snapshots for many plans at once.
+
+    Runs three grouped queries (goals, notes, linked tasks) regardless of how many
+    plans are passed in, and returns {plan_id: snapshot}.
+    """
+    manual_inputs_by_plan = manual_inputs_by_plan or {}
+    plans = list(plans)
+    plan_ids = [plan.id for plan in plans]
+    if not plan_ids:
+        return {}
+
+    goal_titles = defaultdict(list)
+    for plan_id, title in PlanGoal.objects.filter(
+        plan_id__in=plan_ids,
+        is_completed=True,
+        completed_at__date=target_date,
+    ).order_by('plan_id', 'completed_at').values_list('plan_id', 'title'):
+        goal_titles[plan_id].append(title)
+
+    note_bodies = defaultdict(list)
+    for plan_id, note in PlanNote.objects.filter(
+        plan_id__in=plan_ids,
+        created_at__date=target_date,
+    ).order_by('plan_id', '-created_at').values_list('plan_id', 'note'):
+        note_bodies[plan_id].append(note)
+
+    Task = apps.get_model('tasks', 'Task')
+    completed_titles = defaultdict(list)
+    updated_titles = defaultdict(list)
+    seen_tasks = set()
+    linked_rows = Task.objects.filter(
+        plan_goals__plan_id__in=plan_ids,
+    ).filter(
+        Q(completed_at__date=target_date) | Q(updated_at__date=target_date)
+    ).order_by('plan_goals__plan_id', '-created_at').values_list(
+        'plan_goals__plan_id', 'id', 'title', 'status', 'completed_at', 'updated_at',
+    )
+    for plan_id, task_id, title, task_status, completed_at, updated_at in linked_rows:
+        # A task can be linked from several goals of the same plan
+        if (plan_id, task_id) in seen_tasks:
+            continue
+        seen_tasks.add((plan_id, task_id))
+
+        updated_today = updated_at is not None and _local_date(updated_at) == target_date
+        completed_today = completed_at is not None and _local_date(completed_at) == target_date
+        if completed_today or (task_status in ['approved', 'completed'] and updated_today):
+            completed_titles[plan_id].append(title)
+        if updated_today:
+            updated_titles[plan_id].append(title)
+
+    snapshots = {}
+    for plan in plans:
+        notes = note_bodies.get(plan.id, [])
+        note_texts = [_truncate_text(note, 120) for note in notes[:5] if note]
+        snapshots[plan.id] = _compose_snapshot(
+            plan,
+            goal_titles.get(plan.id, []),
+            completed_titles.get(plan.id, [])[:10],
+            updated_titles.get(plan.id, [])[:10],
+            note_texts,
+            len(notes),
+            manual_inputs_by_plan.get(plan.id, {}),
+        )
+    return snapshots
+
+
+def capture_daily_progress_batch(plans, target_date):
+    """
+    Compute and upsert PlanDailyProgress rows for a batch of plans.
+
+    Uses one lookup for existing rows, the grouped snapshot queries and a single
+    bulk upsert, so the query count does not grow with the batch size.
+    Returns (created_count, updated_count).
+    """
+    plans = list(plans)
+    if not plans:
+        return 0, 0
+
+    existing = {
+        progress.plan_id: progress
+        for progress in PlanDailyProgress.objects.filter(
+            plan_id__in=[plan.id for plan in plans],
+            date=target_date,
+        ).only('id', 'plan_id', 'hours_worked', 'blockers', 'next_plan', 'work_results')
+    }
+    manual_inputs_by_plan = {
+        plan_id: {
+            'hours_worked': progress.hours_worked,
+            'blockers': progress.blockers,
+            'next_plan': progress.next_plan,
+            'work_results': progress.work_results,
+        }
+        for plan_id, progress in existing.items()
+    }
+    snapshots = build_daily_progress_snapshots(plans, target_date, manual_inputs_by_plan)
+
+    rows = []
+    for plan in plans:
+        snapshot = snapshots[plan.id]
+        rows.append(PlanDailyProgress(
+            plan_id=plan.id,
+            date=target_date,
+            completed_goals_count=snapshot['completed_goals_count'],
+            hours_worked=snapshot['hours_worked'],
+            progress_notes=snapshot['progress_notes'],
+            work_results=snapshot['work_results'],
+            blockers=snapshot['blockers'],
+            next_plan=snapshot['next_plan'],
+            completion_percentage_snapshot=snapshot['completion_percentage_snapshot'],
+        ))
+
+    PlanDailyProgress.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['plan', 'date'],
+        update_fields=DAILY_PROGRESS_UPDATE_FIELDS,
+    )
+
+    updated_count = len(existing)
+    return len(rows) - updated_count, updated_count
+
+
+# ===== Plan goal counters =====
+
+def _completion_percentage(goals_total, goals_completed):
+    """Integer completion percentage; plans without goals keep their current value."""
+    return Case(
+        When(GreaterThan(goals_total, 0), then=goals_completed * 100 / goals_total),
+        default=F('completion_percentage'),
+    )
+
+
+def adjust_plan_goal_counters(plan_id, total_delta=0, completed_delta=0):
+    """
+    Add goal count deltas to a plan and recompute its completion percentage in
+    one UPDATE, so concurrent goal writes cannot lose an increment.
+    """
+    if not (total_delta or completed_delta):
+        return
+    # Every SET expression reads the row as it was before the UPDATE
+    goals_total = F('goals_total') + total_delta
+    goals_completed = F('goals_completed') + completed_delta
+    Plan.objects.filter(id=plan_id).update(
+        goals_total=goals_total,
+        goals_completed=goals_completed,
+        completion_percentage=_completion_percentage(goals_total, goals_completed),
+        updated_at=timezone.now(),
+    )
+    invalidate_plan_trees([plan_id])
+
+
+def apply_goal_counter_change(previous, current):
+    """
+    Move a goal's contribution between plan counters. ``previous`` and
+    ``current`` are ``(plan_id, is_completed)``, or None before a create / after a delete.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    if previous is not None:
+        deltas[previous[0]][0] -= 1
+        deltas[previous[0]][1] -= int(previous[1])
+    if current is not None:
+        deltas[current[0]][0] += 1
+        deltas[current[0]][1] += int(current[1])
+    for plan_id, (total_delta, completed_delta) in deltas.items():
+        adjust_plan_goal_counters(plan_id, total_delta, completed_delta)
+
+
+def set_goal_completed(goal, completed):
+    """
+    Complete or reopen ``goal``. The conditional UPDATE only matches while the
+    goal is in the opposite state, so a double toggle counts once.
+    Returns True when the goal changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        updated = PlanGoal.objects.filter(id=goal.id, is_completed=not completed).update(
+            is_completed=completed,
+            completed_at=now if completed else None,
+            updated_at=now,
+        )
+        if updated:
+            adjust_plan_goal_counters(goal.plan_id, completed_delta=1 if completed else -1)
+    goal.refresh_from_db(fields=['is_completed', 'completed_at', 'updated_at'])
+    goal._counted_state = (goal.plan_id, goal.is_completed)
+    return bool(updated)
+
+
+def rebuild_plan_goal_counters(plan_ids=None):
+    """
+    Recompute goal counters and completion percentage from the goals, writing
+    only plans that drifted. Returns the number of plans repaired.
+    """
+    def goal_count(**filters):
+        return Coalesce(
+            Subquery(
+                PlanGoal.objects.filter(plan=OuterRef('pk'), **filters)
+                .order_by().values('plan').annotate(total=Count('id')).values('total')
+            ),
+            0,
+            output_field=IntegerField(),
+        )
+
+    goals_total = goal_count()
+    goals_completed = goal_count(is_completed=True)
+    plans = Plan.objects.all() if plan_ids is None else Plan.objects.filter(id__in=plan_ids)
+    return plans.filter(
+        ~Q(goals_total=goals_total) | ~Q(goals_completed=goals_completed)
+    ).update(
+        goals_total=goals_total,
+        goals_completed=goals_completed,
+        completion_percentage=_completion_percentage(goals_total, goals_completed),
+    )
+
+
+# ===== Plan roll-up =====
+
+# Yearly -> quarterly -> monthly -> weekly -> daily is 5 levels; the cap also stops parent cycles
+MAX_PLAN_TREE_DEPTH = 10
+
+
+def _plan_subtree_sql():
+    plan_table = connection.ops.quote_name(Plan._meta.db_table)
+    user_table = connection.ops.quote_name(get_user_model()._meta.db_table)
+    return f"""
+        WITH RECURSIVE subtree (id, depth) AS (
+            SELECT id, 0 FROM {plan_table} WHERE id = %s
+            UNION ALL
+            SELECT child.id, subtree.depth + 1
+            FROM {plan_table} child
+            JOIN subtree ON child.parent_plan_id = subtree.id
+            WHERE subtree.depth < %s
+        )
+        SELECT node.id, node.parent_plan_id, subtree.depth, node.title, node.plan_type, node.status,
+               node.period_start, node.period_end, node.completion_percentage,
+               node.goals_total, node.goals_completed, node.user_id,
+               account.username, account.first_name, account.last_name
+        FROM subtree
+        JOIN {plan_table} node ON node.id = subtree.id
+        JOIN {user_table} account ON account.id = node.user_id
+        ORDER BY subtree.depth, node.period_start, node.id
+    """
+
+
+def _plan_ancestors_sql():
+    plan_table = connection.ops.quote_name(Plan._meta.db_table)
+    return f"""
+        WITH RECURSIVE ancestors (id, parent_plan_id, depth) AS (
+            SELECT id, parent_plan_id, 0 FROM {plan_table} WHERE id = %s
+            UNION ALL
+            SELECT parent.id, parent.parent_plan_id, ancestors.depth + 1
+            FROM {plan_table} parent
+            JOIN ancestors ON parent.id = ancestors.parent_plan_id
+            WHERE ancestors.depth < %s
+        )
+        SELECT id FROM ancestors
+    """
+
+
+def get_plan_tree(plan_id):
+    """
+    The plan with all its descendants (via parent_plan) as a nested dict, from
+    one recursive query. Returns None when the plan does not exist.
+
+    ``rolled_up_completion`` is goal-weighted across the subtree: every goal
+    counts once, and a plan without goals counts as one unit at its own
+    completion percentage.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_plan_subtree_sql(), [plan_id, MAX_PLAN_TREE_DEPTH])
+        rows = cursor.fetchall()
+
+    nodes = {}
+    for (node_id, parent_id, depth, title, plan_type, plan_status, period_start, period_end, completion,
+         goals_total, goals_completed, user_id, username, first_name, last_name) in rows:
+        if node_id in nodes:
+            continue  # reached again through a parent cycle
+        nodes[node_id] = {
+            'id': node_id,
+            'parent_plan': parent_id if depth else None,
+            'depth': depth,
+            'title': title,
+            'plan_type': plan_type,
+            'status': plan_status,
+            'user': user_id,
+            'user_name': f"{first_name} {last_name}".strip() or username,
+            'period_start': period_start,
+            'period_end': period_end,
+            'completion_percentage': completion,
+            'goals_total': goals_total,
+            'goals_completed': goals_completed,
+            'children': [],
+            # Own contribution; subtree sums are added bottom-up below
+            '_units': goals_total or 1,
+            '_done': goals_completed if goals_total else completion / 100,
+        }
+    if plan_id not in nodes:
+        return None
+
+    # Rows come ordered by depth, so walking them backwards visits children before parents
+    for node in reversed(list(nodes.values())):
+        node['rolled_up_completion'] = int(node['_done'] * 100 / node['_units'])
+        parent = nodes.get(node['parent_plan'])
+        if parent is not None and parent['depth'] < node['depth']:
+            parent['children'].insert(0, node)
+            parent['_units'] += node['_units']
+            parent['_done'] += node['_done']
+    return _finish_plan_tree(nodes[plan_id])
+
+
+def _finish_plan_tree(node):
+    """Drop the working sums and count descendants, depth first."""
+    del node['_units'], node['_done']
+    count = 0
+    for child in node['children']:
+        _finish_plan_tree(child)
+        count += child['descendant_count'] + 1
+    node['descendant_count'] = count
+    return node
+
+
+def plan_tree_tags(plan_ids):
+    """Cache tags of every tree containing one of ``plan_ids``: the plans and all their ancestors."""
+    tags = set()
+    with connection.cursor() as cursor:
+        for plan_id in {plan_id for plan_id in plan_ids if plan_id}:
+            tags.add(f'plan_tree:{plan_id}')
+            cursor.execute(_plan_ancestors_sql(), [plan_id, MAX_PLAN_TREE_DEPTH])
+            tags.update(f'plan_tree:{ancestor_id}' for (ancestor_id,) in cursor.fetchall())
+    return sorted(tags)
+
+
+def invalidate_plan_trees(plan_ids):
+    """Drop cached trees that include any of ``plan_ids``, now and again after commit."""
+    tags = plan_tree_tags(plan_ids)
+    invalidate_tags(*tags)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+# ===== Plan progress series =====
+
+PROGRESS_SERIES_BUCKETS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def get_plan_progress_series(plan_ids, start_date, end_date, bucket='day'):
+    """
+    Daily progress of ``plan_ids`` between two dates as parallel arrays per plan.
+
+    With ``bucket`` 'week' or 'month' the rows are downsampled in SQL: one row
+    per plan and bucket (dated by the bucket start) carrying the completion
+    snapshot of the bucket's last entry and the sums of hours and completed
+    goals. One query whatever the bucket.
+    """
+    progress = PlanDailyProgress.objects.filter(
+        plan_id__in=plan_ids, date__gte=start_date, date__lte=end_date,
+    )
+    truncate = PROGRESS_SERIES_BUCKETS[bucket]
+    if truncate is None:
+        rows = progress.order_by('plan_id', 'date').values_list(
+            'plan_id', 'date', 'completion_percentage_snapshot', 'hours_worked', 'completed_goals_count',
+        )
+    else:
+        partition = [F('plan_id'), F('bucket')]
+        rows = progress.annotate(bucket=truncate('date')).annotate(
+            position=Window(RowNumber(), partition_by=partition, order_by=F('date').desc()),
+            last_completion=Window(
+                FirstValue('completion_percentage_snapshot'), partition_by=partition, order_by=F('date').desc(),
+            ),
+            bucket_hours=Window(Sum('hours_worked'), partition_by=partition),
+            bucket_goals=Window(Sum('completed_goals_count'), partition_by=partition),
+        ).filter(position=1).order_by('plan_id', 'bucket').values_list(
+            'plan_id', 'bucket', 'last_completion', 'bucket_hours', 'bucket_goals',
+        )
+
+    series = {
+        plan_id: {'plan': plan_id, 'dates': [], 'completion': [], 'hours': [], 'completed_goals': []}
+        for plan_id in plan_ids
+    }
+    for plan_id, day, completion, hours, completed_goals in rows:
+        columns = series[plan_id]
+        columns['dates'].append(day.isoformat())
+        columns['completion'].append(completion)
+        columns['hours'].append(float(hours or 0))
+        columns['completed_goals'].append(completed_goals or 0)
+    return list(series.values())
+
+
+def get_department_employee_counts():
+    """Active employee count per department id, from one grouped query (cached)."""
+    def load():
+        rows = Employee.objects.filter(
+            is_active=True,
+            department__isnull=False,
+        ).values('department').annotate(total=Count('id')).values_list('department', 'total')
+        return dict(rows)
+
+    return get_or_set('hr.department_employee_counts', load)
+
+
+def _attendance_aggregates(prefix='', base=None):
+    """
+    Conditional aggregates behind the attendance stats, for one pass over the rows.
+
+    ``prefix`` points at Attendance from another model (e.g. ``'attendances__'``
+    on User) and ``base`` restricts every aggregate, e.g. to a date range.
+    """
+    def when(**lookups):
+        condition = Q(**{f'{prefix}{lookup}': value for lookup, value in lookups.items()})
+        return condition & base if base is not None else condition
+
+    return {
+        'total_days': Count(f'{prefix}id', filter=base),
+        'present_days': Count(f'{prefix}id', filter=when(status__in=['present', 'late'])),
+        'absent_days': Count(f'{prefix}id', filter=when(status='absent')),
+        'late_days': Count(f'{prefix}id', filter=when(is_late=True)),
+        'wfh_days': Count(f'{prefix}id', filter=when(status='wfh')),
+        'half_days': Count(f'{prefix}id', filter=when(status='half_day')),
+        # Not named total_hours: the alias would shadow the field for days_with_hours
+        'hours_logged': Sum(f'{prefix}total_hours', filter=base),
+        'days_with_hours': Count(f'{prefix}total_hours', filter=base),
+    }
+
+
+SUMMARY_COUNTERS = [
+    'total_days', 'present_days', 'absent_days', 'late_days', 'wfh_days', 'half_days', 'days_with_hours',
+]
+
+
+def _finalize_attendance_stats(row, working_days):
+    """``working_days``: business days of the range on the user's work calendar."""
+    total_hours = row['hours_logged'] or 0
+    days_with_hours = row['days_with_hours']
+    # Average hours per day only counts days with hours logged
+    average_hours = (total_hours / days_with_hours) if days_with_hours > 0 else 0
+    attendance_rate = (row['present_days'] / working_days * 100) if working_days > 0 else 0
+
+    return {
+        'total_days': row['total_days'],
+        'present_days': row['present_days'],
+        'absent_days': row['absent_days'],
+        'late_days': row['late_days'],
+        'wfh_days': row['wfh_days'],
+        'half_days': row['half_days'],
+        'total_hours': round(total_hours, 2),
+        'average_hours_per_day': round(average_hours, 2),
+        'attendance_rate': round(attendance_rate, 2),
+        'working_days': working_days,
+    }
+
+
+def _summary_aggregates(prefix='', base=None):
+    """Same keys as _attendance_aggregates, summed from AttendanceMonthlySummary rows."""
+    aggregates = {
+        name: Coalesce(Sum(f'{prefix}{name}', filter=base), 0)
+        for name in SUMMARY_COUNTERS
+    }
+    aggregates['hours_logged'] = Sum(f'{prefix}total_hours', filter=base)
+    return aggregates
+
+
+def is_month_aligned(start_date, end_date):
+    """True when the range starts on the 1st and ends on the last day of a month."""
+    return start_date <= end_date and start_date.day == 1 and (end_date + timedelta(days=1)).day == 1
+
+
+def get_attendance_stats(user, start_date, end_date):
+    """
+    Attendance stats for one user between two dates (inclusive), from a single aggregate query.
+
+    Month-aligned ranges read the monthly summaries instead of raw attendance.
+    """
+    if is_month_aligned(start_date, end_date):
+        row = AttendanceMonthlySummary.objects.filter(
+            user=user,
+            month__gte=start_date,
+            month__lte=end_date,
+        ).aggregate(**_summary_aggregates())
+    else:
+        row = Attendance.objects.filter(
+            user=user,
+            date__gte=start_date,
+            date__lte=end_date,
+        ).aggregate(**_attendance_aggregates())
+    working_days = get_user_work_calendar(user.id).count(start_date, end_date)
+    return _finalize_attendance_stats(row, working_days)
+
+
+def get_team_attendance_stats(users, start_date, end_date):
+    """
+    Per-user attendance stats for a queryset of users, from one grouped query.
+
+    Users without attendance in the range are included with zero counts.
+    Returns a list of dicts ordered by name.
+    """
+    if is_month_aligned(start_date, end_date):
+        in_range = Q(attendance_summaries__month__gte=start_date, attendance_summaries__month__lte=end_date)
+        aggregates = _summary_aggregates('attendance_summaries__', in_range)
+    else:
+        in_range = Q(attendances__date__gte=start_date, attendances__date__lte=end_date)
+        aggregates = _attendance_aggregates('attendances__', in_range)
+    rows = users.annotate(
+        department_name=F('employee_profile__department__name'),
+        working_weekdays=F('employee_profile__department__working_weekdays'),
+        **aggregates,
+    ).order_by('first_name', 'last_name', 'username').values(
+        'id', 'username', 'first_name', 'last_name', 'department_name', 'working_weekdays',
+        *_attendance_aggregates(),
+    )
+
+    return [
+        {
+            'user': {
+                'id': row['id'],
+                'username': row['username'],
+                'full_name': f"{row['first_name']} {row['last_name']}".strip() or row['username'],
+            },
+            'department': row['department_name'],
+            **_finalize_attendance_stats(
+                row, get_work_calendar(row['working_weekdays']).count(start_date, end_date)
+            ),
+        }
+        for row in rows
+    ]
+
+
+# ===== Monthly attendance summaries =====
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _summary_from_row(row):
+    hours = row['hours_logged'] or Decimal('0')
+    days_with_hours = row['days_with_hours']
+    average = (hours / days_with_hours) if days_with_hours else Decimal('0')
+    return AttendanceMonthlySummary(
+        user_id=row['user_id'],
+        month=row['month'],
+        total_hours=hours.quantize(Decimal('0.01')),
+        average_hours=average.quantize(Decimal('0.01')),
+        **{name: row[name] for name in SUMMARY_COUNTERS},
+    )
+
+
+def _summary_values(summary):
+    return tuple(getattr(summary, name) for name in SUMMARY_COUNTERS) + (
+        summary.total_hours, summary.average_hours,
+    )
+
+
+def _sync_attendance_summaries(attendances, summaries):
+    """
+    Make ``summaries`` match what ``attendances`` aggregate to, per (user, month).
+
+    Only new or drifted rows are written, and summaries with no attendance
+    left are deleted. Returns counts of created/updated/deleted/unchanged rows.
+    """
+    computed = {}
+    rows = attendances.annotate(month=TruncMonth('date')).order_by().values('user_id', 'month').annotate(
+        **_attendance_aggregates()
+    )
+    for row in rows:
+        summary = _summary_from_row(row)
+        computed[(summary.user_id, summary.month)] = summary
+
+    existing = {
+        (summary.user_id, summary.month): summary
+        for summary in summaries.only('id', 'user_id', 'month', *SUMMARY_COUNTERS, 'total_hours', 'average_hours')
+    }
+
+    changed = [
+        summary for key, summary in computed.items()
+        if key not in existing or _summary_values(existing[key]) != _summary_values(summary)
+    ]
+    if changed:
+        AttendanceMonthlySummary.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['user', 'month'],
+            update_fields=SUMMARY_COUNTERS + ['total_hours', 'average_hours', 'updated_at'],
+        )
+    stale_ids = [summary.id for key, summary in existing.items() if key not in computed]
+    if stale_ids:
+        AttendanceMonthlySummary.objects.filter(id__in=stale_ids).delete()
+
+    created = sum(1 for summary in changed if (summary.user_id, summary.month) not in existing)
+    return {
+        'created': created,
+        'updated': len(changed) - created,
+        'deleted': len(stale_ids),
+        'unchanged': len(computed) - len(changed),
+    }
+
+
+def refresh_attendance_summaries(keys):
+    """Recompute the summaries for an iterable of (user_id, month start) keys."""
+    keys = set(keys)
+    if not keys:
+        return None
+    attendance_filter = Q()
+    summary_filter = Q()
+    for user_id, month in keys:
+        attendance_filter |= Q(user_id=user_id, date__gte=month, date__lt=_next_month(month))
+        summary_filter |= Q(user_id=user_id, month=month)
+    return _sync_attendance_summaries(
+        Attendance.objects.filter(attendance_filter),
+        AttendanceMonthlySummary.objects.filter(summary_filter),
+    )
+
+
+def mark_attendance_changed(user_id, day):
+    """Refresh the summary holding ``day`` for ``user_id``."""
+    refresh_attendance_summaries([(user_id, _month_start(day))])
+
+
+def _summary_counts(attendance):
+    """What one attendance row adds to its monthly summary (mirrors _attendance_aggregates)."""
+    return {
+        'total_days': 1,
+        'present_days': int(attendance.status in ('present', 'late')),
+        'absent_days': int(attendance.status == 'absent'),
+        'late_days': int(attendance.is_late),
+        'wfh_days': int(attendance.status == 'wfh'),
+        'half_days': int(attendance.status == 'half_day'),
+        'days_with_hours': int(attendance.total_hours is not None),
+        'total_hours': Decimal(str(attendance.total_hours or 0)),
+    }
+
+
+def _summary_increment_sql():
+    """
+    Statements adding one change to a summary row: an INSERT ... ON CONFLICT
+    (user, month) for changes that only add, and a plain UPDATE for those
+    that subtract, which must never insert negative counts.
+    """
+    meta = AttendanceMonthlySummary._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    insert_fields = [field for field in meta.concrete_fields if not field.primary_key]
+    added = [quote(meta.get_field(name).column) for name in SUMMARY_COUNTERS + ['total_hours']]
+    days, hours = quote(meta.get_field('days_with_hours').column), quote(meta.get_field('total_hours').column)
+    average_hours = quote(meta.get_field('average_hours').column)
+    updated_at = quote(meta.get_field('updated_at').column)
+
+    def average(days_delta, hours_delta):
+        # 1.0 * keeps the division decimal on backends that store whole hours as integers
+        return (
+            f'CASE WHEN {table}.{days} + {days_delta} > 0 '
+            f'THEN ROUND(1.0 * ({table}.{hours} + {hours_delta}) / ({table}.{days} + {days_delta}), 2) '
+            f'ELSE 0 END'
+        )
+
+    upsert = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in insert_fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(insert_fields))}) '
+        f'ON CONFLICT ({quote(meta.get_field("user").column)}, {quote(meta.get_field("month").column)}) '
+        f'DO UPDATE SET {", ".join(f"{column} = {table}.{column} + EXCLUDED.{column}" for column in added)}, '
+        f'{average_hours} = {average(f"EXCLUDED.{days}", f"EXCLUDED.{hours}")}, '
+        f'{updated_at} = EXCLUDED.{updated_at}'
+    )
+    update = (
+        f'UPDATE {table} SET {", ".join(f"{column} = {table}.{column} + %s" for column in added)}, '
+        f'{average_hours} = {average("%s", "%s")}, '
+        f'{updated_at} = %s '
+        f'WHERE {quote(meta.get_field("user").column)} = %s AND {quote(meta.get_field("month").column)} = %s'
+    )
+    return upsert, insert_fields, update
+
+
+def add_to_attendance_summary(user_id, day, before=None, after=None):
+    """
+    Move the summary holding ``day`` from ``before`` to ``after`` (attendance
+    rows; None for a row that did not / no longer exists) in one statement.
+
+    Cheaper than mark_attendance_changed, which re-aggregates the month, and
+    concurrent calls add up since the database applies each increment under
+    the row lock. It trusts the existing summary: a month without one starts
+    from this change alone, and a month whose last day is removed loses its
+    row (rebuild_attendance_summaries repairs drift).
+
+    Increments are only right while every Attendance write reaches the
+    summaries. Queryset ``update()``/``delete()``, ``bulk_create`` and raw SQL
+    skip Attendance.save/delete, so they must call
+    refresh_attendance_summaries for the (user, month) keys they touched.
+    """
+    before = _summary_counts(before) if before is not None else {}
+    after = _summary_counts(after) if after is not None else {}
+    delta = {name: after.get(name, 0) - before.get(name, 0) for name in SUMMARY_COUNTERS + ['total_hours']}
+    if not any(delta.values()):
+        return
+    days_with_hours = delta['days_with_hours']
+    summary = AttendanceMonthlySummary(
+        user_id=user_id,
+        month=_month_start(day),
+        average_hours=(
+            (delta['total_hours'] / days_with_hours).quantize(Decimal('0.01')) if days_with_hours > 0 else Decimal('0')
+        ),
+        **delta,
+    )
+
+    upsert, insert_fields, update = _summary_increment_sql()
+    meta = AttendanceMonthlySummary._meta
+    with connection.cursor() as cursor:
+        if all(value >= 0 for value in delta.values()):
+            cursor.execute(upsert, [
+                field.get_db_prep_save(field.pre_save(summary, add=True), connection)
+                for field in insert_fields
+            ])
+            return
+
+        def prep(name, value):
+            return meta.get_field(name).get_db_prep_save(value, connection)
+
+        cursor.execute(update, [
+            *[prep(name, delta[name]) for name in SUMMARY_COUNTERS + ['total_hours']],
+            days_with_hours, prep('total_hours', delta['total_hours']), days_with_hours,
+            prep('updated_at', meta.get_field('updated_at').pre_save(summary, add=False)),
+            prep('user', user_id), prep('month', summary.month),
+        ])
+    if delta['total_days'] < 0:
+        AttendanceMonthlySummary.objects.filter(user_id=user_id, month=summary.month, total_days=0).delete()
+
+
+def rebuild_attendance_summaries(user_ids, start_month=None, end_month=None):
+    """
+    Recompute the summaries of ``user_ids`` from raw attendance, optionally
+    limited to months in [start_month, end_month]. Returns the sync counts.
+    """
+    attendances = Attendance.objects.filter(user_id__in=user_ids)
+    summaries = AttendanceMonthlySummary.objects.filter(user_id__in=user_ids)
+    if start_month:
+        attendances = attendances.filter(date__gte=start_month)
+        summaries = summaries.filter(month__gte=start_month)
+    if end_month:
+        attendances = attendances.filter(date__lt=_next_month(end_month))
+        summaries = summaries.filter(month__lte=end_month)
+    return _sync_attendance_summaries(attendances, summaries)
+
+
+# ===== Check-in / check-out =====
+
+# Columns a check-in may overwrite on an existing row (e.g. one written by leave approval)
+CHECK_IN_UPDATE_FIELDS = [
+    'check_in_time', 'check_in_location', 'check_in_ip', 'check_in_latitude', 'check_in_longitude',
+    'check_in_accuracy', 'check_in_address', 'check_in_device_type', 'check_in_device_os',
+    'check_in_device_browser', 'check_in_user_agent', 'status', 'is_late', 'notes', 'updated_at',
+]
+
+
+def _check_in_upsert_sql():
+    """INSERT ... ON CONFLICT (user, date) that only fills rows nobody has checked in on yet."""
+    meta = Attendance._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    insert_fields = [field for field in meta.concrete_fields if not field.primary_key]
+    updates = ', '.join(
+        f'{quote(meta.get_field(name).column)} = EXCLUDED.{quote(meta.get_field(name).column)}'
+        for name in CHECK_IN_UPDATE_FIELDS
+    )
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in insert_fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(insert_fields))}) '
+        f'ON CONFLICT ({quote(meta.get_field("user").column)}, {quote(meta.get_field("date").column)}) '
+        f'DO UPDATE SET {updates} '
+        f'WHERE {table}.{quote(meta.get_field("check_in_time").column)} IS NULL '
+        f'RETURNING {", ".join(quote(field.column) for field in meta.concrete_fields)}'
+    )
+    return sql, insert_fields
+
+
+def record_check_in(user, values):
+    """
+    Check ``user`` in for today in one INSERT ... ON CONFLICT round trip, plus
+    one more that adds the day to the monthly summary.
+
+    ``values`` holds the check-in fields. Concurrent or repeated calls cannot
+    hit the (user, date) unique constraint: only the first one fills the row.
+    Returns ``(attendance, True)`` on success and ``(existing, False)`` when
+    the user had already checked in.
+    """
+    attendance = Attendance(user=user, date=timezone.now().date(), **values)
+    attendance.apply_late_rule()
+
+    sql, insert_fields = _check_in_upsert_sql()
+    params = [
+        field.get_db_prep_save(field.pre_save(attendance, add=True), connection)
+        for field in insert_fields
+    ]
+    rows = list(Attendance.objects.raw(sql, params))
+    if not rows:
+        existing = Attendance.objects.get(user=user, date=attendance.date)
+        existing.user = user
+        return existing, False
+
+    inserted = rows[0].created_at == attendance.created_at
+    attendance = rows[0]
+    attendance.user = user
+    if inserted:
+        add_to_attendance_summary(user.id, attendance.date, after=attendance)
+    else:
+        # Filled a row written earlier (e.g. by leave approval): what it counted as is gone
+        mark_attendance_changed(user.id, attendance.date)
+    return attendance, True
+
+
+def record_check_out(user, values, notes=''):
+    """
+    Check ``user`` out for today with a conditional UPDATE (no model save),
+    then add the hours to the monthly summary in place.
+
+    Returns ``(attendance, error)``; ``error`` is None on success.
+    """
+    attendance = Attendance.objects.filter(user=user, date=timezone.now().date()).first()
+    if not attendance or not attendance.has_checked_in:
+        return attendance, 'You must check in first before checking out'
+    attendance.user = user
+    if attendance.has_checked_out:
+        return attendance, 'You have already checked out today'
+
+    before = copy(attendance)
+    for field, value in values.items():
+        setattr(attendance, field, value)
+    if notes:
+        attendance.notes += '\n' + notes
+    delta = attendance.check_out_time - attendance.check_in_time
+    attendance.total_hours = round(delta.total_seconds() / 3600, 2)
+    attendance.updated_at = timezone.now()
+
+    # The check_out_time guard makes a concurrent second check-out a no-op
+    updated = Attendance.objects.filter(id=attendance.id, check_out_time__isnull=True).update(
+        notes=attendance.notes,
+        total_hours=attendance.total_hours,
+        updated_at=attendance.updated_at,
+        **values,
+    )
+    if not updated:
+        attendance.refresh_from_db()
+        return attendance, 'You have already checked out today'
+
+    add_to_attendance_summary(user.id, attendance.date, before=before, after=attendance)
+    return attendance, None
+
+
+# ===== Leave processing =====
+
+LEAVE_ATTENDANCE_UPDATE_FIELDS = ['status', 'notes', 'check_in_location', 'check_out_location', 'updated_at']
+
+
+def write_leave_attendance(leave_requests):
+    """
+    Mark every business day of ``leave_requests`` (on each requester's work
+    calendar) in attendance with one bulk upsert, then refresh the touched
+    monthly summaries. Returns the row count.
+    """
+    leave_requests = list(leave_requests)
+    calendars = get_user_work_calendars({leave_request.user_id for leave_request in leave_requests})
+    rows = {}
+    for leave_request in leave_requests:
+        leave_type = leave_request.leave_type
+        calendar = calendars[leave_request.user_id]
+        for day in calendar.business_days(leave_request.start_date, leave_request.end_date):
+            # Keyed by (user, date): one statement may not upsert the same row twice
+            rows[(leave_request.user_id, day)] = Attendance(
+                user_id=leave_request.user_id,
+                date=day,
+                status='wfh' if leave_type.code == 'wfh' else 'absent',
+                notes=f"Leave: {leave_type.name} - {leave_request.reason}",
+                check_in_location='On Leave',
+                check_out_location='On Leave',
+            )
+    if not rows:
+        return 0
+
+    Attendance.objects.bulk_create(
+        list(rows.values()),
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=LEAVE_ATTENDANCE_UPDATE_FIELDS,
+        batch_size=1000,
+    )
+    refresh_attendance_summaries({(user_id, _month_start(day)) for user_id, day in rows})
+    return len(rows)
+
+
+def deduct_leave_balances(leave_requests):
+    """
+    Add the days of ``leave_requests`` to ``LeaveBalance.used_days``.
+
+    Missing balances are created first; the deduction itself is a single
+    UPDATE ... SET used_days = used_days + CASE ..., so concurrent approvals
+    touching the same balance cannot overwrite each other.
+    """
+    days_by_key = defaultdict(Decimal)
+    default_days = {}
+    for leave_request in leave_requests:
+        key = (leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year)
+        days_by_key[key] += Decimal(str(leave_request.days_count))
+        default_days[key] = leave_request.leave_type.default_days_per_year
+    if not days_by_key:
+        return
+
+    LeaveBalance.objects.bulk_create(
+        [
+            LeaveBalance(user_id=key[0], leave_type_id=key[1], year=key[2], total_days=default_days[key])
+            for key in days_by_key
+        ],
+        ignore_conflicts=True,
+    )
+
+    key_filter = Q()
+    for user_id, leave_type_id, year in days_by_key:
+        key_filter |= Q(user_id=user_id, leave_type_id=leave_type_id, year=year)
+    balance_ids = {
+        (user_id, leave_type_id, year): balance_id
+        for balance_id, user_id, leave_type_id, year in LeaveBalance.objects.filter(key_filter).values_list(
+            'id', 'user_id', 'leave_type_id', 'year'
+        )
+    }
+    LeaveBalance.objects.filter(id__in=balance_ids.values()).update(
+        used_days=F('used_days') + Case(
+            *[When(id=balance_ids[key], then=Value(days)) for key, days in days_by_key.items()],
+            output_field=DecimalField(max_digits=5, decimal_places=1),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def rollover_leave_balances(year, user_ids):
+    """
+    Create the ``year`` leave balances of ``user_ids`` for every active leave
+    type and carry over the unused days of the previous year, capped per type
+    by ``LeaveType.max_carry_over_days``.
+
+    Missing balances are inserted in bulk; one UPDATE then sets the carry-over
+    of every balance from the previous year's remaining days, swapping out any
+    carry-over applied before. Running it again (e.g. after late approvals for
+    the previous year) only touches balances whose carry-over changed.
+    Returns {'created', 'carried_over', 'balances'}.
+    """
+    user_ids = list(user_ids)
+    leave_types = list(LeaveType.objects.filter(is_active=True).values_list('id', 'default_days_per_year'))
+    existing = set(
+        LeaveBalance.objects.filter(year=year, user_id__in=user_ids).values_list('user_id', 'leave_type_id')
+    )
+    missing = [
+        LeaveBalance(user_id=user_id, leave_type_id=leave_type_id, year=year, total_days=default_days)
+        for user_id in user_ids
+        for leave_type_id, default_days in leave_types
+        if (user_id, leave_type_id) not in existing
+    ]
+    LeaveBalance.objects.bulk_create(missing, ignore_conflicts=True, batch_size=1000)
+
+    days_field = DecimalField(max_digits=5, decimal_places=1)
+    carry_over = Coalesce(
+        Subquery(
+            LeaveBalance.objects.filter(
+                user_id=OuterRef('user_id'),
+                leave_type_id=OuterRef('leave_type_id'),
+                year=year - 1,
+            ).annotate(
+                carry=Least(
+                    Greatest(F('total_days') - F('used_days'), Value(Decimal('0')), output_field=days_field),
+                    F('leave_type__max_carry_over_days'),
+                    output_field=days_field,
+                )
+            ).values('carry')[:1]
+        ),
+        Value(Decimal('0')),
+        output_field=days_field,
+    )
+    # SET expressions all read the old row, so total_days drops the previous carry-over
+    carried_over = LeaveBalance.objects.filter(year=year, user_id__in=user_ids).exclude(
+        carried_over_days=carry_over
+    ).update(
+        carried_over_days=carry_over,
+        total_days=F('total_days') - F('carried_over_days') + carry_over,
+        updated_at=timezone.now(),
+    )
+    return {
+        'created': len(missing),
+        'carried_over': carried_over,
+        'balances': len(existing) + len(missing),
+    }
+
+
+def process_leave_requests(leave_requests, action, approver, rejection_reason=''):
+    """
+    Approve or reject pending leave requests together.
+
+    Uses one status UPDATE plus, for approvals, the set-based attendance and
+    balance writes, whatever the number of requests. Call inside a transaction
+    with the requests locked. Returns the requests with their new state.
+    """
+    leave_requests = list(leave_requests)
+    if not leave_requests:
+        return leave_requests
+
+    now = timezone.now()
+    changes = {
+        'status': 'approved' if action == 'approve' else 'rejected',
+        'approver': approver,
+        'approved_at': now,
+    }
+    if action == 'reject':
+        changes['rejection_reason'] = rejection_reason
+    LeaveRequest.objects.filter(id__in=[leave_request.id for leave_request in leave_requests]).update(
+        updated_at=now, **changes
+    )
+    for leave_request in leave_requests:
+        for field, value in changes.items():
+            setattr(leave_request, field, value)
+        leave_request.updated_at = now
+        leave_request._loaded_status = leave_request.status
+
+    if action == 'approve':
+        write_leave_attendance(leave_requests)
+        deduct_leave_balances(leave_requests)
+    return leave_requests
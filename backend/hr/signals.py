@@ -0,0 +1,48 @@
+"""Cache invalidation rules and hierarchy upkeep for hr models."""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_delete
+
+from config.cache import invalidate_on
+
+from .hierarchy import set_manager
+
+from .models import AttendanceSettings, Department, Employee, Holiday, Plan
+from .scope import scope_department_tag, scope_tag
+from .services import plan_tree_tags
+
+
+def _plan_tree_tags(instance):
+    return plan_tree_tags([instance.pk, instance.parent_plan_id, getattr(instance, '_loaded_parent_plan_id', None)])
+
+
+def _department_scope_tags(instance):
+    manager_ids = {instance.manager_id, getattr(instance, '_loaded_manager_id', None)}
+    return [scope_tag(manager_id) for manager_id in manager_ids if manager_id] + [scope_department_tag(instance.pk)]
+
+
+def _employee_scope_tags(instance):
+    loaded_department_id, loaded_manager_id = getattr(instance, '_loaded_team', (None, None))
+    department_ids = {instance.department_id, loaded_department_id}
+    manager_ids = {instance.manager_id, loaded_manager_id}
+    return (
+        [scope_department_tag(department_id) for department_id in department_ids if department_id]
+        + [scope_tag(manager_id) for manager_id in manager_ids if manager_id]
+    )
+
+
+invalidate_on(AttendanceSettings, lambda instance: ['hr.attendance_settings'])
+invalidate_on(Employee, lambda instance: ['hr.department_employee_counts'])
+invalidate_on(Department, lambda instance: ['hr.department_employee_counts'])
+invalidate_on(Employee, _employee_scope_tags)
+invalidate_on(Department, _department_scope_tags)
+invalidate_on(Holiday, lambda instance: ['hr.work_calendar'])
+invalidate_on(Plan, _plan_tree_tags)
+
+
+def _detach_reports(sender, instance, **kwargs):
+    # Deleting a user nulls Employee.manager with a bulk UPDATE that skips
+    # Employee.save, so cut their reports' links to the managers above first
+    set_manager(instance.pk, None)
+
+
+pre_delete.connect(_detach_reports, sender=get_user_model(), dispatch_uid='hr-hierarchy-detach-reports')
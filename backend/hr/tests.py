@@ -1,3 +1,1392 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from config.cache import invalidate_tags
+from config.tests import CacheTestCase
+from projects.models import Project
+from tasks.models import Task
+
+from .exports import async_chunks, attendance_export_queryset, run_attendance_export
+from .hierarchy import build_org_chart, is_under
+from .models import (
+    Attendance, AttendanceExport, AttendanceSettings, AttendanceMonthlySummary, Department, Employee,
+    EmployeeHierarchy, Holiday, LeaveBalance, LeaveRequest, LeaveType, Plan, PlanDailyProgress, PlanGoal, PlanNote
+)
+from .scope import ScopeResolver, scope_tag
+from .services import (
+    build_daily_progress_snapshot, build_daily_progress_snapshots, capture_daily_progress_batch, record_check_in,
+    record_check_out, refresh_attendance_summaries
+)
+from .work_calendar import WorkCalendar, get_work_calendar
+
+
+class AttendanceCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='cursor_admin', email='cursor_admin@example.com', password='password', role='admin',
+        )
+        users = [
+            User.objects.create_user(username=f'cursor_staff{index}', password='password', role='staff')
+            for index in range(3)
+        ]
+        # Several rows share each date, so paging has to fall back on the id tie-breaker
+        Attendance.objects.bulk_create([
+            Attendance(user=user, date=date(2024, 1, 1) + timedelta(days=day), status='present')
+            for day in range(5)
+            for user in users
+        ])
+        self.expected = list(Attendance.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_pages_forward_and_back_without_gaps(self):
+        url = '/api/hr/attendances/?pagination=cursor&page_size=4'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            pages.append(response)
+            url = response.data['next']
+
+        self.assertEqual([row for page in pages for row in self.ids(page)], self.expected)
+        self.assertIsNone(pages[0].data['previous'])
+
+        previous = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(self.ids(previous), self.expected[8:12])
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get('/api/hr/attendances/?page=1')
+
+        self.assertEqual(response.data['count'], len(self.expected))
+        self.assertEqual(set(response.data), {'count', 'next', 'previous', 'results'})
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get('/api/hr/attendances/?cursor=not-a-cursor')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AttendanceExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='export_admin', email='export_admin@example.com', password='password', role='admin',
+        )
+        self.staff = [
+            User.objects.create_user(
+                username=f'export_staff{index}', password='password', role='staff',
+                first_name='Nguyễn', last_name=f'Văn {index}',
+            )
+            for index in range(4)
+        ]
+        Attendance.objects.bulk_create([
+            Attendance(user=user, date=date(2024, 3, 1) + timedelta(days=day), status='present')
+            for day in range(10)
+            for user in self.staff
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, **params):
+        response = self.client.get('/api/hr/attendances/export_attendance/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_is_streamed_with_header_and_rows(self):
+        response, body = self.export(start_date='2024-03-05')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = body.decode('utf-8').splitlines()
+        self.assertTrue(lines[0].startswith('Date,User,Check In'))
+        self.assertEqual(len(lines), 1 + 6 * 4)
+        self.assertTrue(lines[1].startswith('2024-03-10,Nguyễn Văn'))
+
+    def test_gzip_and_ndjson_formats(self):
+        _, compressed = self.export(export_format='csv.gz')
+        self.assertEqual(len(gzip.decompress(compressed).decode('utf-8').splitlines()), 1 + 40)
+
+        response, body = self.export(export_format='ndjson', user_id=self.staff[0].id)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['user'], 'Nguyễn Văn 0')
+
+    def test_asgi_stream_is_produced_chunk_by_chunk(self):
+        produced = []
+
+        def chunks():
+            for index in range(3):
+                produced.append(index)
+                yield f'chunk{index}'.encode()
+
+        async def first_chunk():
+            stream = async_chunks(chunks())
+            chunk = await stream.__anext__()
+            await stream.aclose()
+            return chunk
+
+        self.assertEqual(async_to_sync(first_chunk)(), b'chunk0')
+        self.assertEqual(produced, [0])
+
+    async def test_export_under_asgi_streams_asynchronously(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.admin)))()
+        response = await AsyncClient().get(
+            '/api/hr/attendances/export_attendance/', {'user_id': self.staff[0].id},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.decode('utf-8').splitlines()), 1 + 10)
+
+    def test_rejects_unknown_format(self):
+        response = self.client.get('/api/hr/attendances/export_attendance/', {'export_format': 'xlsx'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        response = self.client.get('/api/hr/attendances/export_attendance/')
+        with self.assertNumQueries(1):
+            b''.join(response.streaming_content)
+
+    def test_background_job_prepares_then_downloads(self):
+        with tempfile.TemporaryDirectory() as media_root, tempfile.TemporaryDirectory() as private_root, \
+                override_settings(MEDIA_ROOT=media_root, PRIVATE_MEDIA_ROOT=private_root):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(
+                    '/api/hr/attendances/export_attendance/',
+                    {'export_format': 'csv.gz', 'end_date': '2024-03-02'},
+                    format='json',
+                )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(len(callbacks), 1)
+            job_id = response.data['id']
+
+            pending = self.client.get(response.data['status_url'])
+            self.assertEqual(pending.data['status'], 'pending')
+            self.assertIsNone(pending.data['download_url'])
+            not_ready = self.client.get(f'/api/hr/attendances/export-jobs/{job_id}/download/')
+            self.assertEqual(not_ready.status_code, 409)
+
+            # Run the job inline instead of on the background thread
+            run_attendance_export(job_id)
+
+            job = AttendanceExport.objects.get(id=job_id)
+            self.assertEqual((job.status, job.row_count), ('completed', 8))
+            # Nothing lands where nginx serves /media/, and the stored name is not guessable
+            self.assertEqual(os.listdir(media_root), [])
+            self.assertTrue(job.file.path.startswith(private_root))
+            self.assertNotIn('attendance_', job.file.name)
+            self.assertTrue(job.file.name.endswith('.csv.gz'))
+            done = self.client.get(response.data['status_url'])
+            download = self.client.get(done.data['download_url'])
+            self.assertEqual(download.status_code, 200)
+            body = gzip.decompress(b''.join(download.streaming_content)).decode('utf-8')
+            self.assertEqual(len(body.splitlines()), 1 + 8)
+            download.close()
+
+    def test_interrupted_jobs_are_failed_retried_and_expire(self):
+        with tempfile.TemporaryDirectory() as private_root, override_settings(PRIVATE_MEDIA_ROOT=private_root):
+            long_ago = timezone.now() - timedelta(hours=2)
+            running = AttendanceExport.objects.create(requested_by=self.admin, status='running')
+            AttendanceExport.objects.filter(id=running.id).update(started_at=long_ago)
+            lost = AttendanceExport.objects.create(requested_by=self.admin)
+            AttendanceExport.objects.filter(id=lost.id).update(created_at=long_ago)
+            fresh = AttendanceExport.objects.create(requested_by=self.admin)
+
+            out = io.StringIO()
+            call_command('cleanup_attendance_exports', stdout=out)
+            self.assertIn('2 stale jobs failed, 0 retried, 0 expired', out.getvalue())
+            self.assertEqual(AttendanceExport.objects.get(id=running.id).status, 'failed')
+            self.assertEqual(AttendanceExport.objects.get(id=fresh.id).status, 'pending')
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(f'/api/hr/attendances/export-jobs/{running.id}/retry/')
+            self.assertEqual((response.status_code, response.data['status']), (202, 'pending'))
+            self.assertEqual(len(callbacks), 1)
+            # Run the job inline instead of on the background thread
+            run_attendance_export(running.id)
+            job = AttendanceExport.objects.get(id=running.id)
+            self.assertEqual((job.status, job.error), ('completed', ''))
+            self.assertEqual(job.row_count, attendance_export_queryset(self.admin).count())
+            again = self.client.post(f'/api/hr/attendances/export-jobs/{running.id}/retry/')
+            self.assertEqual(again.status_code, 409)
+
+            path = job.file.path
+            AttendanceExport.objects.filter(id=job.id).update(finished_at=long_ago - timedelta(days=30))
+            call_command('cleanup_attendance_exports', stdout=io.StringIO())
+            self.assertFalse(AttendanceExport.objects.filter(id=job.id).exists())
+            self.assertFalse(os.path.exists(path))
+            # Failed less than the retention period ago: kept
+            self.assertTrue(AttendanceExport.objects.filter(id=lost.id).exists())
+
+    def test_jobs_are_private_to_their_requester(self):
+        job = AttendanceExport.objects.create(requested_by=self.admin)
+        manager = User.objects.create_user(username='export_manager', password='password', role='manager')
+        self.client.force_authenticate(manager)
+
+        response = self.client.get(f'/api/hr/attendances/export-jobs/{job.id}/')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AttendanceStatsTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user(username='stats_manager', password='password', role='manager')
+        self.department = Department.objects.create(name='Stats', manager=self.manager)
+        self.other_department = Department.objects.create(name='Other')
+        self.staff = []
+        for index in range(3):
+            staff = User.objects.create_user(username=f'stats_staff{index}', password='password', role='staff')
+            Employee.objects.create(
+                user=staff, employee_id=f'ST{index}', department=self.department,
+                position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+            )
+            self.staff.append(staff)
+        outsider = User.objects.create_user(username='stats_outsider', password='password', role='staff')
+        Employee.objects.create(
+            user=outsider, employee_id='ST9', department=self.other_department,
+            position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+        )
+
+        statuses = ['present', 'late', 'absent', 'wfh', 'half_day']
+        Attendance.objects.bulk_create([
+            Attendance(
+                user=user, date=date(2024, 4, 1) + timedelta(days=day), status=statuses[day % 5],
+                is_late=statuses[day % 5] == 'late', total_hours=Decimal('8.00') if day % 5 != 2 else None,
+            )
+            for day in range(10)
+            for user in self.staff[:2] + [outsider]
+        ])
+        call_command('rebuild_attendance_summaries', stdout=io.StringIO())
+        # Load the process-wide holiday snapshot outside the query counts
+        get_work_calendar()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_stats_uses_one_aggregate_query(self):
+        # User lookup, aggregate and the user's working week
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/hr/attendances/stats/',
+                {'user_id': self.staff[0].id, 'start_date': '2024-04-01', 'end_date': '2024-04-10'},
+            )
+
+        self.assertEqual(response.data['total_days'], 10)
+        self.assertEqual(response.data['present_days'], 4)
+        self.assertEqual(response.data['absent_days'], 2)
+        self.assertEqual(response.data['late_days'], 2)
+        self.assertEqual(response.data['half_days'], 2)
+        self.assertEqual(Decimal(response.data['total_hours']), Decimal('64'))
+        self.assertEqual(Decimal(response.data['average_hours_per_day']), Decimal('8'))
+        # 4 present days out of the 8 business days of 1-10 April 2024
+        self.assertEqual(response.data['working_days'], 8)
+        self.assertEqual(Decimal(response.data['attendance_rate']), Decimal('50'))
+
+    def test_monthly_report_stats(self):
+        response = self.client.get(
+            '/api/hr/attendances/monthly_report/', {'user_id': self.staff[1].id, 'year': 2024, 'month': 4},
+        )
+
+        self.assertEqual(response.data['stats']['total_days'], 10)
+        self.assertEqual(response.data['stats']['wfh_days'], 2)
+        self.assertEqual(len(response.data['attendances']), 10)
+
+    def test_month_aligned_ranges_read_the_summaries(self):
+        AttendanceMonthlySummary.objects.filter(user=self.staff[0]).update(wfh_days=7)
+        params = {'start_date': '2024-04-01', 'end_date': '2024-04-30'}
+
+        stats = self.client.get('/api/hr/attendances/stats/', {'user_id': self.staff[0].id, **params})
+        team = self.client.get('/api/hr/attendances/team_stats/', params)
+
+        self.assertEqual(stats.data['wfh_days'], 7)
+        self.assertEqual(stats.data['total_days'], 10)
+        wfh_by_user = {row['user']['id']: row['wfh_days'] for row in team.data['results']}
+        self.assertEqual(wfh_by_user, {self.staff[0].id: 7, self.staff[1].id: 2, self.staff[2].id: 0})
+
+    def test_team_stats_for_managed_department_in_one_query(self):
+        params = {'start_date': '2024-04-01', 'end_date': '2024-04-10'}
+        # The managed departments are a subquery of the grouped stats query
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/hr/attendances/team_stats/', params)
+
+        self.assertEqual(response.status_code, 200)
+        results = {row['user']['id']: row for row in response.data['results']}
+        self.assertEqual(set(results), {user.id for user in self.staff})
+        self.assertEqual(results[self.staff[0].id]['present_days'], 4)
+        self.assertEqual(results[self.staff[0].id]['department'], 'Stats')
+        # Employees without attendance in range are still listed
+        self.assertEqual(results[self.staff[2].id]['total_days'], 0)
+
+    def test_team_stats_rejects_unmanaged_department_and_staff(self):
+        response = self.client.get('/api/hr/attendances/team_stats/', {'department_id': self.other_department.id})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.staff[0])
+        response = self.client.get('/api/hr/attendances/team_stats/')
+        self.assertEqual(response.status_code, 403)
+
+
+class AttendanceMonthlySummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='summary_staff', password='password', role='staff')
+
+    def summary(self, month):
+        return AttendanceMonthlySummary.objects.filter(user=self.user, month=month).first()
+
+    def test_save_and_delete_keep_summary_current(self):
+        first = Attendance.objects.create(user=self.user, date=date(2024, 5, 2), status='present', total_hours=8)
+        Attendance.objects.create(user=self.user, date=date(2024, 5, 3), status='wfh', total_hours=6)
+
+        summary = self.summary(date(2024, 5, 1))
+        self.assertEqual((summary.total_days, summary.present_days, summary.wfh_days), (2, 1, 1))
+        self.assertEqual(summary.total_hours, Decimal('14.00'))
+        self.assertEqual(summary.average_hours, Decimal('7.00'))
+
+        # Moving a row to another month refreshes both months
+        first = Attendance.objects.get(id=first.id)
+        first.date = date(2024, 6, 3)
+        first.save()
+        self.assertEqual(self.summary(date(2024, 5, 1)).total_days, 1)
+        self.assertEqual(self.summary(date(2024, 6, 1)).present_days, 1)
+
+        first.delete()
+        self.assertIsNone(self.summary(date(2024, 6, 1)))
+
+    def test_edits_apply_the_difference_in_one_statement(self):
+        Attendance.objects.create(user=self.user, date=date(2024, 5, 2), status='present', total_hours=8)
+        Attendance.objects.create(user=self.user, date=date(2024, 5, 3), status='present', total_hours=6)
+        attendance = Attendance.objects.get(user=self.user, date=date(2024, 5, 3))
+        attendance.status = 'wfh'
+        attendance.total_hours = Decimal('7.5')
+
+        # The row UPDATE and the summary increment
+        with self.assertNumQueries(2):
+            attendance.save()
+
+        summary = self.summary(date(2024, 5, 1))
+        self.assertEqual((summary.total_days, summary.present_days, summary.wfh_days), (2, 1, 1))
+        self.assertEqual((summary.total_hours, summary.average_hours), (Decimal('15.50'), Decimal('7.75')))
+        result = refresh_attendance_summaries([(self.user.id, date(2024, 5, 1))])
+        self.assertEqual(result['unchanged'], 1)
+
+    def test_rows_loaded_without_their_counts_are_recounted(self):
+        Attendance.objects.create(user=self.user, date=date(2024, 5, 2), status='present')
+        attendance = Attendance.objects.only('id', 'user', 'date', 'notes').get(user=self.user)
+        Attendance.objects.filter(id=attendance.id).update(status='absent')
+
+        attendance.notes = 'Sick'
+        attendance.save()
+
+        summary = self.summary(date(2024, 5, 1))
+        self.assertEqual((summary.present_days, summary.absent_days), (0, 1))
+
+    def test_approved_leave_refreshes_each_month_once(self):
+        leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+        approver = User.objects.create_user(username='summary_manager', password='password', role='manager')
+
+        LeaveRequest.objects.create(
+            user=self.user, leave_type=leave_type, start_date=date(2024, 5, 27), end_date=date(2024, 6, 4),
+            reason='Trip', status='approved', approver=approver,
+        )
+
+        self.assertEqual(self.summary(date(2024, 5, 1)).absent_days, 5)
+        self.assertEqual(self.summary(date(2024, 6, 1)).absent_days, 2)
+
+    def test_rebuild_command_backfills_and_repairs_drift(self):
+        Attendance.objects.bulk_create([
+            Attendance(user=self.user, date=date(2024, 7, day), status='late', is_late=True)
+            for day in range(1, 6)
+        ])
+        out = io.StringIO()
+        call_command('rebuild_attendance_summaries', stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertEqual(self.summary(date(2024, 7, 1)).late_days, 5)
+
+        AttendanceMonthlySummary.objects.filter(user=self.user).update(late_days=1)
+        out = io.StringIO()
+        call_command('rebuild_attendance_summaries', '--from', '2024-07', '--to', '2024-07', stdout=out)
+        self.assertIn('1 updated', out.getvalue())
+        self.assertEqual(self.summary(date(2024, 7, 1)).late_days, 5)
+
+
+class AttendanceCheckInTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='checkin_staff', password='password', role='staff')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+
+    def test_check_in_writes_one_row_and_rejects_a_second_tap(self):
+        first = self.client.post('/api/hr/attendances/check_in/', {'location': 'Office'}, format='json')
+        second = self.client.post('/api/hr/attendances/check_in/', {'location': 'Home'}, format='json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['attendance']['user_details']['username'], 'checkin_staff')
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(second.data['attendance']['check_in_location'], 'Office')
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(AttendanceMonthlySummary.objects.get(user=self.user).total_days, 1)
+
+    def test_check_in_applies_late_rule_and_fills_leave_row(self):
+        settings = AttendanceSettings.get_settings()
+        settings.work_start_time = time(0, 0)
+        settings.late_threshold_minutes = 0
+        settings.save()
+        # The settings snapshot outlives this test's rolled back transaction
+        self.addCleanup(invalidate_tags, 'hr.attendance_settings')
+        Attendance.objects.create(user=self.user, date=self.today, status='absent', check_in_location='On Leave')
+
+        response = self.client.post('/api/hr/attendances/check_in/', {}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        attendance = Attendance.objects.get(user=self.user, date=self.today)
+        self.assertTrue(attendance.is_late)
+        self.assertEqual(attendance.status, 'late')
+        self.assertIsNotNone(attendance.check_in_time)
+        summary = AttendanceMonthlySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_days, summary.absent_days, summary.late_days), (1, 0, 1))
+
+    def test_idempotency_key_replays_the_first_response(self):
+        headers = {'Idempotency-Key': 'tap-1'}
+        first = self.client.post('/api/hr/attendances/check_in/', {}, format='json', headers=headers)
+        retry = self.client.post('/api/hr/attendances/check_in/', {}, format='json', headers=headers)
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+
+    def test_check_out_sets_hours_once(self):
+        self.client.post('/api/hr/attendances/check_in/', {}, format='json')
+
+        response = self.client.post('/api/hr/attendances/check_out/', {'notes': 'Done'}, format='json')
+        again = self.client.post('/api/hr/attendances/check_out/', {}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['attendance']['total_hours'])
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(again.data['error'], 'You have already checked out today')
+
+    def test_check_in_and_out_keep_the_summary_in_step_incrementally(self):
+        other_day = self.today.replace(day=2 if self.today.day == 1 else 1)
+        Attendance.objects.create(user=self.user, date=other_day, status='wfh', total_hours=Decimal('8.00'))
+        # Warm the settings snapshot, which outlives this test's rolled back transaction
+        AttendanceSettings.objects.get_or_create(pk=1)
+        invalidate_tags('hr.attendance_settings')
+        self.addCleanup(invalidate_tags, 'hr.attendance_settings')
+        AttendanceSettings.get_settings()
+        now = timezone.now()
+
+        # The check-in upsert and the summary increment
+        with self.assertNumQueries(2):
+            record_check_in(self.user, {'check_in_time': now - timedelta(hours=7, minutes=30)})
+        # Reading the row, the guarded update and the summary increment
+        with self.assertNumQueries(3):
+            _, error = record_check_out(self.user, {'check_out_time': now})
+        self.assertIsNone(error)
+
+        summary = AttendanceMonthlySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_days, summary.days_with_hours, summary.wfh_days), (2, 2, 1))
+        self.assertEqual((summary.total_hours, summary.average_hours), (Decimal('15.50'), Decimal('7.75')))
+        # The same as recomputing the month from scratch
+        result = refresh_attendance_summaries([(self.user.id, summary.month)])
+        self.assertEqual((result['updated'], result['unchanged']), (0, 1))
+
+    def test_check_out_without_check_in(self):
+        response = self.client.post('/api/hr/attendances/check_out/', {}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('attendance', response.data)
+
+
+class AttendanceSettingsCacheTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        AttendanceSettings.objects.get_or_create(pk=1)
+        invalidate_tags('hr.attendance_settings')
+        self.addCleanup(invalidate_tags, 'hr.attendance_settings')
+        self.admin = User.objects.create_superuser(
+            username='settings_admin', email='settings_admin@example.com', password='password', role='admin',
+        )
+
+    def settings_queries(self, queries):
+        return [query for query in queries if 'hr_attendancesettings' in query['sql']]
+
+    def test_attendance_save_reads_no_settings_rows(self):
+        AttendanceSettings.get_settings()
+
+        with CaptureQueriesContext(connection) as queries:
+            Attendance.objects.create(user=self.admin, date=date(2024, 8, 1), check_in_time=timezone.now())
+
+        self.assertEqual(self.settings_queries(queries), [])
+
+    def test_viewset_write_is_seen_by_the_next_read(self):
+        AttendanceSettings.get_settings()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch('/api/hr/attendance-settings/1/', {'late_threshold_minutes': 42}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(AttendanceSettings.get_settings().late_threshold_minutes, 42)
+        self.assertEqual(len(self.settings_queries(queries)), 1)
+        with CaptureQueriesContext(connection) as queries:
+            AttendanceSettings.get_settings()
+        self.assertEqual(self.settings_queries(queries), [])
+
+    def test_version_bump_from_another_process_reloads(self):
+        AttendanceSettings.get_settings()
+        # Another process writing the row without signals, then bumping the version
+        AttendanceSettings.objects.filter(pk=1).update(late_threshold_minutes=7)
+        self.assertNotEqual(AttendanceSettings.get_settings().late_threshold_minutes, 7)
+
+        invalidate_tags('hr.attendance_settings')
+
+        self.assertEqual(AttendanceSettings.get_settings().late_threshold_minutes, 7)
+
+
+class LeaveProcessingTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='leave_admin', email='leave_admin@example.com', password='password', role='admin',
+        )
+        self.leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+        self.staff = [
+            User.objects.create_user(username=f'leave_staff{index}', password='password', role='staff')
+            for index in range(20)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_requests(self, users, start=date(2024, 9, 2), end=date(2024, 9, 13)):
+        return [
+            LeaveRequest.objects.create(
+                user=user, leave_type=self.leave_type, start_date=start, end_date=end, reason='Holiday',
+            )
+            for user in users
+        ]
+
+    def process_bulk(self, requests, action='approve', **extra):
+        return self.client.post(
+            '/api/hr/leave-requests/process_bulk/',
+            {'ids': [leave_request.id for leave_request in requests], 'action': action, **extra},
+            format='json',
+        )
+
+    def test_bulk_approval_query_count_does_not_grow(self):
+        # One-day leaves keep the attendance upsert within SQLite's per-statement parameter limit
+        small = self.create_requests(self.staff[:2], end=date(2024, 9, 2))
+        large = self.create_requests(self.staff[2:], end=date(2024, 9, 2))
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.process_bulk(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.process_bulk(large)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['processed']), 18)
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(Attendance.objects.filter(status='absent', check_in_location='On Leave').count(), 20)
+        self.assertEqual(LeaveBalance.objects.get(user=self.staff[5]).used_days, 1)
+
+    def test_approval_adds_to_existing_balance_once(self):
+        LeaveBalance.objects.create(user=self.staff[0], leave_type=self.leave_type, year=2024, total_days=12, used_days=2)
+        [leave_request] = self.create_requests(self.staff[:1], end=date(2024, 9, 4))
+
+        self.client.post(f'/api/hr/leave-requests/{leave_request.id}/process_request/', {'action': 'approve'}, format='json')
+        # Saving an approved request again must not deduct a second time
+        leave_request = LeaveRequest.objects.get(id=leave_request.id)
+        leave_request.reason = 'Holiday (updated)'
+        leave_request.save()
+
+        self.assertEqual(LeaveBalance.objects.get(user=self.staff[0]).used_days, 5)
+        self.assertEqual(Attendance.objects.filter(user=self.staff[0]).count(), 3)
+
+    def test_bulk_rejection_skips_processed_requests(self):
+        pending, processed = self.create_requests(self.staff[:2])
+        LeaveRequest.objects.filter(id=processed.id).update(status='cancelled')
+
+        response = self.process_bulk([pending, processed], action='reject', rejection_reason='Busy sprint')
+
+        self.assertEqual(response.data['skipped'], [processed.id])
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, pending.rejection_reason, pending.approver), ('rejected', 'Busy sprint', self.admin))
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_bulk_requires_approver_role_and_valid_payload(self):
+        requests = self.create_requests(self.staff[:1])
+        self.assertEqual(self.process_bulk(requests, action='maybe').status_code, 400)
+
+        self.client.force_authenticate(self.staff[1])
+        self.assertEqual(self.process_bulk(requests).status_code, 403)
+
+
+class WorkCalendarTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Support', working_weekdays=[0, 1, 2, 3, 4, 5])
+        self.user = User.objects.create_user(username='calendar_staff', password='password', role='staff')
+        Employee.objects.create(
+            user=self.user, employee_id='WC1', department=self.department,
+            position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+        )
+        self.leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+
+    def test_count_matches_day_by_day_walk(self):
+        holidays = {date(2024, 1, 1), date(2024, 4, 30), date(2024, 5, 1), date(2024, 9, 2)}
+        calendar = WorkCalendar([0, 1, 2, 3, 4, 5], holidays, first_year=2024, last_year=2024)
+        # Ranges inside, across and entirely outside the indexed window
+        for start, end in [
+            (date(2024, 4, 29), date(2024, 5, 5)),
+            (date(2023, 12, 20), date(2024, 1, 10)),
+            (date(2024, 12, 25), date(2025, 2, 3)),
+            (date(2019, 3, 1), date(2030, 3, 1)),
+            (date(2022, 6, 1), date(2022, 6, 1)),
+        ]:
+            expected = sum(
+                1 for offset in range((end - start).days + 1)
+                if (start + timedelta(days=offset)).weekday() < 6
+                and start + timedelta(days=offset) not in holidays
+            )
+            self.assertEqual(calendar.count(start, end), expected, (start, end))
+            self.assertEqual(len(list(calendar.business_days(start, end))), expected)
+        self.assertEqual(calendar.count(date(2024, 5, 2), date(2024, 5, 1)), 0)
+
+    def test_leave_skips_holidays_and_uses_department_week(self):
+        Holiday.objects.create(date=date(2024, 9, 2), name='National Day')
+
+        leave_request = LeaveRequest.objects.create(
+            user=self.user, leave_type=self.leave_type, start_date=date(2024, 9, 2), end_date=date(2024, 9, 8),
+            reason='Trip',
+        )
+        leave_request.status = 'approved'
+        leave_request.approver = self.user
+        leave_request.save()
+
+        # Tuesday to Saturday: the holiday Monday and Sunday are not leave days
+        self.assertEqual(leave_request.days_count, 5)
+        self.assertEqual(
+            list(Attendance.objects.filter(user=self.user).order_by('date').values_list('date', flat=True)),
+            [date(2024, 9, 3) + timedelta(days=offset) for offset in range(5)],
+        )
+
+    def test_holiday_changes_refresh_the_calendar(self):
+        self.assertEqual(get_work_calendar().count(date(2024, 9, 2), date(2024, 9, 6)), 5)
+
+        holiday = Holiday.objects.create(date=date(2024, 9, 2), name='National Day')
+        self.assertEqual(get_work_calendar().count(date(2024, 9, 2), date(2024, 9, 6)), 4)
+
+        holiday.delete()
+        self.assertEqual(get_work_calendar().count(date(2024, 9, 2), date(2024, 9, 6)), 5)
+
+    def test_business_days_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        params = {'start_date': '2024-09-02', 'end_date': '2024-09-08'}
+
+        own = client.get('/api/hr/holidays/business_days/', params)
+        other = client.get('/api/hr/holidays/business_days/', {
+            **params, 'department_id': Department.objects.create(name='Office').id,
+        })
+
+        self.assertEqual(own.data['business_days'], 6)
+        self.assertEqual(other.data['business_days'], 5)
+        self.assertEqual(client.get('/api/hr/holidays/business_days/').status_code, 400)
+
+
+class TeamLeaveCalendarTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user(username='calendar_manager', password='password', role='manager')
+        self.department = Department.objects.create(name='Calendar', manager=self.manager)
+        self.staff = []
+        for index in range(4):
+            staff = User.objects.create_user(
+                username=f'calendar_member{index}', first_name=f'Member{index}', password='password', role='staff',
+            )
+            Employee.objects.create(
+                user=staff, employee_id=f'LC{index}', department=self.department,
+                position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+            )
+            self.staff.append(staff)
+        leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+
+        def leave(user, start, end, leave_status):
+            leave_request = LeaveRequest.objects.create(
+                user=user, leave_type=leave_type, start_date=start, end_date=end, reason='Trip',
+            )
+            LeaveRequest.objects.filter(id=leave_request.id).update(status=leave_status)
+            return leave_request
+
+        leave(self.staff[0], date(2024, 9, 2), date(2024, 9, 6), 'approved')
+        self.pending = leave(self.staff[1], date(2024, 9, 4), date(2024, 9, 10), 'pending')
+        leave(self.staff[2], date(2024, 9, 5), date(2024, 9, 5), 'approved')
+        # Overlaps the approved day: only 6 September counts as pending
+        leave(self.staff[2], date(2024, 9, 5), date(2024, 9, 6), 'pending')
+        leave(self.staff[3], date(2024, 9, 3), date(2024, 9, 3), 'rejected')
+        get_work_calendar()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_per_day_counts_and_conflicts_in_two_queries(self):
+        params = {'start_date': '2024-09-02', 'end_date': '2024-09-08', 'threshold': 2}
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/hr/leave-requests/team_calendar/', params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['team_size'], 4)
+        counts = [(day['scheduled'], day['approved'], day['pending']) for day in response.data['days']]
+        self.assertEqual(counts, [(4, 1, 0), (4, 1, 0), (4, 1, 1), (4, 2, 1), (4, 1, 2), (0, 0, 0), (0, 0, 0)])
+        self.assertEqual([conflict['date'] for conflict in response.data['conflicts']], [date(2024, 9, 5), date(2024, 9, 6)])
+        self.assertEqual(
+            [(person['user_id'], person['status']) for person in response.data['conflicts'][1]['people']],
+            [(self.staff[0].id, 'approved'), (self.staff[1].id, 'pending'), (self.staff[2].id, 'pending')],
+        )
+
+    def test_threshold_defaults_to_settings(self):
+        AttendanceSettings.objects.update_or_create(pk=1, defaults={'max_concurrent_leave': 1})
+        self.addCleanup(invalidate_tags, 'hr.attendance_settings')
+
+        response = self.client.get(
+            '/api/hr/leave-requests/team_calendar/', {'start_date': '2024-09-02', 'end_date': '2024-09-08'},
+        )
+
+        self.assertEqual(response.data['threshold'], 1)
+        self.assertEqual(len(response.data['conflicts']), 3)
+
+    def test_conflicts_for_a_request_cover_its_dates(self):
+        response = self.client.get(f'/api/hr/leave-requests/{self.pending.id}/conflicts/', {'threshold': 2})
+
+        self.assertEqual(response.data['start_date'], date(2024, 9, 4))
+        self.assertEqual(len(response.data['days']), 7)
+        self.assertEqual(len(response.data['conflicts']), 2)
+
+    def test_scope_and_validation(self):
+        self.client.force_authenticate(self.staff[0])
+        self.assertEqual(self.client.get('/api/hr/leave-requests/team_calendar/').status_code, 403)
+
+        self.client.force_authenticate(self.manager)
+        other = Department.objects.create(name='Elsewhere')
+        self.assertEqual(
+            self.client.get('/api/hr/leave-requests/team_calendar/', {'department_id': other.id}).status_code, 403,
+        )
+        self.assertEqual(
+            self.client.get(
+                '/api/hr/leave-requests/team_calendar/', {'start_date': '2024-01-01', 'end_date': '2025-06-01'},
+            ).status_code,
+            400,
+        )
+
+
+class LeaveRolloverTests(TestCase):
+    def setUp(self):
+        self.annual = LeaveType.objects.create(
+            name='Annual', code='annual', default_days_per_year=12, max_carry_over_days=5,
+        )
+        self.sick = LeaveType.objects.create(name='Sick', code='sick', default_days_per_year=10)
+        LeaveType.objects.create(name='Legacy', code='legacy', default_days_per_year=3, is_active=False)
+        self.users = []
+        for index in range(3):
+            user = User.objects.create_user(username=f'rollover{index}', password='password', role='staff')
+            Employee.objects.create(
+                user=user, employee_id=f'RO{index}', position='Staff', join_date=date(2023, 1, 1),
+                current_salary=0, is_active=index < 2,
+            )
+            self.users.append(user)
+
+    def rollover(self, **options):
+        out = io.StringIO()
+        call_command('rollover_leave_balances', year=2025, stdout=out, **options)
+        return out.getvalue()
+
+    def balance(self, user, leave_type, year=2025):
+        return LeaveBalance.objects.get(user=user, leave_type=leave_type, year=year)
+
+    def test_creates_balances_with_capped_carry_over(self):
+        LeaveBalance.objects.create(user=self.users[0], leave_type=self.annual, year=2024, total_days=12, used_days=4)
+        LeaveBalance.objects.create(user=self.users[1], leave_type=self.annual, year=2024, total_days=12, used_days=9)
+        LeaveBalance.objects.create(user=self.users[1], leave_type=self.sick, year=2024, total_days=10, used_days=0)
+
+        self.rollover(batch_size=1)
+
+        # Active employees x active leave types only
+        self.assertEqual(LeaveBalance.objects.filter(year=2025).count(), 4)
+        balance = self.balance(self.users[0], self.annual)
+        self.assertEqual((balance.total_days, balance.carried_over_days), (17, 5))
+        self.assertEqual(self.balance(self.users[1], self.annual).total_days, 15)
+        # Sick leave does not carry over
+        self.assertEqual(self.balance(self.users[1], self.sick).total_days, 10)
+
+    def test_rerun_is_idempotent_and_follows_late_changes(self):
+        previous = LeaveBalance.objects.create(
+            user=self.users[0], leave_type=self.annual, year=2024, total_days=12, used_days=10,
+        )
+        # Created lazily by an early approval, then adjusted by HR
+        LeaveBalance.objects.create(user=self.users[0], leave_type=self.annual, year=2025, total_days=14, used_days=1)
+
+        self.rollover()
+        self.assertEqual(self.balance(self.users[0], self.annual).total_days, 16)
+
+        output = self.rollover()
+        self.assertIn('0 created, 0 carry-overs updated', output)
+        self.assertEqual(self.balance(self.users[0], self.annual).total_days, 16)
+
+        # A late 2024 cancellation frees a day: the carry-over follows on the next run
+        previous.used_days = 9
+        previous.save()
+        self.rollover()
+        balance = self.balance(self.users[0], self.annual)
+        self.assertEqual((balance.total_days, balance.carried_over_days, balance.used_days), (17, 3, 1))
+
+    def test_queries_per_batch_do_not_grow_with_users(self):
+        with CaptureQueriesContext(connection) as one_user:
+            self.rollover(user_ids=[self.users[0].id])
+        LeaveBalance.objects.all().delete()
+        with CaptureQueriesContext(connection) as two_users:
+            self.rollover(user_ids=[self.users[0].id, self.users[1].id])
+
+        self.assertEqual(len(one_user), len(two_users))
+
+
+class PlanGoalCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='plan_owner', password='password', role='staff')
+        self.plan = Plan.objects.create(
+            user=self.user, plan_type='weekly', period_start=date(2024, 9, 2), period_end=date(2024, 9, 8),
+            title='Week 36',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counters(self):
+        self.plan.refresh_from_db()
+        return self.plan.goals_total, self.plan.goals_completed, self.plan.completion_percentage
+
+    def test_goal_write_paths_keep_counters(self):
+        for title in ['Spec', 'Build', 'Ship']:
+            self.client.post(f'/api/hr/plans/{self.plan.id}/add_goal/', {'title': title}, format='json')
+        self.assertEqual(self.counters(), (3, 0, 0))
+
+        goal = PlanGoal.objects.get(title='Spec')
+        self.client.post(f'/api/hr/plan-goals/{goal.id}/toggle_complete/')
+        self.assertEqual(self.counters(), (3, 1, 33))
+        self.client.post(f'/api/hr/plan-goals/{goal.id}/toggle_complete/')
+        self.assertEqual(self.counters(), (3, 0, 0))
+
+        PlanGoal.objects.get(title='Build').mark_completed()
+        self.client.patch(f'/api/hr/plan-goals/{goal.id}/', {'is_completed': True}, format='json')
+        self.assertEqual(self.counters(), (3, 2, 66))
+
+        self.client.delete(f'/api/hr/plan-goals/{goal.id}/')
+        self.assertEqual(self.counters(), (2, 1, 50))
+
+    def test_stale_plan_save_keeps_counters(self):
+        stale = Plan.objects.get(id=self.plan.id)
+        PlanGoal.objects.create(plan=self.plan, title='Spec', is_completed=True)
+
+        stale.title = 'Week 36 (updated)'
+        stale.save()
+
+        self.assertEqual(self.counters(), (1, 1, 100))
+        self.assertEqual(self.plan.title, 'Week 36 (updated)')
+
+    def test_detail_reads_counters_without_counting(self):
+        PlanGoal.objects.create(plan=self.plan, title='Spec', is_completed=True)
+        PlanGoal.objects.create(plan=self.plan, title='Build')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/hr/plans/{self.plan.id}/')
+
+        self.assertEqual((response.data['total_goals'], response.data['completed_goals']), (2, 1))
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+
+    def test_rebuild_command_repairs_drift(self):
+        PlanGoal.objects.create(plan=self.plan, title='Spec', is_completed=True)
+        PlanGoal.objects.create(plan=self.plan, title='Build')
+        Plan.objects.filter(id=self.plan.id).update(goals_total=7, goals_completed=0, completion_percentage=0)
+
+        out = io.StringIO()
+        call_command('rebuild_plan_goal_counters', stdout=out)
+        call_command('rebuild_plan_goal_counters', stdout=out)
+
+        self.assertEqual(self.counters(), (2, 1, 50))
+        self.assertIn('1 repaired', out.getvalue())
+        self.assertIn('0 repaired', out.getvalue())
+
+
+class PlanTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tree_owner', password='password', role='staff')
+
+        def plan(plan_type, title, parent=None, goals=0, completed=0):
+            node = Plan.objects.create(
+                user=self.user, plan_type=plan_type, title=title, parent_plan=parent,
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31),
+            )
+            for index in range(goals):
+                PlanGoal.objects.create(plan=node, title=f'{title} goal {index}', is_completed=index < completed)
+            return node
+
+        self.year = plan('yearly', '2024', goals=2, completed=2)
+        self.q1 = plan('quarterly', 'Q1', self.year, goals=4, completed=1)
+        self.q2 = plan('quarterly', 'Q2', self.year)
+        self.january = plan('monthly', 'January', self.q1, goals=2, completed=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_subtree_and_weighted_completion_in_one_query(self):
+        from .services import get_plan_tree
+
+        with self.assertNumQueries(1):
+            tree = get_plan_tree(self.year.id)
+
+        self.assertEqual([child['title'] for child in tree['children']], ['Q1', 'Q2'])
+        q1 = tree['children'][0]
+        self.assertEqual([child['title'] for child in q1['children']], ['January'])
+        # Q1: 1 of its 4 goals + 0 of January's 2
+        self.assertEqual(q1['rolled_up_completion'], 16)
+        # 2 + 1 + 0 done of 2 + 4 + 2 goals, plus Q2 as one unit at 0%
+        self.assertEqual(tree['rolled_up_completion'], 33)
+        self.assertEqual(tree['descendant_count'], 3)
+
+    def test_tree_is_cached_until_a_descendant_changes(self):
+        url = f'/api/hr/plans/{self.year.id}/tree/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        PlanGoal.objects.filter(plan=self.january).first().mark_completed()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['rolled_up_completion'], 44)
+
+        # Moving January out of the tree invalidates its old ancestors
+        self.january.parent_plan = None
+        self.january.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['descendant_count'], 2)
+
+
+class DailyProgressCaptureTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='daily_owner', password='password', role='staff')
+        self.today = timezone.localdate()
+        project = Project.objects.create(name='Daily progress')
+        for index in range(5):
+            plan = Plan.objects.create(
+                user=self.user, plan_type='daily', title=f'Plan {index}', status='active',
+                period_start=self.today, period_end=self.today,
+            )
+            if index == 4:
+                # Nothing happened on this plan today
+                continue
+            task = Task.objects.create(
+                title=f'Task {index}', project=project, status='completed', completed_at=timezone.now(),
+            )
+            PlanGoal.objects.create(plan=plan, title=f'Goal {index}', related_task=task)
+            # The same task linked from a second goal still counts once
+            PlanGoal.objects.create(plan=plan, title=f'Follow-up {index}', related_task=task).mark_completed()
+            for note in range(index):
+                PlanNote.objects.create(plan=plan, note=f'Note {index}.{note}', created_by=self.user)
+
+    def plans(self):
+        return list(Plan.objects.filter(user=self.user).order_by('id').only('id', 'completion_percentage'))
+
+    def test_batch_matches_the_per_plan_snapshot(self):
+        plans = self.plans()
+        snapshots = build_daily_progress_snapshots(plans, self.today)
+
+        self.assertEqual(capture_daily_progress_batch(plans, self.today), (5, 0))
+        for plan in plans:
+            expected = build_daily_progress_snapshot(plan, self.today)
+            self.assertEqual(snapshots[plan.id], expected)
+            progress = PlanDailyProgress.objects.get(plan=plan, date=self.today)
+            self.assertEqual(
+                (progress.completed_goals_count, progress.progress_notes, progress.work_results,
+                 progress.completion_percentage_snapshot),
+                (expected['completed_goals_count'], expected['progress_notes'], expected['work_results'],
+                 expected['completion_percentage_snapshot']),
+            )
+        self.assertEqual(snapshots[plans[0].id]['meta']['completed_task_titles'], ['Task 0'])
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        plans = self.plans()
+        with CaptureQueriesContext(connection) as one:
+            capture_daily_progress_batch(plans[:1], self.today)
+        with CaptureQueriesContext(connection) as many:
+            capture_daily_progress_batch(plans[1:], self.today)
+
+        self.assertEqual(len(one), len(many))
+
+    def test_rerun_for_the_same_date_updates_in_place(self):
+        capture_daily_progress_batch(self.plans(), self.today)
+        progress = PlanDailyProgress.objects.get(plan__title='Plan 1', date=self.today)
+        PlanDailyProgress.objects.filter(id=progress.id).update(hours_worked=Decimal('3.5'), blockers='Waiting on QA')
+        PlanNote.objects.create(plan=progress.plan, note='Late note', created_by=self.user)
+
+        self.assertEqual(capture_daily_progress_batch(self.plans(), self.today), (0, 5))
+
+        self.assertEqual(PlanDailyProgress.objects.filter(plan__user=self.user).count(), 5)
+        progress = PlanDailyProgress.objects.get(id=progress.id)
+        self.assertEqual((progress.hours_worked, progress.blockers), (Decimal('3.5'), 'Waiting on QA'))
+        self.assertIn('Plan notes added today: 2', progress.progress_notes)
+
+
+class PlanProgressSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='series_owner', password='password', role='staff')
+        self.plans = [
+            Plan.objects.create(
+                user=self.user, plan_type='yearly', title=f'Plan {index}',
+                period_start=date(2024, 1, 1), period_end=date(2024, 12, 31),
+            )
+            for index in range(2)
+        ]
+        # Two weeks from Monday 1 January; completion dips on the last day
+        PlanDailyProgress.objects.bulk_create([
+            PlanDailyProgress(
+                plan=self.plans[0], date=date(2024, 1, 1) + timedelta(days=day),
+                completion_percentage_snapshot=[10, 20, 30, 40, 50, 60, 70, 80, 90, 85][day],
+                hours_worked=Decimal('1.5'), completed_goals_count=1,
+            )
+            for day in range(10)
+        ] + [
+            PlanDailyProgress(plan=self.plans[1], date=date(2024, 2, 5), completion_percentage_snapshot=5, hours_worked=2),
+        ])
+        other = User.objects.create_user(username='series_other', password='password', role='staff')
+        self.hidden = Plan.objects.create(
+            user=other, plan_type='yearly', title='Hidden', period_start=date(2024, 1, 1), period_end=date(2024, 12, 31),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        return self.client.get('/api/hr/plans/progress_series/', params)
+
+    def test_daily_series_is_columnar(self):
+        response = self.get(plans=f'{self.plans[0].id}', start_date='2024-01-01', end_date='2024-01-03')
+
+        [series] = response.data['series']
+        self.assertEqual(series['dates'], ['2024-01-01', '2024-01-02', '2024-01-03'])
+        self.assertEqual(series['completion'], [10, 20, 30])
+        self.assertEqual(series['hours'], [1.5, 1.5, 1.5])
+
+    def test_weekly_buckets_in_one_query(self):
+        plan_ids = f'{self.plans[0].id},{self.plans[1].id},{self.hidden.id}'
+        # Plan lookup and the downsampled series
+        with self.assertNumQueries(2):
+            response = self.get(plans=plan_ids, bucket='week')
+
+        first, second = response.data['series']
+        self.assertEqual(first['dates'], ['2024-01-01', '2024-01-08'])
+        # Last snapshot of each week, summed hours and goals
+        self.assertEqual(first['completion'], [70, 85])
+        self.assertEqual(first['hours'], [10.5, 4.5])
+        self.assertEqual(first['completed_goals'], [7, 3])
+        self.assertEqual((second['plan'], second['dates']), (self.plans[1].id, ['2024-02-05']))
+
+    def test_validation(self):
+        self.assertEqual(self.get(plans=str(self.plans[0].id), bucket='hour').status_code, 400)
+        self.assertEqual(self.get(plans='abc').status_code, 400)
+        self.assertEqual(self.get(plans=str(self.hidden.id)).status_code, 404)
+        self.assertEqual(
+            self.get(plans=str(self.plans[0].id), start_date='2020-01-01', end_date='2024-12-31').status_code, 400,
+        )
+
+
+class ScopeResolverTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='scope_manager', password='password', role='manager')
+        self.lead = User.objects.create_user(username='scope_lead', password='password', role='team_lead')
+        self.departments = [
+            Department.objects.create(name=f'Scope {index}', manager=self.manager) for index in range(2)
+        ]
+        self.other_department = Department.objects.create(name='Scope other')
+        self.staff = {}
+        for name, department, manager, active in [
+            ('first', self.departments[0], self.lead, True),
+            ('second', self.departments[1], None, True),
+            ('outsider', self.other_department, None, True),
+            ('former', self.departments[0], self.lead, False),
+        ]:
+            user = User.objects.create_user(username=f'scope_{name}', password='password', role='staff')
+            Employee.objects.create(
+                user=user, employee_id=f'SC-{name}', department=department, manager=manager, is_active=active,
+                position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+            )
+            self.staff[name] = user
+        # Ids are reused between tests; drop scopes cached for earlier owners
+        invalidate_tags(*[scope_tag(user.pk) for user in User.objects.all()])
+
+    def test_manager_sees_staff_of_every_managed_department(self):
+        for user in [self.manager, *self.staff.values()]:
+            Plan.objects.create(
+                user=user, plan_type='monthly', title=user.username,
+                period_start=date(2024, 1, 1), period_end=date(2024, 1, 31),
+            )
+        plans = ScopeResolver(self.manager).filter(Plan.objects.all())
+
+        self.assertIn('IN (SELECT', str(plans.query))
+        self.assertEqual(
+            set(plans.values_list('user__username', flat=True)),
+            {'scope_manager', 'scope_first', 'scope_second'},
+        )
+
+    def test_team_lead_sees_direct_reports_leave_and_attendance(self):
+        leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+        for user in [self.lead, *self.staff.values()]:
+            LeaveRequest.objects.create(
+                user=user, leave_type=leave_type, start_date=date(2024, 9, 2), end_date=date(2024, 9, 2), reason='Trip',
+            )
+            Attendance.objects.create(user=user, date=date(2024, 9, 3), status='present')
+        client = APIClient()
+        client.force_authenticate(self.lead)
+
+        leave = client.get('/api/hr/leave-requests/')
+        rows = leave.data['results'] if isinstance(leave.data, dict) else leave.data
+        # History stays visible after a report is deactivated
+        team = {self.staff['first'].id, self.staff['former'].id}
+        self.assertEqual({row['user'] for row in rows}, team)
+        exported = attendance_export_queryset(self.lead)
+        self.assertEqual(set(exported.values_list('user_id', flat=True)), team)
+
+    def test_manager_without_a_team_keeps_their_own_leave_requests(self):
+        manager = User.objects.create_user(username='scope_lone_manager', password='password', role='manager')
+        Employee.objects.create(
+            user=manager, employee_id='SC-lone', department=self.other_department,
+            position='Manager', join_date=date(2023, 1, 1), current_salary=0,
+        )
+        leave_type = LeaveType.objects.create(name='Annual', code='annual', default_days_per_year=12)
+        leave_request = LeaveRequest.objects.create(
+            user=manager, leave_type=leave_type, start_date=date(2024, 9, 2), end_date=date(2024, 9, 2), reason='Trip',
+        )
+        client = APIClient()
+        client.force_authenticate(manager)
+
+        retrieved = client.get(f'/api/hr/leave-requests/{leave_request.id}/')
+        updated = client.patch(f'/api/hr/leave-requests/{leave_request.id}/', {'reason': 'Wedding'}, format='json')
+        approved = client.post(f'/api/hr/leave-requests/{leave_request.id}/process_request/', {'action': 'approve'})
+
+        self.assertEqual(retrieved.status_code, 200)
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(approved.status_code, 403)
+        self.assertEqual(client.get('/api/hr/leave-requests/').data['count'], 1)
+
+        # Once they have a team, their own requests are left to their manager
+        report = Employee.objects.get(user=self.staff['outsider'])
+        report.manager = manager
+        report.save()
+        self.assertEqual(client.get('/api/hr/leave-requests/').data['count'], 0)
+
+    def test_staff_team_attendance_is_limited_to_own(self):
+        for user in self.staff.values():
+            Attendance.objects.create(user=user, date=date(2024, 9, 3), status='present')
+        client = APIClient()
+        client.force_authenticate(self.staff['outsider'])
+
+        response = client.get('/api/hr/attendances/team_attendance/')
+
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual({row['user'] for row in rows}, {self.staff['outsider'].id})
+
+    def test_membership_is_cached_until_the_team_changes(self):
+        self.assertTrue(ScopeResolver(self.manager).can_see(self.staff['second'].id))
+        with self.assertNumQueries(0):
+            resolver = ScopeResolver(self.manager)
+            self.assertTrue(resolver.can_see(self.staff['first'].id))
+            self.assertFalse(resolver.can_see(self.staff['outsider'].id))
+            self.assertFalse(resolver.can_see(self.staff['former'].id))
+
+        employee = Employee.objects.get(user=self.staff['second'])
+        employee.department = self.other_department
+        employee.save()
+        self.assertFalse(ScopeResolver(self.manager).can_see(self.staff['second'].id))
+
+        department = Department.objects.get(pk=self.other_department.pk)
+        department.manager = self.manager
+        department.save()
+        self.assertTrue(ScopeResolver(self.manager).can_see(self.staff['outsider'].id))
+
+        department.manager = self.lead
+        department.save()
+        self.assertFalse(ScopeResolver(self.manager).can_see(self.staff['outsider'].id))
+        self.assertTrue(ScopeResolver(self.lead).can_see(self.staff['outsider'].id))
+
+
+class EmployeeHierarchyTests(TestCase):
+    def setUp(self):
+        self.users = {}
+        # head <- lead <- member, head <- peer
+        for name, role, manager in [
+            ('head', 'manager', None), ('lead', 'team_lead', 'head'), ('member', 'staff', 'lead'), ('peer', 'staff', 'head'),
+        ]:
+            user = User.objects.create_user(username=f'org_{name}', first_name=name.title(), password='password', role=role)
+            Employee.objects.create(
+                user=user, employee_id=f'ORG-{name}', manager=self.users.get(manager),
+                position=role, join_date=date(2023, 1, 1), current_salary=0,
+            )
+            self.users[name] = user
+        invalidate_tags(*[scope_tag(user.pk) for user in User.objects.all()])
+
+    def move(self, name, manager):
+        employee = Employee.objects.get(user=self.users[name])
+        employee.manager = self.users[manager] if manager else None
+        employee.save()
+
+    def closure(self):
+        return set(EmployeeHierarchy.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_transitive_reports(self):
+        head, lead, member = self.users['head'].id, self.users['lead'].id, self.users['member'].id
+        self.assertTrue(is_under(member, head))
+        self.assertTrue(is_under(member, lead))
+        self.assertFalse(is_under(head, member))
+        self.assertFalse(is_under(member, self.users['peer'].id))
+        self.assertIn((head, member, 2), self.closure())
+
+    def test_moving_a_subtree(self):
+        self.move('lead', 'peer')
+        head, peer, member = self.users['head'].id, self.users['peer'].id, self.users['member'].id
+
+        self.assertIn((head, member, 3), self.closure())
+        self.assertTrue(is_under(member, peer))
+        self.move('lead', None)
+        self.assertFalse(is_under(member, head))
+        self.assertTrue(is_under(member, self.users['lead'].id))
+
+    def test_moves_lock_both_reporting_lines(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.move('member', 'peer')
+
+        lock_prefix = 'SELECT "hr_employee"."id" FROM "hr_employee" WHERE "hr_employee"."user_id" IN'
+        locked = {
+            int(user_id)
+            for query in queries if query['sql'].startswith(lock_prefix)
+            for user_id in re.findall(r'\d+', query['sql'][len(lock_prefix):].split(')')[0])
+        }
+        # The person moved, the new manager and every manager above either of them
+        self.assertEqual(locked, {self.users[name].id for name in ('member', 'lead', 'head', 'peer')})
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.move('head', 'member')
+        self.assertEqual(Employee.objects.get(user=self.users['head']).manager_id, None)
+
+    def test_clean_rejects_cycles(self):
+        employee = Employee.objects.get(user=self.users['head'])
+        employee.manager = self.users['member']
+        with self.assertRaises(ValidationError) as raised:
+            employee.clean()
+        self.assertIn('manager', raised.exception.message_dict)
+
+        employee.manager = None
+        employee.clean()
+
+    def test_admin_reports_cycles_as_form_errors(self):
+        admin_user = User.objects.create_superuser(username='org_admin', password='password', role='admin')
+        self.client.force_login(admin_user)
+        employee = Employee.objects.get(user=self.users['lead'])
+        url = reverse('admin:hr_employee_change', args=[employee.pk])
+        form = self.client.get(url).context['adminform'].form
+        data = {name: form[name].value() for name in form.fields if form[name].value() is not None}
+        # limit_choices_to only offers managers and team leads
+        User.objects.filter(pk=self.users['member'].pk).update(role='team_lead')
+        data['manager'] = self.users['member'].pk
+
+        response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['adminform'].form.errors['manager'],
+            ['An employee cannot report to themselves or to someone under them.'],
+        )
+        self.assertEqual(Employee.objects.get(pk=employee.pk).manager_id, self.users['head'].pk)
+
+    def test_deleting_a_manager_detaches_their_reports(self):
+        self.users['lead'].delete()
+
+        self.assertFalse(is_under(self.users['member'].id, self.users['head'].id))
+        self.assertIsNone(Employee.objects.get(user=self.users['member']).manager_id)
+
+    def test_rebuild_matches_incremental_upkeep(self):
+        self.move('lead', 'peer')
+        expected = self.closure()
+        EmployeeHierarchy.objects.all().delete()
+
+        call_command('rebuild_employee_hierarchy', stdout=io.StringIO())
+
+        self.assertEqual(self.closure(), expected)
+
+    def test_team_lead_scope_includes_indirect_reports(self):
+        resolver = ScopeResolver(self.users['lead'])
+        self.assertTrue(resolver.can_see(self.users['member'].id))
+        self.assertFalse(resolver.can_see(self.users['peer'].id))
+        self.assertTrue(ScopeResolver(self.users['head']).can_see(self.users['member'].id))
+
+        self.move('member', 'peer')
+        self.assertFalse(ScopeResolver(self.users['lead']).can_see(self.users['member'].id))
+        self.assertTrue(ScopeResolver(self.users['head']).can_see(self.users['member'].id))
+
+    def test_org_chart(self):
+        client = APIClient()
+        client.force_authenticate(self.users['lead'])
+        Employee.objects.filter(user=self.users['peer']).update(is_active=False)
+
+        # "Is head under lead" is the only query
+        with self.assertNumQueries(1):
+            response = client.get('/api/hr/employees/org_chart/', {'root': self.users['head'].id})
+        self.assertEqual(response.status_code, 403)
+
+        client.force_authenticate(self.users['head'])
+        # Managers may view any subtree: only the tree query runs
+        with self.assertNumQueries(1):
+            response = client.get('/api/hr/employees/org_chart/')
+        chart = response.data
+        self.assertEqual((chart['name'], chart['headcount']), ('Head', 2))
+        self.assertEqual([node['name'] for node in chart['reports']], ['Lead', 'Peer'])
+        lead = chart['reports'][0]
+        self.assertEqual((lead['headcount'], [node['name'] for node in lead['reports']]), (1, ['Member']))
+
+        trimmed = client.get('/api/hr/employees/org_chart/', {'depth': 1}).data
+        self.assertEqual((trimmed['headcount'], trimmed['reports'][0]['reports']), (2, []))
+        self.assertEqual(client.get('/api/hr/employees/org_chart/', {'root': 'x'}).status_code, 400)
+
+    def test_org_chart_survives_drift(self):
+        head, lead, member = self.users['head'], self.users['lead'], self.users['member']
+        # update() skips Employee.save: the manager no longer matches the closure table
+        Employee.objects.filter(user=member).update(manager=self.users['peer'])
+        Employee.objects.filter(user=lead).update(manager=None)
+
+        chart = build_org_chart(head.id)
+        self.assertEqual([node['name'] for node in chart['reports']], ['Lead', 'Peer'])
+        self.assertEqual([node['name'] for node in chart['reports'][0]['reports']], ['Member'])
+
+        EmployeeHierarchy.objects.filter(ancestor=lead, descendant=member).delete()
+        chart = build_org_chart(head.id)
+        self.assertEqual(chart['headcount'], 2)
+        self.assertEqual(chart['reports'][0]['reports'], [])
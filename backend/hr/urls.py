@@ -6,7 +6,7 @@ from .views import (
     PlanViewSet, PlanGoalViewSet, PlanNoteViewSet,
     PlanDailyProgressViewSet, PlanUpdateHistoryViewSet,
     AttendanceViewSet, AttendanceSettingsViewSet,
-    LeaveTypeViewSet, LeaveBalanceViewSet, LeaveRequestViewSet
+    HolidayViewSet, LeaveTypeViewSet, LeaveBalanceViewSet, LeaveRequestViewSet
 )
 
 router = DefaultRouter()
@@ -24,6 +24,7 @@ router.register(r'plan-daily-progress', PlanDailyProgressViewSet, basename='plan
 router.register(r'plan-update-history', PlanUpdateHistoryViewSet, basename='plan-update-history')
 router.register(r'attendances', AttendanceViewSet, basename='attendance')
 router.register(r'attendance-settings', AttendanceSettingsViewSet, basename='attendance-settings')
+router.register(r'holidays', HolidayViewSet, basename='holiday')
 router.register(r'leave-types', LeaveTypeViewSet, basename='leave-type')
 router.register(r'leave-balances', LeaveBalanceViewSet, basename='leave-balance')
 router.register(r'leave-requests', LeaveRequestViewSet, basename='leave-request')
@@ -2,15 +2,18 @@ from rest_framework import viewsets, status, filters, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .models import (
     Department, CareerPath, Employee, KPI, Evaluation, SalaryReview,
     PersonalReport, Plan, PlanGoal, PlanNote, PlanDailyProgress,
-    PlanUpdateHistory, Attendance, AttendanceSettings,
-    LeaveType, LeaveBalance, LeaveRequest
+    PlanUpdateHistory, Attendance, AttendanceSettings, AttendanceExport,
+    Holiday, LeaveType, LeaveBalance, LeaveRequest
 )
 from .serializers import (
     DepartmentSerializer, CareerPathSerializer,
@@ -22,6 +25,7 @@ from .serializers import (
     PlanDailyProgressSerializer, PlanUpdateHistorySerializer,
     AttendanceSerializer, AttendanceListSerializer, AttendanceCheckInSerializer,
     AttendanceCheckOutSerializer, AttendanceStatsSerializer, AttendanceSettingsSerializer,
+    AttendanceExportSerializer, HolidaySerializer,
     LeaveTypeSerializer, LeaveBalanceSerializer, LeaveRequestSerializer, LeaveRequestCreateSerializer
 )
 from .permissions import (
@@ -29,7 +33,22 @@ from .permissions import (
     CanApproveSalaryReview, CanReviewReport, CanManageTeamAttendance,
     CanManageLeaveRequests
 )
-from .services import build_daily_progress_snapshot
+from .services import (
+    PROGRESS_SERIES_BUCKETS, build_daily_progress_snapshot, get_attendance_stats, get_plan_progress_series,
+    get_plan_tree, get_team_attendance_stats, process_leave_requests, record_check_in, record_check_out,
+    set_goal_completed
+)
+from .hierarchy import build_org_chart, is_under
+from .scope import ScopeResolver
+from .work_calendar import get_user_work_calendar, get_work_calendar
+from .leave_calendar import build_team_leave_calendar
+from .exports import (
+    EXPORT_FORMATS, attendance_export_queryset, export_filename, retry_attendance_export,
+    start_attendance_export, stream_attendance_export, stream_for
+)
+from config.cache import cache_response, idempotent, invalidate_tags
+from config.pagination import CursorPaginationMixin
+from config.search import FullTextSearchFilter, SearchDocument
 
 
 class DepartmentViewSet(viewsets.ModelViewSet):
@@ -90,6 +109,40 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             # Return only the employee's own profile
             return Employee.objects.filter(user=user)
 
+    @action(detail=False, methods=['get'])
+    def org_chart(self, request):
+        """
+        Reporting tree under a person, with headcounts
+        Query params: root (user id, default: yourself), depth (levels of reports to return)
+        """
+        user = request.user
+        try:
+            root_id = int(request.query_params.get('root', user.id))
+            depth = request.query_params.get('depth')
+            depth = int(depth) if depth else None
+        except ValueError:
+            return Response(
+                {'error': 'root and depth must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not (
+            user.role in ['admin', 'manager'] or user.is_superuser
+            or root_id == user.id or is_under(root_id, user.id)
+        ):
+            return Response(
+                {'error': 'You can only view the org chart of people under you'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        chart = build_org_chart(root_id, depth)
+        if chart is None:
+            return Response(
+                {'error': 'This user is not part of the reporting hierarchy'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(chart)
+
     @action(detail=True, methods=['get'])
     def kpis(self, request, pk=None):
         """Get all KPIs for an employee"""
@@ -433,11 +486,13 @@ class PlanViewSet(viewsets.ModelViewSet):
     """
     queryset = Plan.objects.all()
     permission_classes = [IsAdminOrManagerOrSelf]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['user', 'plan_type', 'status', 'period_start', 'user__employee_profile__department']
-    search_fields = ['title', 'description', 'user__username']
+    search_document = SearchDocument({'title': 'A', 'description': 'B'}, contains_fields=['user__username'])
     ordering_fields = ['period_start', 'created_at', 'completion_percentage']
     ordering = ['-period_start']
+    progress_series_max_plans = 50
+    progress_series_max_points = 400
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -451,62 +506,19 @@ class PlanViewSet(viewsets.ModelViewSet):
         - Manager/Team Leader: see their own plans + their staff's plans (employees in departments they manage)
         - Others: see only their own plans
         """
-        user = self.request.user
-
-        # Admin sees all plans
-        if user.role == 'admin' or user.is_superuser:
-            return Plan.objects.all()
-
-        # Manager/Team Leader sees their own plans + their staff's plans
-        if user.role in ['manager', 'team_lead']:
-            # Get departments managed by this user
-            managed_departments = user.managed_departments.all()
-
-            if managed_departments.exists():
-                from hr.models import Employee
-                # Get all employees in managed departments
-                staff_users = Employee.objects.filter(
-                    department__in=managed_departments,
-                    is_active=True
-                ).values_list('user_id', flat=True)
-
-                # Return plans for self + staff
-                return Plan.objects.filter(user__in=list(staff_users) + [user.id])
-            else:
-                # Manager/Team Leader with no departments: see only own plans
-                return Plan.objects.filter(user=user)
-
-        # All other users see only their own plans
-        return Plan.objects.filter(user=user)
+        return ScopeResolver.for_request(self.request).filter(Plan.objects.all())
 
     def _get_assignable_user_queryset(self):
         """Users that request.user can create/assign plans for."""
-        user = self.request.user
-        User = get_user_model()
-
-        if user.role == 'admin' or user.is_superuser:
-            return User.objects.filter(is_active=True)
-
-        if user.role in ['manager', 'team_lead']:
-            managed_departments = user.managed_departments.all()
-            if managed_departments.exists():
-                staff_user_ids = Employee.objects.filter(
-                    department__in=managed_departments,
-                    is_active=True
-                ).values_list('user_id', flat=True)
-                return User.objects.filter(id__in=list(staff_user_ids) + [user.id], is_active=True)
-
-            return User.objects.filter(id=user.id, is_active=True)
-
-        return User.objects.filter(id=user.id, is_active=True)
+        users = get_user_model().objects.filter(is_active=True)
+        return ScopeResolver.for_request(self.request).filter(users, field='pk')
 
     def _resolve_target_user(self, serializer, fallback_user):
         requested_user = serializer.validated_data.get('user')
         if requested_user is None:
             return fallback_user
 
-        assignable_user_ids = set(self._get_assignable_user_queryset().values_list('id', flat=True))
-        if requested_user.id not in assignable_user_ids:
+        if not (requested_user.is_active and ScopeResolver.for_request(self.request).can_see(requested_user.id)):
             return None
 
         return requested_user
@@ -607,7 +619,6 @@ class PlanViewSet(viewsets.ModelViewSet):
         serializer = PlanGoalSerializer(data=request.data)
         if serializer.is_valid():
             goal = serializer.save(plan=plan)
-            plan.auto_calculate_completion()
 
             # Auto-assign plan owner to task assignees when goal links a task
             if goal.related_task_id:
@@ -668,24 +679,7 @@ class PlanViewSet(viewsets.ModelViewSet):
         - Manager/Team Leader: own plans + staff plans (employees in managed departments)
         - Others: only own plans
         """
-        user = request.user
-
-        # Use the same logic as get_queryset
-        if user.role == 'admin' or user.is_superuser:
-            plans = Plan.objects.all()
-        elif user.role in ['manager', 'team_lead']:
-            managed_departments = user.managed_departments.all()
-            if managed_departments.exists():
-                from hr.models import Employee
-                staff_users = Employee.objects.filter(
-                    department__in=managed_departments,
-                    is_active=True
-                ).values_list('user_id', flat=True)
-                plans = Plan.objects.filter(user__in=list(staff_users) + [user.id])
-            else:
-                plans = Plan.objects.filter(user=user)
-        else:
-            plans = Plan.objects.filter(user=user)
+        plans = ScopeResolver.for_request(request).filter(Plan.objects.all())
 
         # Optional filter by plan_type
         plan_type = request.query_params.get('plan_type')
@@ -695,6 +689,78 @@ class PlanViewSet(viewsets.ModelViewSet):
         serializer = PlanListSerializer(plans, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def progress_series(self, request):
+        """
+        Daily progress of one or many plans as parallel arrays, for charts
+        Query params: plans (comma-separated ids), start_date, end_date (default:
+        the plans' period), bucket=day|week|month (downsampled server-side)
+        """
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in PROGRESS_SERIES_BUCKETS:
+            return Response(
+                {'error': 'Invalid bucket. Use "day", "week" or "month"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            plan_ids = {int(value) for value in request.query_params.get('plans', '').split(',') if value.strip()}
+        except ValueError:
+            return Response({'error': 'plans must be a comma-separated list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if not plan_ids or len(plan_ids) > self.progress_series_max_plans:
+            return Response(
+                {'error': f'plans must contain between 1 and {self.progress_series_max_plans} ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        plans = list(
+            self.get_queryset().filter(id__in=plan_ids).order_by('id').values_list('id', 'period_start', 'period_end')
+        )
+        if not plans:
+            return Response({'error': 'Plan not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            start_date = request.query_params.get('start_date')
+            start_date = (
+                datetime.strptime(start_date, '%Y-%m-%d').date() if start_date
+                else min(period_start for _, period_start, _ in plans)
+            )
+            end_date = request.query_params.get('end_date')
+            end_date = (
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date
+                else max(period_end for _, _, period_end in plans)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        days = (end_date - start_date).days + 1
+        points = {'day': days, 'week': days // 7 + 1, 'month': days // 28 + 1}[bucket]
+        if days < 1 or points > self.progress_series_max_points:
+            return Response(
+                {'error': f'The range must be non-empty and hold at most {self.progress_series_max_points} '
+                          f'points per plan; use a coarser bucket or a shorter range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'bucket': bucket,
+            'start_date': start_date,
+            'end_date': end_date,
+            'series': get_plan_progress_series([plan_id for plan_id, _, _ in plans], start_date, end_date, bucket),
+        })
+
+    @action(detail=True, methods=['get'])
+    @cache_response('hr.plan_tree', tags=['plan_tree:{pk}'])
+    def tree(self, request, pk=None):
+        """
+        This plan and all its descendant plans as a nested tree, with
+        goal-weighted completion rolled up from the whole subtree
+        """
+        plan = self.get_object()
+        return Response(get_plan_tree(plan.id))
+
     @action(detail=False, methods=['get'])
     def active_plans(self, request):
         """Get plans in active status"""
@@ -725,14 +791,7 @@ class PlanGoalViewSet(viewsets.ModelViewSet):
     def toggle_complete(self, request, pk=None):
         """Toggle goal completion status"""
         goal = self.get_object()
-
-        if goal.is_completed:
-            goal.is_completed = False
-            goal.completed_at = None
-        else:
-            goal.mark_completed()
-
-        goal.save()
+        set_goal_completed(goal, not goal.is_completed)
         return Response(PlanGoalSerializer(goal).data)
 
     def perform_destroy(self, instance):
@@ -859,7 +918,7 @@ class PlanDailyProgressViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class PlanUpdateHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+class PlanUpdateHistoryViewSet(CursorPaginationMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing plan update history (read-only)
     """
@@ -870,6 +929,7 @@ class PlanUpdateHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['plan', 'action', 'changed_by']
     ordering_fields = ['changed_at']
     ordering = ['-changed_at']
+    cursor_pagination = {'list': ('-changed_at', '-id')}
 
     def get_queryset(self):
         """Filter based on plan access permissions"""
@@ -880,7 +940,7 @@ class PlanUpdateHistoryViewSet(viewsets.ReadOnlyModelViewSet):
         return PlanUpdateHistory.objects.filter(plan__in=accessible_plans)
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for Attendance management
     Users can manage their own attendance
@@ -892,6 +952,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     filterset_fields = ['user', 'date', 'status']
     ordering_fields = ['date', 'check_in_time']
     ordering = ['-date', '-check_in_time']
+    cursor_pagination = {
+        'list': ('-date', '-id'),
+        'my_history': ('-date', '-id'),
+    }
 
     def get_client_ip(self, request):
         """Get real client IP address from request headers"""
@@ -918,57 +982,38 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         return Attendance.objects.filter(user=user)
 
     @action(detail=False, methods=['post'])
+    @idempotent('hr.check_in')
     def check_in(self, request):
         """
         Check in for today
-        Creates or updates attendance record for current user
+        Creates or updates attendance record for current user in a single upsert.
+        Send an Idempotency-Key header to make retries safe.
         """
-        user = request.user
-        today = timezone.now().date()
-
-        # Check if already checked in today
-        attendance = Attendance.objects.filter(user=user, date=today).first()
-
-        if attendance and attendance.has_checked_in:
-            return Response(
-                {'error': 'You have already checked in today', 'attendance': AttendanceSerializer(attendance).data},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         serializer = AttendanceCheckInSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
-        # Get client IP
-        client_ip = self.get_client_ip(request)
-
-        # Prepare check-in data with metadata
-        check_in_data = {
+        attendance, checked_in = record_check_in(request.user, {
             'check_in_time': timezone.now(),
-            'check_in_location': serializer.validated_data.get('location', ''),
-            'check_in_ip': client_ip,
-            'check_in_latitude': serializer.validated_data.get('latitude'),
-            'check_in_longitude': serializer.validated_data.get('longitude'),
-            'check_in_accuracy': serializer.validated_data.get('accuracy'),
-            'check_in_address': serializer.validated_data.get('address', ''),
-            'check_in_device_type': serializer.validated_data.get('device_type', ''),
-            'check_in_device_os': serializer.validated_data.get('device_os', ''),
-            'check_in_device_browser': serializer.validated_data.get('device_browser', ''),
-            'check_in_user_agent': serializer.validated_data.get('user_agent', ''),
-            'status': serializer.validated_data.get('status', 'present'),
-            'notes': serializer.validated_data.get('notes', '')
-        }
+            'check_in_location': data.get('location', ''),
+            'check_in_ip': self.get_client_ip(request),
+            'check_in_latitude': data.get('latitude'),
+            'check_in_longitude': data.get('longitude'),
+            'check_in_accuracy': data.get('accuracy'),
+            'check_in_address': data.get('address', ''),
+            'check_in_device_type': data.get('device_type', ''),
+            'check_in_device_os': data.get('device_os', ''),
+            'check_in_device_browser': data.get('device_browser', ''),
+            'check_in_user_agent': data.get('user_agent', ''),
+            'status': data.get('status', 'present'),
+            'notes': data.get('notes', '')
+        })
 
-        # Create or update attendance
-        if not attendance:
-            attendance = Attendance.objects.create(
-                user=user,
-                date=today,
-                **check_in_data
+        if not checked_in:
+            return Response(
+                {'error': 'You have already checked in today', 'attendance': AttendanceSerializer(attendance).data},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        else:
-            for key, value in check_in_data.items():
-                setattr(attendance, key, value)
-            attendance.save()
 
         return Response(
             {
@@ -979,50 +1024,36 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         )
 
     @action(detail=False, methods=['post'])
+    @idempotent('hr.check_out')
     def check_out(self, request):
         """
         Check out for today
-        Updates attendance record for current user
+        Updates attendance record for current user.
+        Send an Idempotency-Key header to make retries safe.
         """
-        user = request.user
-        today = timezone.now().date()
-
-        # Get today's attendance
-        attendance = Attendance.objects.filter(user=user, date=today).first()
-
-        if not attendance or not attendance.has_checked_in:
-            return Response(
-                {'error': 'You must check in first before checking out'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if attendance.has_checked_out:
-            return Response(
-                {'error': 'You have already checked out today', 'attendance': AttendanceSerializer(attendance).data},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         serializer = AttendanceCheckOutSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-
-        # Get client IP
-        client_ip = self.get_client_ip(request)
-
-        # Update check-out data with metadata
-        attendance.check_out_time = timezone.now()
-        attendance.check_out_location = serializer.validated_data.get('location', '')
-        attendance.check_out_ip = client_ip
-        attendance.check_out_latitude = serializer.validated_data.get('latitude')
-        attendance.check_out_longitude = serializer.validated_data.get('longitude')
-        attendance.check_out_accuracy = serializer.validated_data.get('accuracy')
-        attendance.check_out_address = serializer.validated_data.get('address', '')
-        attendance.check_out_device_type = serializer.validated_data.get('device_type', '')
-        attendance.check_out_device_os = serializer.validated_data.get('device_os', '')
-        attendance.check_out_device_browser = serializer.validated_data.get('device_browser', '')
-        attendance.check_out_user_agent = serializer.validated_data.get('user_agent', '')
-        if serializer.validated_data.get('notes'):
-            attendance.notes += '\n' + serializer.validated_data.get('notes', '')
-        attendance.save()
+        data = serializer.validated_data
+
+        attendance, error = record_check_out(request.user, {
+            'check_out_time': timezone.now(),
+            'check_out_location': data.get('location', ''),
+            'check_out_ip': self.get_client_ip(request),
+            'check_out_latitude': data.get('latitude'),
+            'check_out_longitude': data.get('longitude'),
+            'check_out_accuracy': data.get('accuracy'),
+            'check_out_address': data.get('address', ''),
+            'check_out_device_type': data.get('device_type', ''),
+            'check_out_device_os': data.get('device_os', ''),
+            'check_out_device_browser': data.get('device_browser', ''),
+            'check_out_user_agent': data.get('user_agent', ''),
+        }, notes=data.get('notes', ''))
+
+        if error:
+            payload = {'error': error}
+            if attendance and attendance.has_checked_out:
+                payload['attendance'] = AttendanceSerializer(attendance).data
+            return Response(payload, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(
             {
@@ -1097,49 +1128,62 @@ class AttendanceViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get attendances in date range
-        attendances = Attendance.objects.filter(
-            user=target_user,
-            date__gte=start_date,
-            date__lte=end_date
-        )
+        stats = get_attendance_stats(target_user, start_date, end_date)
+        serializer = AttendanceStatsSerializer(stats)
+        return Response(serializer.data)
 
-        # Calculate statistics
-        total_days = attendances.count()
-        present_days = attendances.filter(status__in=['present', 'late']).count()
-        absent_days = attendances.filter(status='absent').count()
-        late_days = attendances.filter(is_late=True).count()
-        wfh_days = attendances.filter(status='wfh').count()
-        half_days = attendances.filter(status='half_day').count()
-
-        # Calculate total hours
-        total_hours = sum(
-            [att.total_hours for att in attendances if att.total_hours],
-            0
-        )
+    @action(detail=False, methods=['get'], permission_classes=[CanManageTeamAttendance])
+    def team_stats(self, request):
+        """
+        Get per-user attendance statistics for a team in one request
+        Query params: department_id (admin/manager), start_date, end_date
+        Admin: any department (or everyone); Manager: departments they manage;
+        Team Lead: direct reports
+        """
+        user = request.user
+        department_id = request.query_params.get('department_id')
 
-        # Average hours per day (only counting days with hours logged)
-        days_with_hours = attendances.filter(total_hours__isnull=False).count()
-        average_hours = (total_hours / days_with_hours) if days_with_hours > 0 else 0
-
-        # Attendance rate
-        working_days = (end_date - start_date).days + 1
-        attendance_rate = (present_days / working_days * 100) if working_days > 0 else 0
-
-        stats = {
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'late_days': late_days,
-            'wfh_days': wfh_days,
-            'half_days': half_days,
-            'total_hours': round(total_hours, 2),
-            'average_hours_per_day': round(average_hours, 2),
-            'attendance_rate': round(attendance_rate, 2)
-        }
+        try:
+            start_date = request.query_params.get('start_date')
+            start_date = (
+                datetime.strptime(start_date, '%Y-%m-%d').date() if start_date
+                else timezone.now().date().replace(day=1)
+            )
+            end_date = request.query_params.get('end_date')
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else timezone.now().date()
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        serializer = AttendanceStatsSerializer(stats)
-        return Response(serializer.data)
+        users = get_user_model().objects.filter(is_active=True)
+        if user.role == 'admin' or user.is_superuser:
+            if department_id:
+                users = users.filter(employee_profile__department_id=department_id)
+        elif user.role == 'manager':
+            departments = Department.objects.filter(manager=user)
+            if department_id:
+                departments = departments.filter(id=department_id)
+                if not departments.exists():
+                    return Response(
+                        {'error': 'You can only view departments you manage'},
+                        status=status.HTTP_403_FORBIDDEN
+                    )
+            users = users.filter(employee_profile__department__in=departments)
+        elif user.role == 'team_lead':
+            users = users.filter(employee_profile__manager=user)
+        else:
+            return Response(
+                {'error': 'Only admin, manager or team lead can view team statistics'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'results': get_team_attendance_stats(users, start_date, end_date)
+        })
 
     @action(detail=False, methods=['get'])
     def my_history(self, request):
@@ -1169,6 +1213,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             except ValueError:
                 pass
 
+        if self.uses_cursor_pagination():
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(AttendanceSerializer(page, many=True).data)
+
         # Apply limit
         try:
             limit = int(limit)
@@ -1185,24 +1233,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         Get team attendance (Admin/Manager/Team Lead only)
         Query params: user_id, department_id, start_date, end_date, status
         """
-        user = request.user
-        queryset = Attendance.objects.all()
-
-        # Filter based on role
-        if user.role == 'manager':
-            # Manager sees department attendance
-            try:
-                managed_dept = Department.objects.filter(manager=user).first()
-                if managed_dept:
-                    employee_ids = managed_dept.employees.values_list('user_id', flat=True)
-                    queryset = queryset.filter(user_id__in=employee_ids)
-            except:
-                pass
-        elif user.role == 'team_lead':
-            # Team Lead sees direct reports
-            managed_employee_ids = Employee.objects.filter(manager=user).values_list('user_id', flat=True)
-            queryset = queryset.filter(user_id__in=managed_employee_ids)
-        # Admin sees all (no filter needed)
+        # Admin sees all, managers and team leads their team (or their own while it is empty), others their own
+        queryset = ScopeResolver.for_request(request).filter(
+            Attendance.objects.all(), include_self=False, active_only=False,
+        )
 
         # Apply additional filters
         user_id = request.query_params.get('user_id')
@@ -1268,19 +1302,12 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         last_day = monthrange(year, month)[1]
         end_date = datetime(year, month, last_day).date()
 
-        # Get attendances
         attendances = Attendance.objects.filter(
             user=target_user,
             date__gte=start_date,
             date__lte=end_date
-        ).order_by('date')
-
-        # Calculate stats
-        total_days = attendances.count()
-        present_days = attendances.filter(status__in=['present', 'late']).count()
-        late_days = attendances.filter(is_late=True).count()
-        wfh_days = attendances.filter(status='wfh').count()
-        total_hours = sum([att.total_hours for att in attendances if att.total_hours], 0)
+        ).select_related('user').order_by('date')
+        stats = get_attendance_stats(target_user, start_date, end_date)
 
         report = {
             'user': {
@@ -1290,92 +1317,98 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             },
             'year': year,
             'month': month,
-            'stats': {
-                'total_days': total_days,
-                'present_days': present_days,
-                'late_days': late_days,
-                'wfh_days': wfh_days,
-                'total_hours': round(total_hours, 2)
-            },
+            'stats': stats,
             'attendances': AttendanceSerializer(attendances, many=True).data
         }
 
         return Response(report)
 
-    @action(detail=False, methods=['get'], permission_classes=[CanManageTeamAttendance])
+    @action(detail=False, methods=['get', 'post'], permission_classes=[CanManageTeamAttendance])
     def export_attendance(self, request):
         """
-        Export attendance to CSV
-        Query params: start_date, end_date, user_id
+        Export attendance as a streamed download (GET) or a background job (POST)
+        Query params: start_date, end_date, user_id, export_format (csv, csv.gz, ndjson)
+        POST returns 202 with a job; poll its status_url, then fetch download_url.
         """
-        import csv
-        from django.http import HttpResponse
-
-        user = request.user
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        user_id = request.query_params.get('user_id')
-
-        queryset = Attendance.objects.all()
-
-        # Apply role-based filtering (same as team_attendance)
-        if user.role == 'manager':
-            try:
-                managed_dept = Department.objects.filter(manager=user).first()
-                if managed_dept:
-                    employee_ids = managed_dept.employees.values_list('user_id', flat=True)
-                    queryset = queryset.filter(user_id__in=employee_ids)
-            except:
-                pass
-        elif user.role == 'team_lead':
-            managed_employee_ids = Employee.objects.filter(manager=user).values_list('user_id', flat=True)
-            queryset = queryset.filter(user_id__in=managed_employee_ids)
-
-        # Apply filters
-        if user_id:
-            queryset = queryset.filter(user_id=user_id)
-        if start_date:
-            try:
-                queryset = queryset.filter(date__gte=datetime.strptime(start_date, '%Y-%m-%d').date())
-            except ValueError:
-                pass
-        if end_date:
-            try:
-                queryset = queryset.filter(date__lte=datetime.strptime(end_date, '%Y-%m-%d').date())
-            except ValueError:
-                pass
+        params = request.query_params if request.method == 'GET' else request.data
+        export_format = params.get('export_format') or 'csv'
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"export_format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        filters = {
+            key: str(params[key]) for key in ('start_date', 'end_date', 'user_id') if params.get(key)
+        }
 
-        queryset = queryset.order_by('-date', '-check_in_time')
-
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="attendance_{timezone.now().strftime("%Y%m%d")}.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Date', 'User', 'Check In', 'Check Out', 'Total Hours', 'Status',
-            'Check In IP', 'Check In Device', 'Check In Location',
-            'Check Out IP', 'Check Out Device', 'Check Out Location'
-        ])
-
-        for att in queryset:
-            writer.writerow([
-                att.date.strftime('%Y-%m-%d'),
-                att.user.get_full_name() or att.user.username,
-                att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                att.total_hours or '',
-                att.get_status_display(),
-                att.check_in_ip or '',
-                f"{att.check_in_device_type} - {att.check_in_device_os}" if att.check_in_device_type else '',
-                att.check_in_address or att.check_in_location or '',
-                att.check_out_ip or '',
-                f"{att.check_out_device_type} - {att.check_out_device_os}" if att.check_out_device_type else '',
-                att.check_out_address or att.check_out_location or ''
-            ])
+        if request.method == 'POST':
+            job = AttendanceExport.objects.create(
+                requested_by=request.user, export_format=export_format, filters=filters
+            )
+            start_attendance_export(job)
+            serializer = AttendanceExportSerializer(job, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+        queryset = attendance_export_queryset(request.user, **filters)
+        response = StreamingHttpResponse(
+            stream_for(request, stream_attendance_export(queryset, export_format)),
+            content_type=EXPORT_FORMATS[export_format][0]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(export_format)}"'
+        return response
 
+    def _get_export_job(self, request, job_id):
+        queryset = AttendanceExport.objects.all()
+        if not request.user.is_superuser:
+            queryset = queryset.filter(requested_by=request.user)
+        return get_object_or_404(queryset, id=job_id)
+
+    @action(
+        detail=False, methods=['get'], permission_classes=[CanManageTeamAttendance],
+        url_path=r'export-jobs/(?P<job_id>[0-9]+)', url_name='export-status'
+    )
+    def export_status(self, request, job_id=None):
+        """Status of a background export job"""
+        job = self._get_export_job(request, job_id)
+        return Response(AttendanceExportSerializer(job, context={'request': request}).data)
+
+    @action(
+        detail=False, methods=['get'], permission_classes=[CanManageTeamAttendance],
+        url_path=r'export-jobs/(?P<job_id>[0-9]+)/download', url_name='export-download'
+    )
+    def export_download(self, request, job_id=None):
+        """Download the file of a completed export job"""
+        job = self._get_export_job(request, job_id)
+        if job.status != 'completed' or not job.file:
+            return Response(
+                {'error': 'Export is not ready', 'status': job.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        response = FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=export_filename(job.export_format, job.created_at),
+            content_type=EXPORT_FORMATS[job.export_format][0]
+        )
+        response.streaming_content = stream_for(request, response.streaming_content)
         return response
 
+    @action(
+        detail=False, methods=['post'], permission_classes=[CanManageTeamAttendance],
+        url_path=r'export-jobs/(?P<job_id>[0-9]+)/retry', url_name='export-retry'
+    )
+    def export_retry(self, request, job_id=None):
+        """Queue a failed export job again (e.g. one interrupted by a worker restart)"""
+        job = self._get_export_job(request, job_id)
+        if not retry_attendance_export(job):
+            return Response(
+                {'error': 'Only failed exports can be retried', 'status': job.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        job.refresh_from_db()
+        serializer = AttendanceExportSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
 
 class AttendanceSettingsViewSet(viewsets.ModelViewSet):
     """
@@ -1391,6 +1424,23 @@ class AttendanceSettingsViewSet(viewsets.ModelViewSet):
         # Always return the single settings instance
         return AttendanceSettings.objects.all()
 
+    def _invalidate_settings_cache(self):
+        # Again after commit: a process reloading between the save signal and the
+        # commit would otherwise keep the old row under the new version
+        transaction.on_commit(lambda: invalidate_tags('hr.attendance_settings'))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self._invalidate_settings_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self._invalidate_settings_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self._invalidate_settings_cache()
+
     @action(detail=False, methods=['get'])
     def current(self, request):
         """Get current attendance settings"""
@@ -1401,6 +1451,48 @@ class AttendanceSettingsViewSet(viewsets.ModelViewSet):
 
 # ===== Leave Management ViewSets =====
 
+class HolidayViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for company holidays
+    Everyone can view holidays, only Admin and Manager can manage them
+    """
+    queryset = Holiday.objects.all()
+    serializer_class = HolidaySerializer
+    permission_classes = [CanManageHR]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        year = self.request.query_params.get('year')
+        if year and year.isdigit():
+            queryset = queryset.filter(date__year=int(year))
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def business_days(self, request):
+        """Count business days in a date range for a user or department (default: yourself)"""
+        try:
+            start_date = datetime.strptime(request.query_params.get('start_date', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'error': 'start_date and end_date are required (YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        department_id = request.query_params.get('department_id')
+        if department_id:
+            department = get_object_or_404(Department, id=department_id)
+            calendar = get_work_calendar(department.working_weekdays)
+        else:
+            calendar = get_user_work_calendar(request.user.id)
+
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'business_days': calendar.count(start_date, end_date),
+        })
+
+
 class LeaveTypeViewSet(viewsets.ModelViewSet):
     """ViewSet for LeaveType (Admin only)"""
     queryset = LeaveType.objects.filter(is_active=True)
@@ -1434,31 +1526,14 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
     queryset = LeaveRequest.objects.all()
     serializer_class = LeaveRequestSerializer
     permission_classes = [CanManageLeaveRequests]
+    bulk_max_requests = 200
+    leave_calendar_max_days = 366
 
     def get_queryset(self):
-        user = self.request.user
-
-        # Admin sees all
-        if user.role == 'admin' or user.is_superuser:
-            return LeaveRequest.objects.all()
-
-        # Manager sees department requests
-        if user.role == 'manager':
-            try:
-                managed_dept = Department.objects.filter(manager=user).first()
-                if managed_dept:
-                    employee_ids = managed_dept.employees.values_list('user_id', flat=True)
-                    return LeaveRequest.objects.filter(user_id__in=employee_ids)
-            except:
-                pass
-
-        # Team Lead sees direct reports
-        if user.role == 'team_lead':
-            managed_employee_ids = Employee.objects.filter(manager=user).values_list('user_id', flat=True)
-            return LeaveRequest.objects.filter(user_id__in=managed_employee_ids)
-
-        # User sees own requests
-        return LeaveRequest.objects.filter(user=user)
+        # Admin sees all, managers and team leads their team (or their own while it is empty), others their own
+        return ScopeResolver.for_request(self.request).filter(
+            LeaveRequest.objects.all(), include_self=False, active_only=False,
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -1482,39 +1557,159 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
         """Approve or reject leave request"""
         leave_request = self.get_object()
 
-        if leave_request.status != 'pending':
+        action_type = request.data.get('action')  # 'approve' or 'reject'
+        rejection_reason = request.data.get('rejection_reason', '')
+        if action_type not in ['approve', 'reject']:
             return Response(
-                {'error': 'Leave request already processed'},
+                {'error': 'Invalid action. Use "approve" or "reject"'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        action_type = request.data.get('action')  # 'approve' or 'reject'
+        with transaction.atomic():
+            # Lock the row so two approvers cannot both process it
+            locked = LeaveRequest.objects.select_for_update().filter(id=leave_request.id, status='pending')
+            if not locked.exists():
+                return Response(
+                    {'error': 'Leave request already processed'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            process_leave_requests([leave_request], action_type, request.user, rejection_reason)
+
+        return Response({
+            'message': 'Leave request approved' if action_type == 'approve' else 'Leave request rejected',
+            'leave_request': LeaveRequestSerializer(leave_request).data
+        })
+
+    @action(detail=False, methods=['post'])
+    def process_bulk(self, request):
+        """
+        Approve or reject many pending leave requests in one transaction
+        Body: ids (list), action ('approve' or 'reject'), rejection_reason (optional)
+        Requests outside your scope, your own requests and already processed ones are skipped.
+        """
+        action_type = request.data.get('action')
         rejection_reason = request.data.get('rejection_reason', '')
+        ids = request.data.get('ids')
+        if action_type not in ['approve', 'reject']:
+            return Response(
+                {'error': 'Invalid action. Use "approve" or "reject"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = {int(value) for value in ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be a list of leave request ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > self.bulk_max_requests:
+            return Response(
+                {'error': f'ids must contain between 1 and {self.bulk_max_requests} leave requests'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if action_type == 'approve':
-            leave_request.status = 'approved'
-            leave_request.approver = request.user
-            leave_request.approved_at = timezone.now()
-            leave_request.save()  # This triggers attendance creation and balance update
+        user = request.user
+        with transaction.atomic():
+            queryset = self.get_queryset().filter(id__in=ids, status='pending')
+            if not (user.role == 'admin' or user.is_superuser):
+                queryset = queryset.exclude(user=user)
+            leave_requests = list(
+                queryset.select_for_update(of=('self',)).select_related('user', 'leave_type').order_by('id')
+            )
+            process_leave_requests(leave_requests, action_type, user, rejection_reason)
 
-            return Response({
-                'message': 'Leave request approved',
-                'leave_request': LeaveRequestSerializer(leave_request).data
-            })
+        processed_ids = {leave_request.id for leave_request in leave_requests}
+        return Response({
+            'processed': LeaveRequestSerializer(leave_requests, many=True).data,
+            'skipped': sorted(ids - processed_ids),
+        })
 
-        elif action_type == 'reject':
-            leave_request.status = 'rejected'
-            leave_request.approver = request.user
-            leave_request.approved_at = timezone.now()
-            leave_request.rejection_reason = rejection_reason
-            leave_request.save()
+    def _leave_threshold(self, request):
+        threshold = request.query_params.get('threshold')
+        if threshold is None:
+            return AttendanceSettings.get_settings().max_concurrent_leave
+        if not threshold.isdigit():
+            raise serializers.ValidationError({'threshold': 'Must be a non-negative integer'})
+        return int(threshold)
 
-            return Response({
-                'message': 'Leave request rejected',
-                'leave_request': LeaveRequestSerializer(leave_request).data
-            })
+    @action(detail=False, methods=['get'])
+    def team_calendar(self, request):
+        """
+        Per-day count of team members on leave, with conflict warnings
+        Query params: start_date, end_date (default: the next 30 days, max 366 days),
+        department_id (admin/manager), scope=direct_reports, threshold
+        (default: AttendanceSettings.max_concurrent_leave)
+        Admin: any department (or everyone); Manager: departments they manage;
+        Team Lead: direct reports
+        """
+        user = request.user
+        department_id = request.query_params.get('department_id')
+
+        try:
+            start_date = request.query_params.get('start_date')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.now().date()
+            end_date = request.query_params.get('end_date')
+            end_date = (
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date
+                else start_date + timedelta(days=30)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date < start_date or (end_date - start_date).days >= self.leave_calendar_max_days:
+            return Response(
+                {'error': f'end_date must be on or after start_date and within {self.leave_calendar_max_days} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if user.role not in ['admin', 'manager', 'team_lead'] and not user.is_superuser:
+            return Response(
+                {'error': 'Only admin, manager or team lead can view the team leave calendar'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        users = get_user_model().objects.filter(is_active=True, employee_profile__is_active=True)
+        if request.query_params.get('scope') == 'direct_reports' or user.role == 'team_lead':
+            users = users.filter(employee_profile__manager=user)
+        elif user.role == 'admin' or user.is_superuser:
+            if department_id:
+                users = users.filter(employee_profile__department_id=department_id)
+        else:
+            departments = Department.objects.filter(manager=user)
+            if department_id:
+                departments = departments.filter(id=department_id)
+                if not departments.exists():
+                    return Response(
+                        {'error': 'You can only view departments you manage'},
+                        status=status.HTTP_403_FORBIDDEN
+                    )
+            users = users.filter(employee_profile__department__in=departments)
 
         return Response(
-            {'error': 'Invalid action. Use "approve" or "reject"'},
-            status=status.HTTP_400_BAD_REQUEST
+            build_team_leave_calendar(users, start_date, end_date, self._leave_threshold(request))
         )
+
+    @action(detail=True, methods=['get'])
+    def conflicts(self, request, pk=None):
+        """
+        Team leave calendar over a request's dates, for the approver
+        Team: the requester's department, or their manager's direct reports
+        when they have no department
+        """
+        if request.user.role not in ['admin', 'manager', 'team_lead'] and not request.user.is_superuser:
+            return Response(
+                {'error': 'Only admin, manager or team lead can view leave conflicts'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        leave_request = self.get_object()
+
+        users = get_user_model().objects.filter(is_active=True, employee_profile__is_active=True)
+        employee = Employee.objects.filter(user_id=leave_request.user_id).first()
+        if employee and employee.department_id:
+            users = users.filter(employee_profile__department_id=employee.department_id)
+        elif employee and employee.manager_id:
+            users = users.filter(employee_profile__manager_id=employee.manager_id)
+        else:
+            users = users.filter(id=leave_request.user_id)
+
+        return Response(build_team_leave_calendar(
+            users, leave_request.start_date, leave_request.end_date, self._leave_threshold(request)
+        ))
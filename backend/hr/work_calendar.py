@@ -0,0 +1,138 @@
+"""
+Business-day calendar.
+
+A ``WorkCalendar`` combines one working week (the weekdays a department works,
+``Department.working_weekdays``) with the company holidays. It precomputes how
+many business days fall before every date of a window of years, so counting
+the business days of any range is two array lookups. Outside the window there
+are no holidays and the working week simply repeats, which is O(1) as well.
+
+Calendars are built once per working week and kept per process until a
+holiday changes (tag ``hr.work_calendar``).
+"""
+from array import array
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+from config.cache import LocalSnapshot
+
+from .models import Employee, Holiday
+
+DEFAULT_WORKING_WEEKDAYS = (0, 1, 2, 3, 4)  # Monday = 0, Sunday = 6
+
+# Years indexed on each side of the current year (widened to cover every holiday)
+INDEX_YEARS = 5
+
+
+def normalize_weekdays(weekdays):
+    """Sorted tuple of weekday numbers; None means the default Monday-Friday week."""
+    if weekdays is None:
+        return DEFAULT_WORKING_WEEKDAYS
+    return tuple(sorted({int(weekday) for weekday in weekdays}))
+
+
+class WorkCalendar:
+    """Business days of one working week plus a set of holidays."""
+
+    def __init__(self, weekdays=DEFAULT_WORKING_WEEKDAYS, holidays=(), first_year=None, last_year=None):
+        self.weekdays = frozenset(normalize_weekdays(weekdays))
+        self.holidays = frozenset(holidays)
+
+        today = timezone.now().date()
+        years = [today.year - INDEX_YEARS, today.year + INDEX_YEARS]
+        years.extend(holiday.year for holiday in self.holidays)
+        self.origin = date(first_year or min(years), 1, 1)
+        self.end = date(last_year or max(years), 12, 31)
+
+        # _partial[w][n]: working weekdays among n consecutive days starting on weekday w
+        self._partial = []
+        for start_weekday in range(7):
+            counts = [0]
+            for offset in range(7):
+                counts.append(counts[-1] + ((start_weekday + offset) % 7 in self.weekdays))
+            self._partial.append(counts)
+
+        # _cumulative[i]: business days in [origin, origin + i days)
+        span = (self.end - self.origin).days + 1
+        cumulative = array('l', [0]) * (span + 1)
+        running = 0
+        day = self.origin
+        for index in range(span):
+            if day.weekday() in self.weekdays and day not in self.holidays:
+                running += 1
+            cumulative[index + 1] = running
+            day += timedelta(days=1)
+        self._cumulative = cumulative
+
+    def _weekly_count(self, start, days):
+        """Working weekdays in the ``days`` days from ``start``, ignoring holidays."""
+        full_weeks, remainder = divmod(days, 7)
+        return full_weeks * len(self.weekdays) + self._partial[start.weekday()][remainder]
+
+    def _before(self, day):
+        """Business days from the index origin up to ``day`` (exclusive); negative before the origin."""
+        offset = (day - self.origin).days
+        if offset < 0:
+            return -self._weekly_count(day, -offset)
+        last = len(self._cumulative) - 1
+        if offset <= last:
+            return self._cumulative[offset]
+        return self._cumulative[last] + self._weekly_count(self.end + timedelta(days=1), offset - last)
+
+    def count(self, start_date, end_date):
+        """Business days between two dates, both inclusive."""
+        if end_date < start_date:
+            return 0
+        return self._before(end_date + timedelta(days=1)) - self._before(start_date)
+
+    def is_business_day(self, day):
+        return day.weekday() in self.weekdays and day not in self.holidays
+
+    def business_days(self, start_date, end_date):
+        """Yield the business days between two dates, both inclusive."""
+        day = start_date
+        while day <= end_date:
+            if self.is_business_day(day):
+                yield day
+            day += timedelta(days=1)
+
+
+class WorkCalendars:
+    """The company holidays plus one lazily built WorkCalendar per working week."""
+
+    def __init__(self, holidays):
+        self.holidays = frozenset(holidays)
+        self._calendars = {}
+
+    def get(self, weekdays=None):
+        weekdays = normalize_weekdays(weekdays)
+        calendar = self._calendars.get(weekdays)
+        if calendar is None:
+            calendar = self._calendars.setdefault(weekdays, WorkCalendar(weekdays, self.holidays))
+        return calendar
+
+
+def _load_work_calendars():
+    return WorkCalendars(Holiday.objects.values_list('date', flat=True))
+
+
+_work_calendars = LocalSnapshot('hr.work_calendar', _load_work_calendars)
+
+
+def get_work_calendar(weekdays=None):
+    """Calendar for ``weekdays`` (default Monday-Friday) and the current holidays."""
+    return _work_calendars.get().get(weekdays)
+
+
+def get_user_work_calendars(user_ids):
+    """Calendar per user id, from the working week of each user's department (one query)."""
+    calendars = _work_calendars.get()
+    weekdays_by_user = dict(
+        Employee.objects.filter(user_id__in=user_ids).values_list('user_id', 'department__working_weekdays')
+    )
+    return {user_id: calendars.get(weekdays_by_user.get(user_id)) for user_id in user_ids}
+
+
+def get_user_work_calendar(user_id):
+    return get_user_work_calendars([user_id])[user_id]
@@ -0,0 +1,54 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import Notification
+from .services import notification_group_name
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes the current user's notifications and unread-count changes
+
+    Server -> client messages:
+        {"type": "unread_count", "count": 5}             on connect and on {"action": "sync"}
+        {"type": "notification", "notification": {...}, "unread_delta": 1}
+        {"type": "unread_delta", "delta": -3}
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.group_name = notification_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_unread_count()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('action') == 'sync':
+            await self.send_unread_count()
+
+    async def send_unread_count(self):
+        await self.send_json({'type': 'unread_count', 'count': await self.get_unread_count()})
+
+    @database_sync_to_async
+    def get_unread_count(self):
+        return Notification.objects.filter(recipient=self.scope['user'], is_read=False).count()
+
+    # Channel layer event handlers
+
+    async def notification_created(self, event):
+        await self.send_json({
+            'type': 'notification',
+            'notification': event['notification'],
+            'unread_delta': event['unread_delta'],
+        })
+
+    async def notification_unread_delta(self, event):
+        await self.send_json({'type': 'unread_delta', 'delta': event['delta']})
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+        ("tasks", "0010_taskchangehistory"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["recipient", "-created_at", "-id"],
+                name="notificatio_recipie_e86c4c_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="notificatio_created_cf8b4e_idx"
+            ),
+        ),
+    ]
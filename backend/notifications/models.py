@@ -53,6 +53,10 @@ class Notification(models.Model):
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.get_notification_type_display()} - {self.recipient.username}"
@@ -1,5 +1,59 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
 from .models import Notification
 
+logger = logging.getLogger(__name__)
+
+
+def notification_group_name(user_id):
+    """Channel layer group that every socket of ``user_id`` joins."""
+    return f'notifications.user.{user_id}'
+
+
+def _group_send(user_id, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(notification_group_name(user_id), message)
+    except Exception as exc:
+        # Clients re-sync their count on reconnect, so a lost push is not fatal
+        logger.warning('Could not push notification event to user %s: %s', user_id, exc)
+
+
+def publish_notification(notification):
+    """Push a new notification (and a +1 unread delta) to its recipient once the transaction commits."""
+    from .serializers import NotificationSerializer
+
+    def send():
+        _group_send(notification.recipient_id, {
+            'type': 'notification.created',
+            'notification': NotificationSerializer(notification).data,
+            'unread_delta': 0 if notification.is_read else 1,
+        })
+
+    transaction.on_commit(send)
+
+
+def publish_unread_delta(user_id, delta):
+    """Push an unread-count change to ``user_id`` once the transaction commits."""
+    if not delta:
+        return
+    transaction.on_commit(lambda: _group_send(user_id, {
+        'type': 'notification.unread_delta',
+        'delta': delta,
+    }))
+
+
+def _create_notification(**fields):
+    notification = Notification.objects.create(**fields)
+    publish_notification(notification)
+    return notification
+
 
 def create_task_assigned_notification(task, assigned_by=None):
     if not task or not task.assigned_to:
@@ -11,7 +65,7 @@ def create_task_assigned_notification(task, assigned_by=None):
         else 'System'
     )
 
-    return Notification.objects.create(
+    return _create_notification(
         recipient=task.assigned_to,
         notification_type='task_assigned',
         title='New task assigned',
@@ -41,7 +95,7 @@ def create_task_status_changed_notification(task, changed_by=None, old_status=No
     notifications = []
     for recipient in recipients:
         notifications.append(
-            Notification.objects.create(
+            _create_notification(
                 recipient=recipient,
                 notification_type='task_status_changed',
                 title='Task status updated',
@@ -63,7 +117,7 @@ def create_task_review_completed_notification(task, reviewer=None, overall_statu
     )
     status_label = overall_status or task.status
 
-    return Notification.objects.create(
+    return _create_notification(
         recipient=task.assigned_to,
         notification_type='review_completed',
         title='Task review completed',
@@ -1,3 +1,138 @@
-from django.test import TestCase
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import transaction
+from django.test import Client, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from accounts.middleware import JWTAuthMiddlewareStack
+from accounts.models import User
+from config.routing import websocket_urlpatterns
+from projects.models import Project
+from tasks.models import Task
+
+from .models import Notification
+from .services import create_task_assigned_notification
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class NotificationConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ws_staff', password='password', role='staff')
+        self.manager = User.objects.create_user(username='ws_manager', password='password', role='manager')
+        project = Project.objects.create(name='Realtime', created_by=self.manager)
+        self.task = Task.objects.create(title='Push me', project=project, assigned_to=self.user)
+        Notification.objects.create(
+            recipient=self.user,
+            notification_type='new_comment',
+            title='Earlier',
+            message='Earlier notification',
+        )
+
+    async def connect(self, user=None, headers=None, application=None):
+        path = '/ws/notifications/'
+        if user is not None:
+            path += f'?token={AccessToken.for_user(user)}'
+        application = application or JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        communicator = WebsocketCommunicator(application, path, headers=headers or [])
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def test_rejects_connection_without_token(self):
+        communicator, connected, code = await self.connect()
+
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_session_cookie_is_not_accepted(self):
+        @database_sync_to_async
+        def session_cookie():
+            client = Client()
+            client.force_login(self.user)
+            return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        cookie = f'{settings.SESSION_COOKIE_NAME}={await session_cookie()}'
+        communicator, connected, code = await self.connect(headers=[(b'cookie', cookie.encode())])
+
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    @override_settings(ALLOWED_HOSTS=['workhub.example'])
+    async def test_foreign_origin_is_rejected(self):
+        # Built here: the validator reads ALLOWED_HOSTS when it is created
+        application = AllowedHostsOriginValidator(JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns)))
+
+        communicator, connected, _ = await self.connect(
+            self.user, headers=[(b'origin', b'https://attacker.example')], application=application,
+        )
+        self.assertFalse(connected)
+
+        communicator, connected, _ = await self.connect(
+            self.user, headers=[(b'origin', b'https://workhub.example')], application=application,
+        )
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_sends_unread_count_on_connect(self):
+        communicator, connected, _ = await self.connect(self.user)
+
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'count': 1})
+        await communicator.disconnect()
+
+    async def test_new_notification_is_pushed_after_commit(self):
+        communicator, _, _ = await self.connect(self.user)
+        await communicator.receive_json_from()
+
+        @database_sync_to_async
+        def assign():
+            with transaction.atomic():
+                create_task_assigned_notification(self.task, assigned_by=self.manager)
+
+        await assign()
+        message = await communicator.receive_json_from()
+
+        self.assertEqual(message['type'], 'notification')
+        self.assertEqual(message['unread_delta'], 1)
+        self.assertEqual(message['notification']['notification_type'], 'task_assigned')
+        self.assertEqual(message['notification']['task'], self.task.id)
+        await communicator.disconnect()
+
+    async def test_rolled_back_notification_is_not_pushed(self):
+        communicator, _, _ = await self.connect(self.user)
+        await communicator.receive_json_from()
+
+        @database_sync_to_async
+        def assign_and_roll_back():
+            with transaction.atomic():
+                create_task_assigned_notification(self.task, assigned_by=self.manager)
+                transaction.set_rollback(True)
+
+        await assign_and_roll_back()
+
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_mark_all_read_pushes_negative_delta(self):
+        communicator, _, _ = await self.connect(self.user)
+        await communicator.receive_json_from()
+
+        @database_sync_to_async
+        def mark_all_read():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return client.post('/api/notifications/mark_all_read/')
+
+        response = await mark_all_read()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_delta', 'delta': -1})
+
+        await communicator.send_json_to({'action': 'sync'})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unread_count', 'count': 0})
+        await communicator.disconnect()
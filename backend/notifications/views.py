@@ -4,13 +4,17 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
+from django.db import transaction
+from django.db.models import Count
 
 from .models import Notification
 from .serializers import NotificationSerializer, NotificationCreateSerializer
+from .services import publish_notification, publish_unread_delta
+from config.pagination import CursorPaginationMixin
 from accounts.permissions import IsAdmin
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for Notification operations
     Users can only see their own notifications
@@ -20,6 +24,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['notification_type', 'is_read', 'task']
     ordering = ['-created_at']
+    cursor_pagination = {'list': ('-created_at', '-id')}
 
     def get_queryset(self):
         """Users only see their own notifications"""
@@ -43,6 +48,21 @@ class NotificationViewSet(viewsets.ModelViewSet):
             return [IsAdmin()]
         return [IsAuthenticated()]
 
+    def perform_create(self, serializer):
+        notification = serializer.save()
+        publish_notification(notification)
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        notification = serializer.save()
+        if notification.is_read != was_read:
+            publish_unread_delta(notification.recipient_id, -1 if notification.is_read else 1)
+
+    def perform_destroy(self, instance):
+        if not instance.is_read:
+            publish_unread_delta(instance.recipient_id, -1)
+        instance.delete()
+
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get unread notifications for current user"""
@@ -63,7 +83,10 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def mark_read(self, request, pk=None):
         """Mark a notification as read"""
         notification = self.get_object()
+        was_read = notification.is_read
         notification.mark_as_read()
+        if not was_read:
+            publish_unread_delta(notification.recipient_id, -1)
 
         return Response({
             'message': 'Notification marked as read',
@@ -73,7 +96,15 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read for current user"""
-        count = self.get_queryset().filter(is_read=False).update(is_read=True)
+        unread = self.get_queryset().filter(is_read=False)
+        with transaction.atomic():
+            # Admins may mark other users' notifications, so push per recipient
+            per_recipient = list(
+                unread.order_by().values('recipient').annotate(total=Count('id')).values_list('recipient', 'total')
+            )
+            count = unread.update(is_read=True)
+            for recipient_id, total in per_recipient:
+                publish_unread_delta(recipient_id, -total)
 
         return Response({
             'message': f'{count} notification(s) marked as read',
@@ -84,8 +115,11 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def mark_unread(self, request, pk=None):
         """Mark a notification as unread"""
         notification = self.get_object()
+        was_read = notification.is_read
         notification.is_read = False
         notification.save()
+        if was_read:
+            publish_unread_delta(notification.recipient_id, 1)
 
         return Response({
             'message': 'Notification marked as unread',
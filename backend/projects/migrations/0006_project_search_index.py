@@ -0,0 +1,55 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:10
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# GIN index over the weighted name/client/description tsvector of projects, and a
+# trigram index on UPPER(client_name), the expression icontains compares, so
+# fragments of client names are found without a scan.
+# pg_trgm is created here for every app (crm depends on this migration).
+# PostgreSQL only; other backends fall back to icontains (config.search).
+
+
+def search_indexes():
+    # Must stay identical to SearchDocument.vector() of the Project viewset
+    yield GinIndex(
+        SearchVector("name", weight="A", config="simple")
+        + SearchVector("client_name", weight="B", config="simple")
+        + SearchVector("description", weight="C", config="simple"),
+        name="projects_project_search_gin",
+    )
+    yield GinIndex(
+        OpClass(Upper("client_name"), name="gin_trgm_ops"),
+        name="projects_client_name_trgm",
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("projects", "Project")
+    for index in search_indexes():
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("projects", "Project")
+    for index in search_indexes():
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0005_projectstage"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,31 @@
+"""Cache invalidation rules for project data."""
+from config.cache import invalidate_on, invalidate_on_m2m
+
+from tasks.models import Task
+from .models import DesignRule, Project, ProjectStage, Topic
+
+
+def _project_tag(instance):
+    return [f'project:{instance.pk}']
+
+
+def _parent_project_tag(instance):
+    return [f'project:{instance.project_id}']
+
+
+def _membership_tags(instance, pk_set, reverse):
+    if not reverse:
+        return [f'project:{instance.pk}']
+    if pk_set is None:
+        # Reverse clear: the affected projects are unknown
+        return [f'project:{pk}' for pk in Project.objects.values_list('pk', flat=True)]
+    return [f'project:{pk}' for pk in pk_set]
+
+
+invalidate_on(Project, _project_tag)
+invalidate_on(Task, _parent_project_tag)
+invalidate_on(Topic, _parent_project_tag)
+invalidate_on(DesignRule, _parent_project_tag)
+invalidate_on(ProjectStage, _parent_project_tag)
+invalidate_on_m2m(Project.members.through, _membership_tags)
+invalidate_on_m2m(Project.departments.through, _membership_tags)
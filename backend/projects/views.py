@@ -16,6 +16,9 @@ from .serializers import (
     DesignRuleSerializer,
     ProjectStageSerializer
 )
+from config.cache import cache_response
+from config.search import FullTextSearchFilter, SearchDocument
+from tasks.board import status_counts
 from accounts.permissions import IsManagerOrAdmin, IsManagerAdminOrStaffReadOnly, IsManagerAdminTeamLeadOrStaff
 
 
@@ -28,9 +31,11 @@ class ProjectViewSet(viewsets.ModelViewSet):
     """
     queryset = Project.objects.all()
     permission_classes = [IsManagerAdminOrStaffReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['status', 'created_by']
-    search_fields = ['name', 'description', 'client_name']
+    search_document = SearchDocument(
+        {'name': 'A', 'client_name': 'B', 'description': 'C'}, contains_fields=['client_name']
+    )
     ordering_fields = ['created_at', 'name', 'start_date', 'end_date']
     ordering = ['-created_at']
 
@@ -144,29 +149,22 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
+    @cache_response('projects.statistics', tags=['project:{pk}'])
     def statistics(self, request, pk=None):
         """Get project statistics"""
         project = self.get_object()
 
         # Task statistics
-        tasks = project.tasks.all()
-        total_tasks = tasks.count()
+        tasks_by_status = status_counts(project.tasks.all())
+        total_tasks = sum(tasks_by_status.values())
 
         stats = {
             'total_tasks': total_tasks,
-            'tasks_by_status': {
-                'new': tasks.filter(status='new').count(),
-                'assigned': tasks.filter(status='assigned').count(),
-                'working': tasks.filter(status='working').count(),
-                'review_pending': tasks.filter(status='review_pending').count(),
-                'approved': tasks.filter(status='approved').count(),
-                'rejected': tasks.filter(status='rejected').count(),
-                'completed': tasks.filter(status='completed').count(),
-            },
+            'tasks_by_status': tasks_by_status,
             'total_topics': project.topics.count(),
             'total_design_rules': project.design_rules.count(),
             'completion_rate': (
-                (project.completed_tasks / total_tasks * 100)
+                (tasks_by_status['completed'] / total_tasks * 100)
                 if total_tasks > 0 else 0
             )
         }
@@ -0,0 +1,73 @@
+"""
+Task visibility for staff.
+
+Staff see a task when they are its ``assigned_to`` user or one of its
+assignees, a member of its project, or an employee of a department linked to
+the project. Asked as one query that is a four-way OR across M2M joins plus a
+DISTINCT over the whole result, so the answer is kept materialised in
+``TaskAccess`` instead: one row per (user, task), and a staff task list is a
+single join on the unique (user, task) index.
+
+``refresh_task_access`` recomputes the pairs of a slice of tasks and/or users
+from the source relations and writes only the difference, so a pair stays as
+long as any path still grants it. tasks.signals calls it with the slice each
+change touches.
+"""
+from django.db import transaction
+
+from .models import Task, TaskAccess
+
+
+def _granted_pairs(tasks, user_ids):
+    """(user_id, task_id) pairs granted by any path, for ``tasks`` and optionally ``user_ids``."""
+    def path(queryset, user_field, task_field):
+        # One filter() call, so the lookup and the selected column share the same M2M join
+        lookup = {f'{user_field}__isnull': False} if user_ids is None else {f'{user_field}__in': user_ids}
+        return queryset.filter(**lookup).order_by().values_list(user_field, task_field)
+
+    first, *rest = [
+        path(tasks, 'assigned_to', 'id'),
+        path(Task.assignees.through.objects.filter(task__in=tasks), 'user', 'task_id'),
+        path(tasks, 'project__members', 'id'),
+        path(tasks, 'project__departments__employees__user', 'id'),
+    ]
+    return set(first.union(*rest))
+
+
+def refresh_task_access(task_ids=None, project_ids=None, user_ids=None, grant=True, batch_size=1000):
+    """
+    Bring TaskAccess up to date for the tasks in ``task_ids``/``project_ids``
+    and the users in ``user_ids`` (lists or subqueries; None means all).
+
+    ``grant=False`` only removes pairs, for deletions, which cannot grant
+    anything and may run while the user row itself is being deleted.
+    Returns (created, deleted).
+    """
+    tasks = Task.objects.all()
+    if task_ids is not None:
+        tasks = tasks.filter(id__in=task_ids)
+    if project_ids is not None:
+        tasks = tasks.filter(project_id__in=project_ids)
+
+    with transaction.atomic():
+        granted = _granted_pairs(tasks, user_ids)
+        existing = TaskAccess.objects.filter(task__in=tasks)
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+
+        stale = []
+        for row_id, user_id, task_id in existing.values_list('id', 'user_id', 'task_id'):
+            if (user_id, task_id) in granted:
+                granted.discard((user_id, task_id))
+            else:
+                stale.append(row_id)
+        if stale:
+            TaskAccess.objects.filter(id__in=stale).delete()
+        if not grant:
+            granted = set()
+        TaskAccess.objects.bulk_create(
+            [TaskAccess(user_id=user_id, task_id=task_id) for user_id, task_id in granted],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+    return len(granted), len(stale)
@@ -0,0 +1,54 @@
+"""
+Kanban board.
+
+A board is the visible tasks split into one column per status. Rather than
+one list request per column, ``status_counts`` counts every column in one
+GROUP BY and ``board_cards`` reads the first cards of every column in one
+query, numbering rows with ``ROW_NUMBER() OVER (PARTITION BY status ORDER BY
+created_at DESC, id DESC)`` and keeping those within the limit. Deeper cards
+of a column are loaded from the task list with keyset pagination in the same
+``BOARD_ORDERING``, starting after the last card shown.
+"""
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Task
+
+BOARD_ORDERING = ('-created_at', '-id')
+BOARD_STATUSES = [status for status, _ in Task.STATUS_CHOICES]
+
+
+def _one_row_per_task(queryset):
+    # Visibility filters that join a M2M repeat tasks (hence their distinct()),
+    # which would skew both the counts and the row numbers
+    if queryset.query.distinct:
+        return Task.objects.filter(pk__in=queryset.values('pk'))
+    return queryset
+
+
+def status_counts(queryset):
+    """Tasks of ``queryset`` per status, every status included (one query)."""
+    counts = dict.fromkeys(BOARD_STATUSES, 0)
+    rows = _one_row_per_task(queryset).order_by().values_list('status').annotate(count=Count('id'))
+    counts.update(rows)
+    return counts
+
+
+def board_cards(queryset, per_column, prepare=None):
+    """
+    The first ``per_column`` tasks of each status in ``BOARD_ORDERING``,
+    grouped by status (one query, plus whatever ``prepare`` prefetches).
+    """
+    queryset = _one_row_per_task(queryset)
+    if prepare is not None:
+        queryset = prepare(queryset)
+    cards = queryset.annotate(board_row=Window(
+        RowNumber(),
+        partition_by=[F('status')],
+        order_by=list(BOARD_ORDERING),
+    )).filter(board_row__lte=per_column).order_by('status', 'board_row')
+
+    columns = {status: [] for status in BOARD_STATUSES}
+    for card in cards:
+        columns.setdefault(card.status, []).append(card)
+    return columns
@@ -0,0 +1,55 @@
+"""
+Threaded task comments.
+
+Comments form a tree through ``parent``. ``comment_tree`` reads a task's whole
+thread in one query (authors and design rules joined) and links every comment
+to its replies in memory. ``load_replies`` does the same below one page of
+comments down to a fixed depth, one query per level, and leaves deeper
+replies to be fetched on demand with ``parent=<id>``.
+
+Either way each comment carries ``loaded_replies`` (None when not loaded) and
+``reply_count``, which TaskCommentSerializer reads instead of querying.
+"""
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import TaskComment
+
+COMMENT_RELATED = ('user', 'design_rule')
+COMMENT_ORDERING = ('created_at', 'id')
+
+
+def comment_tree(task):
+    """Top-level comments of ``task`` with every reply linked below them (one query)."""
+    comments = list(task.comments.select_related(*COMMENT_RELATED).order_by(*COMMENT_ORDERING))
+    replies = defaultdict(list)
+    for comment in comments:
+        replies[comment.parent_id].append(comment)
+    for comment in comments:
+        comment.loaded_replies = replies[comment.id]
+        comment.reply_count = len(comment.loaded_replies)
+    return replies[None]
+
+
+def comments_with_reply_counts(queryset):
+    return queryset.select_related(*COMMENT_RELATED).annotate(reply_count=Count('replies'))
+
+
+def load_replies(comments, depth):
+    """Link replies below ``comments`` for ``depth`` levels; deeper comments keep only reply_count."""
+    level = list(comments)
+    for _ in range(depth):
+        parents = [comment for comment in level if comment.reply_count]
+        for comment in level:
+            comment.loaded_replies = []
+        if not parents:
+            return
+        level = list(comments_with_reply_counts(
+            TaskComment.objects.filter(parent__in=[comment.id for comment in parents])
+        ).order_by(*COMMENT_ORDERING))
+        by_id = {comment.id: comment for comment in parents}
+        for reply in level:
+            by_id[reply.parent_id].loaded_replies.append(reply)
+    for comment in level:
+        comment.loaded_replies = None
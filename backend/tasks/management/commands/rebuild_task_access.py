@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from tasks.access import refresh_task_access
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute TaskAccess from task assignments, project members and project departments. '
+        'Use to repair it after raw SQL or bulk updates; only missing or stale rows are written.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task', type=int, action='append', dest='task_ids', help='Only this task id (repeatable).')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Tasks checked per transaction. Default: 500.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        task_ids = options.get('task_ids') or list(Task.objects.order_by('id').values_list('id', flat=True))
+
+        created = deleted = 0
+        for offset in range(0, len(task_ids), batch_size):
+            batch_created, batch_deleted = refresh_task_access(task_ids=task_ids[offset:offset + batch_size])
+            created += batch_created
+            deleted += batch_deleted
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Task access checked for {len(task_ids)} tasks: {created} rows added, {deleted} removed.'
+        ))
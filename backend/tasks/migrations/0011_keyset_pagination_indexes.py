@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 04:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0005_projectstage"),
+        ("tasks", "0010_taskchangehistory"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="taskchangehistory",
+            index=models.Index(
+                fields=["task", "-changed_at", "-id"],
+                name="tasks_taskc_task_id_0dffa3_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taskcomment",
+            index=models.Index(
+                fields=["task", "created_at", "id"],
+                name="tasks_taskc_task_id_0154f1_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_task_access(apps, schema_editor):
+    Task = apps.get_model("tasks", "Task")
+    TaskAccess = apps.get_model("tasks", "TaskAccess")
+
+    paths = [
+        ("assigned_to", "id"),
+        ("assignees", "id"),
+        ("project__members", "id"),
+        ("project__departments__employees__user", "id"),
+    ]
+    pairs = set()
+    for user_field, task_field in paths:
+        pairs.update(
+            Task.objects.filter(**{f"{user_field}__isnull": False})
+            .order_by()
+            .values_list(user_field, task_field)
+        )
+    TaskAccess.objects.bulk_create(
+        [TaskAccess(user_id=user_id, task_id=task_id) for user_id, task_id in pairs],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hr", "0016_employee_hierarchy"),
+        ("projects", "0005_projectstage"),
+        ("tasks", "0011_keyset_pagination_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskAccess",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="access",
+                        to="tasks.task",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="taskaccess",
+            constraint=models.UniqueConstraint(
+                fields=("user", "task"), name="tasks_access_user_task_unique"
+            ),
+        ),
+        migrations.RunPython(backfill_task_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0006_project_search_index"),
+        ("tasks", "0013_task_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["project", "status", "-created_at", "-id"],
+                name="tasks_task_project_134cf8_idx",
+            ),
+        ),
+    ]
@@ -158,6 +158,9 @@ class Task(models.Model):
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['project', 'status', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
@@ -173,6 +176,13 @@ class Task(models.Model):
             'completed': 'not_started',
         }
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What TaskAccess was last computed from (see tasks.signals)
+        instance._loaded_access = (instance.__dict__.get('project_id'), instance.__dict__.get('assigned_to_id'))
+        return instance
+
     def save(self, *args, **kwargs):
         """Override save để khởi tạo stage_progress"""
         if not self.stage_progress:
@@ -182,6 +192,7 @@ class Task(models.Model):
             if self.stage_progress[self.stage] == 'not_started':
                 self.stage_progress[self.stage] = 'in_progress'
         super().save(*args, **kwargs)
+        self._loaded_access = (self.project_id, self.assigned_to_id)
 
     @property
     def is_overdue(self):
@@ -192,6 +203,29 @@ class Task(models.Model):
         return False
 
 
+class TaskAccess(models.Model):
+    """
+    Materialised task visibility: one row per (user, task) the user can see
+    through assignment, project membership or a project department.
+    Maintained by tasks.access; never edited directly.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,  # leads the unique index below
+    )
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='access')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task'], name='tasks_access_user_task_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.task_id}"
+
+
 class TaskFile(models.Model):
     """
     Model để quản lý files đính kèm trong task
@@ -298,6 +332,9 @@ class TaskComment(models.Model):
         verbose_name = 'Task Comment'
         verbose_name_plural = 'Task Comments'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['task', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username if self.user else 'Unknown'} - {self.task.title}"
@@ -305,7 +342,7 @@ class TaskComment(models.Model):
     @property
     def is_reply(self):
         """Kiểm tra có phải là reply không"""
-        return self.parent is not None
+        return self.parent_id is not None
 
 
 class TaskChangeHistory(models.Model):
@@ -335,6 +372,9 @@ class TaskChangeHistory(models.Model):
         verbose_name = 'Task Change History'
         verbose_name_plural = 'Task Change Histories'
         ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['task', '-changed_at', '-id']),
+        ]
 
     def __str__(self):
         user = self.changed_by.username if self.changed_by else 'unknown'
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from .comments import comment_tree
 from .models import Task, TaskFile, TaskComment, TaskChangeHistory
 from projects.serializers import DesignRuleSerializer
 
@@ -61,13 +62,14 @@ class TaskCommentSerializer(serializers.ModelSerializer):
     pass_fail_display = serializers.SerializerMethodField()
     attachment_url = serializers.SerializerMethodField()
     replies = serializers.SerializerMethodField()
+    reply_count = serializers.SerializerMethodField()
     is_reply = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = TaskComment
         fields = [
             'id', 'task', 'user', 'user_username', 'user_role',
-            'user_full_name', 'comment', 'parent', 'is_reply', 'replies',
+            'user_full_name', 'comment', 'parent', 'is_reply', 'replies', 'reply_count',
             'design_rule', 'design_rule_name', 'is_passed', 'pass_fail_display',
             'attachment', 'attachment_url',
             'created_at', 'updated_at'
@@ -88,15 +90,24 @@ class TaskCommentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Either comment text or attachment is required.')
         return super().create(validated_data)
 
+    def _loaded_replies(self, obj):
+        # Set by tasks.comments for whole trees; single comments load their replies here
+        if not hasattr(obj, 'loaded_replies'):
+            obj.loaded_replies = list(obj.replies.select_related('user', 'design_rule'))
+        return obj.loaded_replies
+
     def get_replies(self, obj):
-        """Get nested replies"""
-        if obj.replies.exists():
-            return TaskCommentSerializer(
-                obj.replies.all(),
-                many=True,
-                context=self.context
-            ).data
-        return []
+        """Get nested replies (empty below the loaded depth, see reply_count)"""
+        replies = self._loaded_replies(obj)
+        if not replies:
+            return []
+        return TaskCommentSerializer(replies, many=True, context=self.context).data
+
+    def get_reply_count(self, obj):
+        reply_count = getattr(obj, 'reply_count', None)
+        if reply_count is None:
+            reply_count = len(self._loaded_replies(obj))
+        return reply_count
 
     def get_user_full_name(self, obj):
         if not obj.user:
@@ -142,8 +153,9 @@ class TaskListSerializer(serializers.ModelSerializer):
     project_stage_color = serializers.CharField(source='project_stage.color', read_only=True)
     is_overdue = serializers.BooleanField(read_only=True)
     freelancer_earning = serializers.SerializerMethodField()
-    resource_count = serializers.SerializerMethodField()
-    upload_count = serializers.SerializerMethodField()
+    # Annotated by TaskViewSet's list queryset
+    resource_count = serializers.IntegerField(read_only=True)
+    upload_count = serializers.IntegerField(read_only=True)
     assignee_names = serializers.SerializerMethodField()
 
     class Meta:
@@ -178,12 +190,6 @@ class TaskListSerializer(serializers.ModelSerializer):
             return None
         return obj.reviewer.get_full_name() or obj.reviewer.username
 
-    def get_resource_count(self, obj):
-        return obj.files.filter(file_type='reference').count()
-
-    def get_upload_count(self, obj):
-        return obj.files.exclude(file_type='reference').count()
-
     def get_assignee_names(self, obj):
         return [
             {'id': u.id, 'full_name': u.get_full_name() or u.username, 'username': u.username}
@@ -245,10 +251,9 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_comments(self, obj):
-        """Get only top-level comments (not replies)"""
-        comments = obj.comments.filter(parent=None)
+        """Top-level comments with their replies nested, read in one query"""
         return TaskCommentSerializer(
-            comments,
+            comment_tree(obj),
             many=True,
             context=self.context
         ).data
@@ -0,0 +1,76 @@
+"""Keep TaskAccess in step with the relations that grant task visibility."""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from hr.models import Department, Employee
+from projects.models import Project
+
+from .access import refresh_task_access
+from .models import Task
+
+M2M_ACTIONS = ('post_add', 'post_remove', 'post_clear')
+
+
+def _task_saved(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_loaded_access', None) != (instance.project_id, instance.assigned_to_id):
+        refresh_task_access(task_ids=[instance.pk])
+
+
+def _assignees_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if reverse:
+        # user.assignee_tasks.add(...): pk_set holds tasks (None for clear)
+        refresh_task_access(task_ids=pk_set, user_ids=[instance.pk])
+    else:
+        refresh_task_access(task_ids=[instance.pk], user_ids=pk_set)
+
+
+def _members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if reverse:
+        refresh_task_access(project_ids=pk_set, user_ids=[instance.pk])
+    else:
+        refresh_task_access(project_ids=[instance.pk], user_ids=pk_set)
+
+
+def _departments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if reverse:
+        employees = Employee.objects.filter(department=instance)
+        refresh_task_access(project_ids=pk_set, user_ids=employees.values('user_id'))
+    else:
+        employees = None if pk_set is None else Employee.objects.filter(department_id__in=pk_set)
+        refresh_task_access(
+            project_ids=[instance.pk], user_ids=None if employees is None else employees.values('user_id')
+        )
+
+
+def _employee_saved(sender, instance, created, **kwargs):
+    loaded_department_id = getattr(instance, '_loaded_team', (None, None))[0]
+    if created or loaded_department_id != instance.department_id:
+        refresh_task_access(user_ids=[instance.user_id])
+
+
+def _employee_deleted(sender, instance, **kwargs):
+    refresh_task_access(user_ids=[instance.user_id], grant=False)
+
+
+def _department_deleting(sender, instance, **kwargs):
+    # Employees are detached with a bulk UPDATE that sends no signals
+    instance._access_user_ids = list(instance.employees.values_list('user_id', flat=True))
+
+
+def _department_deleted(sender, instance, **kwargs):
+    refresh_task_access(user_ids=getattr(instance, '_access_user_ids', []), grant=False)
+
+
+post_save.connect(_task_saved, sender=Task, dispatch_uid='task-access:task')
+m2m_changed.connect(_assignees_changed, sender=Task.assignees.through, dispatch_uid='task-access:assignees')
+m2m_changed.connect(_members_changed, sender=Project.members.through, dispatch_uid='task-access:members')
+m2m_changed.connect(_departments_changed, sender=Project.departments.through, dispatch_uid='task-access:departments')
+post_save.connect(_employee_saved, sender=Employee, dispatch_uid='task-access:employee-save')
+post_delete.connect(_employee_deleted, sender=Employee, dispatch_uid='task-access:employee-delete')
+pre_delete.connect(_department_deleting, sender=Department, dispatch_uid='task-access:department-pre-delete')
+post_delete.connect(_department_deleted, sender=Department, dispatch_uid='task-access:department-delete')
@@ -1,3 +1,353 @@
+import io
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from crm.models import Customer, CustomerStage
+from hr.models import Department, Employee, Plan
+from hr.views import PlanViewSet
+from projects.models import Project
+
+from .models import Task, TaskAccess, TaskComment, TaskFile
+
+
+class TaskAccessTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='access_staff', password='password', role='staff')
+        self.other = User.objects.create_user(username='access_other', password='password', role='staff')
+        self.department = Department.objects.create(name='Access')
+        self.employee = Employee.objects.create(
+            user=self.staff, employee_id='ACC-1', position='Staff', join_date=date(2023, 1, 1), current_salary=0,
+        )
+        self.projects = [Project.objects.create(name=f'Access {index}') for index in range(3)]
+        self.tasks = [Task.objects.create(title=f'Task {index}', project=project)
+                      for index, project in enumerate(self.projects)]
+
+    def visible(self, user):
+        return set(TaskAccess.objects.filter(user=user).values_list('task_id', flat=True))
+
+    def legacy_visible(self, user):
+        return set(Task.objects.filter(
+            Q(assigned_to=user) | Q(assignees=user) | Q(project__members=user)
+            | Q(project__departments__employees__user=user)
+        ).values_list('id', flat=True))
+
+    def assert_visible(self, *tasks):
+        for user in (self.staff, self.other):
+            self.assertEqual(self.visible(user), self.legacy_visible(user))
+        self.assertEqual(self.visible(self.staff), {task.id for task in tasks})
+
+    def test_every_path_grants_and_revokes(self):
+        first, second, third = self.tasks
+        first.assignees.add(self.staff)
+        self.projects[1].members.add(self.staff)
+        self.projects[2].departments.add(self.department)
+        self.assert_visible(first, second)
+
+        self.employee.department = self.department
+        self.employee.save()
+        self.assert_visible(first, second, third)
+
+        # Two paths to the same task: losing one keeps it
+        third.assigned_to = self.staff
+        third.save()
+        self.department.projects.remove(self.projects[2])
+        self.assert_visible(first, second, third)
+
+        self.staff.member_projects.clear()
+        first.assignees.remove(self.staff)
+        third.assigned_to = self.other
+        third.save()
+        self.assert_visible()
+
+    def test_moving_a_task_and_deleting_a_department(self):
+        self.projects[0].departments.add(self.department)
+        self.employee.department = self.department
+        self.employee.save()
+        moved = Task.objects.get(pk=self.tasks[1].pk)
+        moved.project = self.projects[0]
+        moved.save()
+        self.assert_visible(self.tasks[0], moved)
+
+        self.department.delete()
+        self.assert_visible()
+
+    def test_staff_task_list_is_one_join(self):
+        self.projects[0].members.add(self.staff)
+        self.tasks[0].assignees.add(self.staff)
+        self.projects[1].members.add(self.other)
+        client = APIClient()
+        client.force_authenticate(self.staff)
+
+        response = client.get('/api/tasks/')
+
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([row['id'] for row in rows], [self.tasks[0].id])
+
+    def test_rebuild_command(self):
+        self.tasks[0].assignees.add(self.staff)
+        self.projects[1].members.add(self.staff)
+        TaskAccess.objects.all().delete()
+        TaskAccess.objects.create(user=self.other, task=self.tasks[2])
+
+        call_command('rebuild_task_access', stdout=io.StringIO())
+
+        self.assert_visible(self.tasks[0], self.tasks[1])
+        self.assertFalse(TaskAccess.objects.filter(user=self.other).exists())
+
+
+class TaskListQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='list_admin', email='list_admin@example.com', password='password', role='admin',
+        )
+        self.project = Project.objects.create(name='Listing')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_tasks(self, count):
+        for index in range(count):
+            reviewer = User.objects.create_user(username=f'list_reviewer{Task.objects.count()}', password='password')
+            task = Task.objects.create(
+                title=f'Task {index}', project=self.project, assigned_to=reviewer, reviewer=reviewer,
+                assigned_by=self.admin,
+            )
+            task.assignees.add(reviewer, self.admin)
+            for file_type in ('reference', 'reference', 'submission'):
+                TaskFile.objects.create(
+                    task=task, uploaded_by=reviewer, file='task_files/x.png', file_type=file_type,
+                    filename='x.png', file_size=1,
+                )
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.add_tasks(1)
+        baseline, response = self.list_queries()
+        self.add_tasks(15)
+        queries, response = self.list_queries()
+
+        # Count, page and the assignees prefetch
+        self.assertEqual((baseline, queries), (3, 3))
+        rows = response.data['results']
+        self.assertEqual(len(rows), 16)
+        self.assertEqual((rows[0]['resource_count'], rows[0]['upload_count']), (2, 1))
+        self.assertEqual(len(rows[0]['assignee_names']), 2)
+
+    def test_explicit_ordering_falls_back_to_page_numbers(self):
+        now = timezone.now()
+        for days in (3, 1, 2):
+            Task.objects.create(title=f'Due in {days}', project=self.project, due_date=now + timedelta(days=days))
+
+        ordered = self.client.get('/api/tasks/', {'pagination': 'cursor', 'ordering': 'due_date'}).data
+        searched = self.client.get('/api/tasks/', {'pagination': 'cursor', 'search': 'due'}).data
+        keyset = self.client.get('/api/tasks/', {'pagination': 'cursor'}).data
+
+        self.assertEqual([row['title'] for row in ordered['results']], ['Due in 1', 'Due in 2', 'Due in 3'])
+        self.assertEqual((ordered['count'], searched['count'], keyset['count']), (3, 3, None))
+
+
+class TaskCommentTreeTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='thread_admin', email='thread_admin@example.com', password='password', role='admin',
+        )
+        self.task = Task.objects.create(title='Thread', project=Project.objects.create(name='Threads'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_thread(self, text):
+        """A top-level comment with a reply, a reply to it and a sibling reply"""
+        root = TaskComment.objects.create(task=self.task, user=self.admin, comment=text)
+        reply = TaskComment.objects.create(task=self.task, user=self.admin, comment=f'{text}.1', parent=root)
+        TaskComment.objects.create(task=self.task, user=self.admin, comment=f'{text}.1.1', parent=reply)
+        TaskComment.objects.create(task=self.task, user=self.admin, comment=f'{text}.2', parent=root)
+        return root
+
+    def detail_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/tasks/{self.task.id}/')
+        return len(queries), response.data['comments']
+
+    def test_detail_thread_costs_the_same_however_long(self):
+        self.add_thread('a')
+        baseline, _ = self.detail_queries()
+        for text in 'bcdefgh':
+            self.add_thread(text)
+        queries, comments = self.detail_queries()
+
+        self.assertEqual(queries, baseline)
+        self.assertEqual(len(comments), 8)
+        first = comments[0]
+        self.assertEqual([reply['comment'] for reply in first['replies']], ['a.1', 'a.2'])
+        self.assertEqual(first['replies'][0]['replies'][0]['comment'], 'a.1.1')
+        self.assertEqual((first['reply_count'], first['replies'][1]['reply_count']), (2, 0))
+
+    def test_comments_action_nests_to_the_requested_depth(self):
+        roots = [self.add_thread(text) for text in 'abc']
+        url = f'/api/tasks/{self.task.id}/comments/'
+
+        # Task, page and one query for the single loaded reply level
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'pagination': 'cursor', 'page_size': 2, 'depth': 1})
+        results = response.data['results']
+        self.assertEqual([comment['id'] for comment in results], [roots[0].id, roots[1].id])
+        reply = results[0]['replies'][0]
+        self.assertEqual((reply['comment'], reply['replies'], reply['reply_count']), ('a.1', [], 1))
+        following = self.client.get(response.data['next']).data['results']
+        self.assertEqual([comment['id'] for comment in following], [roots[2].id])
+
+        deeper = self.client.get(url, {'parent': reply['id'], 'depth': 0}).data
+        self.assertEqual([comment['comment'] for comment in deeper['results']], ['a.1.1'])
+        self.assertEqual(deeper['count'], 1)
+        self.assertEqual(self.client.get(url, {'depth': 'x'}).status_code, 400)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='search_staff', password='password', role='staff')
+        project = Project.objects.create(name='Brochure redesign', client_name='Acme Printing')
+        project.members.add(self.staff)
+        self.visible = Task.objects.create(title='Cover layout', description='Brochure cover', project=project)
+        self.titled = Task.objects.create(title='Brochure back page', project=project)
+        hidden_project = Project.objects.create(name='Hidden')
+        Task.objects.create(title='Brochure for someone else', project=hidden_project)
+        stage = CustomerStage.objects.create(name='Lead')
+        self.customer = Customer.objects.create(
+            company_name='Acme Printing', contact_person='Lan', email='lan@acme.vn', current_stage=stage,
+            assigned_to=self.staff,
+        )
+        Customer.objects.create(company_name='Acme Brochure Co', current_stage=stage)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_task_list_search(self):
+        response = self.client.get('/api/tasks/', {'search': 'brochure'})
+
+        ids = [row['id'] for row in response.data['results']]
+        self.assertEqual(sorted(ids), sorted([self.visible.id, self.titled.id]))
+        self.assertEqual(self.client.get('/api/tasks/', {'search': '%'}).data['count'], 0)
+
+    def test_unified_search_respects_visibility(self):
+        response = self.client.get('/api/search/', {'q': 'Brochure'})
+
+        results = response.data['results']
+        self.assertEqual({row['id'] for row in results['task']}, {self.visible.id, self.titled.id})
+        self.assertEqual([row['title'] for row in results['project']], ['Brochure redesign'])
+        # Staff only see customers assigned to them
+        self.assertEqual(results['customer'], [])
+        acme = self.client.get('/api/search/', {'q': 'acme', 'types': 'project,customer'}).data['results']
+        self.assertEqual([row['subtitle'] for row in acme['project']], ['Acme Printing'])
+        self.assertEqual([row['id'] for row in acme['customer']], [self.customer.id])
+        by_email = self.client.get('/api/search/', {'q': 'acme.vn', 'types': 'customer'}).data['results']
+        self.assertEqual([row['subtitle'] for row in by_email['customer']], ['Lan'])
+
+    def test_plans_are_found_by_owner_username_fragment(self):
+        Plan.objects.create(
+            user=self.staff, plan_type='monthly', title='Quarter goals',
+            period_start=date(2024, 1, 1), period_end=date(2024, 1, 31),
+        )
+
+        response = self.client.get('/api/search/', {'q': 'arch_sta', 'types': 'plan'})
+
+        self.assertEqual([row['title'] for row in response.data['results']['plan']], ['Quarter goals'])
+
+    def test_joined_contains_fields_do_not_defeat_the_search_index(self):
+        postgres = PostgresDatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': 'django.db.backends.postgresql'}, alias='search-tests'
+        )
+        with mock.patch('config.search.connection', postgres):
+            plans = PlanViewSet.search_document.search(Plan.objects.all(), 'goals')
+        sql, _params = plans.query.get_compiler(connection=postgres).as_sql()
+
+        # The user table is only joined inside the UNION, never OR-ed into the outer scan
+        outer, matching = sql.split(' WHERE ', 1)
+        self.assertNotIn('accounts_user', outer)
+        self.assertTrue(matching.startswith('"hr_plan"."id" IN ((SELECT'))
+        self.assertIn(' UNION ', matching)
+
+    def test_unified_search_parameters(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'types': 'task,invoice'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'limit': 'all'}).status_code, 400)
+        freelancer = User.objects.create_user(username='search_freelancer', password='password', role='freelancer')
+        self.client.force_authenticate(freelancer)
+        # Freelancers may not list projects at all
+        response = self.client.get('/api/search/', {'q': 'Brochure', 'limit': 1})
+        self.assertNotIn('project', response.data['results'])
+        self.assertEqual(response.data['results']['task'], [])
+
+
+class TaskBoardTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='board_admin', email='board_admin@example.com', password='password', role='admin',
+        )
+        self.freelancer = User.objects.create_user(username='board_freelancer', password='password', role='freelancer')
+        self.project = Project.objects.create(name='Board')
+        self.working = [self.add_task('working') for _ in range(5)]
+        self.add_task('new')
+        self.add_task('completed')
+        Task.objects.create(title='Elsewhere', status='working', project=Project.objects.create(name='Other'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_task(self, task_status):
+        task = Task.objects.create(title=f'{task_status} card', status=task_status, project=self.project)
+        task.assignees.add(self.admin, self.freelancer)
+        return task
+
+    def test_board_columns_and_column_cursor(self):
+        # The project filter's lookup, counts, cards and the assignees prefetch
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/tasks/board/', {'project': self.project.id, 'limit': 2})
+
+        self.assertEqual(response.data['total'], 7)
+        columns = {column['status']: column for column in response.data['columns']}
+        self.assertEqual(list(columns), [status for status, _ in Task.STATUS_CHOICES])
+        working = columns['working']
+        self.assertEqual(working['count'], 5)
+        self.assertEqual([card['id'] for card in working['results']], [task.id for task in self.working[:-3:-1]])
+        self.assertEqual(
+            {assignee['username'] for assignee in working['results'][0]['assignee_names']},
+            {self.admin.username, self.freelancer.username},
+        )
+        self.assertEqual((columns['new']['count'], columns['new']['next']), (1, None))
+        self.assertEqual(columns['review_pending']['results'], [])
+
+        following = self.client.get(working['next']).data
+        self.assertEqual([card['id'] for card in following['results']], [task.id for task in self.working[2::-1][:2]])
+        last = self.client.get(following['next']).data
+        self.assertEqual(([card['id'] for card in last['results']], last['next']), ([self.working[0].id], None))
+
+    def test_board_follows_visibility(self):
+        self.client.force_authenticate(self.freelancer)
+
+        # The assignees join repeats every task once per assignee
+        columns = {column['status']: column for column in self.client.get('/api/tasks/board/').data['columns']}
+
+        self.assertEqual((columns['working']['count'], len(columns['working']['results'])), (5, 5))
+        self.assertEqual(self.client.get('/api/tasks/board/', {'limit': 'all'}).status_code, 400)
+
+    def test_project_statistics_counts_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/projects/{self.project.id}/statistics/')
 
-# Create your tests here.
+        self.assertEqual(response.data['tasks_by_status']['working'], 5)
+        self.assertEqual(response.data['total_tasks'], 7)
+        self.assertAlmostEqual(response.data['completion_rate'], 100 / 7)
+        # Project, status counts, topics and design rules
+        self.assertLessEqual(len(queries), 4)
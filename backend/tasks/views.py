@@ -5,11 +5,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django.utils import timezone
-from django.db.models import Sum, DecimalField, Value
+from django.contrib.auth import get_user_model
+from django.db.models import Count, DecimalField, Prefetch, Q, Sum, Value
 from django.db.models.functions import Coalesce
+from django.urls import reverse
 
+from .board import BOARD_ORDERING, board_cards, status_counts
+from .comments import COMMENT_ORDERING, comments_with_reply_counts, load_replies
 from .models import Task, TaskFile, TaskComment, TaskChangeHistory
 from .serializers import (
     TaskListSerializer,
@@ -22,6 +26,8 @@ from .serializers import (
     TaskCommentSerializer,
     TaskChangeHistorySerializer,
 )
+from config.pagination import CursorPaginationMixin, KeysetPagination
+from config.search import FullTextSearchFilter, SearchDocument
 from accounts.permissions import IsManagerOrAdmin, IsOwnerOrManagerOrAdmin, CanCreateTask
 from notifications.services import (
     create_task_assigned_notification,
@@ -31,7 +37,7 @@ from notifications.services import (
 from reviews.models import TaskReview, ReviewCriteria
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for Task CRUD operations
 
@@ -39,11 +45,20 @@ class TaskViewSet(viewsets.ModelViewSet):
     Managers and Admins see all tasks
     """
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['project', 'topic', 'status', 'priority', 'assigned_to']
-    search_fields = ['title', 'description']
+    search_document = SearchDocument({'title': 'A', 'description': 'B'})
     ordering_fields = ['created_at', 'due_date', 'priority', 'price']
     ordering = ['-created_at']
+    cursor_pagination = {
+        'list': BOARD_ORDERING,
+        'change_history': ('-changed_at', '-id'),
+        'comments': COMMENT_ORDERING,
+    }
+    comment_reply_depth = 2
+    comment_max_reply_depth = 10
+    board_column_size = 10
+    board_max_column_size = 50
 
     REVIEWER_ROLES = {'admin', 'manager', 'team_lead', 'staff'}
     FREELANCER_ALLOWED_STATUS_TRANSITIONS = {
@@ -143,29 +158,39 @@ class TaskViewSet(viewsets.ModelViewSet):
         - Team Lead: see all tasks (can assign & review)
         - Manager & Admin: see all tasks (full access)
         """
-        from django.db.models import Q
         user = self.request.user
 
         if user.role == 'freelancer':
-            return Task.objects.filter(
+            queryset = Task.objects.filter(
                 Q(assigned_to=user) | Q(assignees=user)
             ).distinct()
         elif user.role == 'staff':
             # Staff see tasks in projects they're a member of, or tasks directly assigned to them,
-            # or tasks in projects linked to their department
-            return Task.objects.filter(
-                Q(assigned_to=user) |
-                Q(assignees=user) |
-                Q(project__members=user) |
-                Q(project__departments__employees__user=user)
-            ).distinct()
+            # or tasks in projects linked to their department (materialised in TaskAccess)
+            queryset = Task.objects.filter(access__user=user)
         elif user.role in ['team_lead', 'manager', 'admin'] or user.is_superuser:
             # Team Lead, Manager and Admin see all tasks
-            return Task.objects.all()
+            queryset = Task.objects.all()
         else:
             # Default: no tasks
             return Task.objects.none()
 
+        if self.action == 'list':
+            return self._list_queryset(queryset)
+        return queryset
+
+    def _list_queryset(self, queryset):
+        """Everything TaskListSerializer reads, in a fixed number of queries per page"""
+        return queryset.select_related(
+            'project', 'topic', 'assigned_to', 'assigned_by', 'reviewer', 'project_stage'
+        ).annotate(
+            # distinct: the freelancer filter joins assignees, which would repeat file rows
+            resource_count=Count('files', filter=Q(files__file_type='reference'), distinct=True),
+            upload_count=Count('files', filter=~Q(files__file_type='reference'), distinct=True),
+        ).prefetch_related(
+            Prefetch('assignees', queryset=get_user_model().objects.only('id', 'username', 'first_name', 'last_name'))
+        )
+
     def get_serializer_class(self):
         if self.action == 'list':
             return TaskListSerializer
@@ -285,9 +310,76 @@ class TaskViewSet(viewsets.ModelViewSet):
         """Get full change history for this task"""
         task = self.get_object()
         history = task.change_history.select_related('changed_by').all()
+        if self.uses_cursor_pagination():
+            page = self.paginate_queryset(history)
+            return self.get_paginated_response(TaskChangeHistorySerializer(page, many=True).data)
         serializer = TaskChangeHistorySerializer(history, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        """
+        Paginated comment thread of this task
+        Query params: parent (comment id, default: top-level comments), depth (reply
+        levels nested under each comment, default 2; deeper replies only report reply_count)
+        """
+        task = self.get_object()
+        try:
+            depth = int(request.query_params.get('depth', self.comment_reply_depth))
+            parent_id = request.query_params.get('parent')
+            parent_id = int(parent_id) if parent_id else None
+        except ValueError:
+            return Response(
+                {'error': 'parent and depth must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        depth = min(max(depth, 0), self.comment_max_reply_depth)
+
+        comments = comments_with_reply_counts(task.comments.filter(parent_id=parent_id)).order_by(*COMMENT_ORDERING)
+        page = self.paginate_queryset(comments)
+        load_replies(page, depth)
+        return self.get_paginated_response(TaskCommentSerializer(page, many=True, context={'request': request}).data)
+
+    @action(detail=False, methods=['get'])
+    def board(self, request):
+        """
+        Kanban board of the visible tasks: per-status counts and the first cards of every column
+        Query params: the list filters (project, topic, priority, assigned_to, search) and
+        limit (cards per column, default 10). A column's next link loads its following
+        cards from the task list.
+        """
+        try:
+            limit = int(request.query_params.get('limit', self.board_column_size))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), self.board_max_column_size)
+
+        tasks = self.filter_queryset(self.get_queryset())
+        counts = status_counts(tasks)
+        cards = board_cards(tasks, limit, prepare=self._list_queryset)
+
+        params = request.query_params.copy()
+        params.pop('limit', None)
+        params['page_size'] = limit
+        paginator = KeysetPagination(BOARD_ORDERING)
+        labels = dict(Task.STATUS_CHOICES)
+        columns = []
+        for task_status, column in cards.items():
+            next_link = None
+            if counts.get(task_status, 0) > len(column):
+                params['status'] = task_status
+                paginator.base_url = f"{request.build_absolute_uri(reverse('task-list'))}?{params.urlencode()}"
+                next_link = paginator.encode_cursor(paginator.position(column[-1]), reverse=False)
+            columns.append({
+                'status': task_status,
+                'label': labels.get(task_status, task_status),
+                'count': counts.get(task_status, 0),
+                'next': next_link,
+                'results': TaskListSerializer(column, many=True, context=self.get_serializer_context()).data,
+            })
+
+        return Response({'total': sum(counts.values()), 'columns': columns})
+
     @action(detail=True, methods=['post'], permission_classes=[IsManagerOrAdmin])
     def assign_reviewer(self, request, pk=None):
         """Assign reviewer to task (or clear reviewer with null)."""
@@ -542,7 +634,7 @@ class TaskFileViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError("You can only delete your own files.")
 
 
-class TaskCommentViewSet(viewsets.ModelViewSet):
+class TaskCommentViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for TaskComment operations
     Users can only access comments for tasks they have access to
@@ -554,6 +646,7 @@ class TaskCommentViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['task', 'user', 'parent', 'design_rule', 'is_passed']
     ordering = ['created_at']
+    cursor_pagination = {'list': ('created_at', 'id')}
 
     def get_queryset(self):
         """Filter comments based on task access"""